@@ -1,406 +1,4495 @@
 import random
 import string
-import uuid
-import argparse
-import hashlib
 import os
-import tempfile
+import sys
 import configparser
-import re
+import itertools
+import array
+import collections
 import math  # 导入 math 模块
-# import ast  # 移除 ast 导入
+# hashlib / uuid / argparse / concurrent.futures / locale 在用到时才导入, 以缩短启动时间
 
 
 # --- 配置文件读取和处理 ---
+# 配置在首次使用时才读取, 导入本模块不会读写任何文件。
+# RandGen.ini 始终是唯一的数据来源; 旁边的 RandGen.ini.cache (marshal 格式, 无需导入其他模块) 是它的编译缓存:
+# 各节的内容 (cc 字符集去重后按序号引用) 和 re 配置中表达式、/正则/ 的解析结果。缓存以 INI 的 mtime、大小和内容哈希为键,
+# mtime 和大小一致时只读缓存这一个文件, 不再解析 INI 和表达式; 不一致时读取 INI, 内容哈希仍一致则只更新键, 否则重建。
+# 缓存只由命令行 (load_config(write_cache=True)) 和 edit_config 写入, 写入失败时忽略; 作为库读取配置时只读不写。
+# 修改配置通过 edit_config 进行: 在文件锁内重新读取最新内容, 一次修改只写一次文件, 先写临时文件再原子替换。
+
 config_file = 'RandGen.ini'
-config = configparser.ConfigParser(interpolation=None)  # 禁用插值
+DEFAULT_SETTINGS = {'min_length': '1', 'max_length': '32767'}
+CONFIG_CACHE_VERSION = 2
+_config = None
+_config_expressions = {}  # 配置缓存中预先解析的表达式: 表达式 -> parse_expression 的结果
+_config_regexes = {}  # 配置缓存中预先解析的正则: 正则 (不含两侧的 /) -> _RegexParser 的语法树
+
+def _config_cache_path(path):
+    return path + '.cache'
+
+def _config_from_sections(sections, path):
+    """由 {节: {键: 值}} 建立 ConfigParser"""
+    config = configparser.ConfigParser(interpolation=None)  # 禁用插值
+    config.read_dict(sections, source=path)
+    return config
+
+def _config_sections(config):
+    return {section: dict(config.items(section, raw=True)) for section in config.sections()}
+
+def _config_encoding():
+    import locale
+    return locale.getpreferredencoding(False)  # 与文本模式 open() 的默认编码一致
+
+def _build_config_cache(sections, stat, digest):
+    """由各节的内容建立缓存: cc 字符集去重, re 表达式和正则预先解析 (解析失败的留到编译时报错)"""
+    import marshal
+    charsets, charset_index, expressions, regexes = [], {}, {}, {}
+    cached = {}
+    for section, options in sections.items():
+        options = dict(options)
+        value = options.get('value')
+        if value is not None and options.get('type') == 'cc':
+            if value not in charset_index:
+                charset_index[value] = len(charsets)
+                charsets.append(value)
+            options['value'] = charset_index[value]
+        elif value is not None and options.get('type') == 're' and value.startswith('[') and value.endswith(']'):
+            try:
+                expressions[value] = parse_expression(value)
+            except (SyntaxError, ValueError):
+                pass
+        elif value is not None and options.get('type') == 're' and _is_regex(value):
+            try:
+                regexes[value[1:-1]] = _RegexParser(value[1:-1]).parse()
+            except ValueError:
+                pass
+        cached[section] = options
+    return {
+        'version': (CONFIG_CACHE_VERSION, marshal.version), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'hash': digest,
+        'charsets': charsets, 'sections': cached, 'expressions': expressions, 'regexes': regexes,
+    }
+
+def _load_config_cache(path):
+    import marshal
+    try:
+        with open(_config_cache_path(path), 'rb') as file:
+            cache = marshal.loads(file.read())
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
+    if not isinstance(cache, dict) or cache.get('version') != (CONFIG_CACHE_VERSION, marshal.version):
+        return None
+    return cache
+
+def _save_config_cache(path, cache):
+    """原子地写入缓存; 缓存只是加速, 写入失败 (如只读目录) 时忽略"""
+    import marshal
+    temp = f"{_config_cache_path(path)}.{os.getpid()}.tmp"
+    try:
+        with open(temp, 'wb') as file:
+            file.write(marshal.dumps(cache))
+        os.replace(temp, _config_cache_path(path))
+    except OSError:
+        try:
+            os.unlink(temp)
+        except OSError:
+            pass
+
+def _apply_config_cache(cache):
+    """由缓存还原各节的内容, 并登记预先解析的表达式"""
+    global _config_expressions, _config_regexes
+    charsets = cache['charsets']
+    sections = {}
+    for section, options in cache['sections'].items():
+        if isinstance(options.get('value'), int):
+            options['value'] = charsets[options['value']]
+        sections[section] = options
+    _config_expressions = cache['expressions']
+    _config_regexes = cache['regexes']
+    return sections
+
+def _read_config(path, write_cache=False):
+    """读取配置文件 (必须存在), 优先使用编译缓存; write_cache 为 True 时在缓存未命中后更新缓存"""
+    stat = os.stat(path)
+    cache = _load_config_cache(path)
+    if cache is not None and (cache['mtime_ns'], cache['size']) == (stat.st_mtime_ns, stat.st_size):
+        return _config_from_sections(_apply_config_cache(cache), path)
+    import hashlib  # 只在缓存未命中时才需要, 导入 hashlib 本身就要几毫秒
+    with open(path, 'rb') as file:
+        data = file.read()
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    if cache is not None and cache['hash'] == digest:
+        cache['mtime_ns'], cache['size'] = stat.st_mtime_ns, stat.st_size  # 内容未变, 只是被 touch 过
+        if write_cache:
+            _save_config_cache(path, cache)
+        return _config_from_sections(_apply_config_cache(cache), path)
+    config = configparser.ConfigParser(interpolation=None)  # 禁用插值
+    config.read_string(data.decode(_config_encoding()), source=path)
+    if write_cache:
+        _save_config_cache(path, _build_config_cache(_config_sections(config), stat, digest))
+    return config
+
+def _write_config(config, path):
+    """把配置原子地写入 path (先写临时文件并 fsync, 再替换) 并同时更新缓存; 调用方持有配置锁"""
+    import hashlib
+    import io
+    text = io.StringIO()
+    config.write(text)
+    data = text.getvalue().encode(_config_encoding())
+    temp = path + '.tmp'
+    with open(temp, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp, path)
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    _save_config_cache(path, _build_config_cache(_config_sections(config), os.stat(path), digest))
+
+def _default_config():
+    config = configparser.ConfigParser(interpolation=None)  # 禁用插值
+    config['Settings'] = DEFAULT_SETTINGS
+    return config
+
+def load_config(path=None, create=False, write_cache=False):
+    """
+    读取配置文件并设为当前配置。
+    文件不存在时使用默认配置; create 为 True 时同时把默认配置写入文件,
+    write_cache 为 True 时更新 <配置文件>.cache (这两项都是命令行行为)。
+    """
+    global _config, config_file
+    if path is not None:
+        config_file = path
+    with profile_stage('config'):
+        if os.path.exists(config_file):
+            config = _read_config(config_file, write_cache)
+        elif create:
+            with edit_config() as config:
+                pass
+        else:
+            config = _default_config()
+    _config = config
+    return config
+
+def get_config():
+    """返回当前配置, 首次调用时读取配置文件"""
+    if _config is None:
+        load_config()
+    return _config
+
+class edit_config:
+    """
+    修改配置文件:
+        with edit_config() as config:
+            config['myconfig'] = {'type': 're', 'value': "[an(10)]"}
+    进入时加锁 (<配置文件>.lock) 并重新读取文件, 保证并发的进程不会丢失彼此的修改;
+    退出时如有修改 (或文件不存在) 则原子地写回一次并更新缓存, 出现异常时不写入。写入后成为当前配置。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or config_file
+        self.config = None
+        self._lock = None
+        self._before = None
+
+    def __enter__(self):
+        self._lock = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            _lock_file(self._lock)
+            self.config = _read_config(self.path, write_cache=True) if os.path.exists(self.path) else None
+        except BaseException:
+            os.close(self._lock)
+            raise
+        if self.config is None:
+            self.config = _default_config()
+        else:
+            self._before = _config_sections(self.config)
+        return self.config
+
+    def __exit__(self, exc_type, exc, tb):
+        global _config
+        try:
+            if exc_type is None and _config_sections(self.config) != self._before:
+                _write_config(self.config, self.path)
+        finally:
+            _unlock_file(self._lock)
+            os.close(self._lock)
+        if exc_type is None and os.path.abspath(self.path) == os.path.abspath(config_file):
+            _config = self.config
+
+def save_config():
+    """把当前配置整体写回配置文件 (加锁、原子替换)"""
+    sections = _config_sections(get_config())
+    with edit_config() as config:
+        for section in config.sections():
+            config.remove_section(section)
+        config.read_dict(sections)
+
+def get_config_value(section, key, default_value, config=None):
+    """获取配置值，根据 key 决定是否转换为整数"""
+    if config is None:
+        config = get_config()
+    try:
+        value = config.get(section, key)
+        if key in ('min_length', 'max_length'):
+            return int(value)  # 将字符串转换为整数
+        return value  # 已禁用插值, % 原样保留
+    except (configparser.NoSectionError, configparser.NoOptionError, ValueError):
+        return default_value
+
+
+def set_config_value(section, key, value):
+    """设置配置值，如果 section 不存在则创建; 需要同时修改多个值时使用 edit_config, 只写一次文件"""
+    with edit_config() as config:
+        if not config.has_section(section):
+            config.add_section(section)
+        config.set(section, key, str(value))
+
+
+def apply_operation(value, operation, operand):
+    try:
+        operand = int(operand)
+        if operation == '+':
+            return value + operand
+        elif operation == '-':
+            return value - operand
+        elif operation == '*':
+            return value * operand
+        elif operation == '/':
+            if operand == 0:
+                raise ValueError("Cannot divide by zero.")
+            return value // operand  # 长度是整数
+        else:
+            raise ValueError("Unsupported operation.")
+    except ValueError:
+        print(f"Error applying operation {operation} with operand {operand}.")
+        return value
+
+# --- 性能剖析 ---
+# --profile / --stats 打开剖析时 _profiler 为一个 Profiler 实例, 否则为 None。
+# 插桩点都在批次 (或一次性阶段) 的粒度上, 关闭时每批只多一次 `_profiler is not None` 判断,
+# 不影响生成速度。各阶段的计时可以嵌套 (例如 generate 包含各片段 part 的时间), 不能直接相加。
+
+_profiler = None
+_NO_PROFILE = None  # 关闭剖析时 profile_stage 返回的空上下文管理器
+
+class Profiler:
+    """记录各阶段的耗时 (秒, 调用次数) 和计数器, 可从多个线程调用"""
+
+    def __init__(self):
+        import threading
+        import time
+        self.clock = time.perf_counter
+        self.started = self.clock()
+        self.timings = {}  # 阶段 -> [秒, 次数]
+        self.counters = collections.Counter()
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, calls=1):
+        with self._lock:
+            timing = self.timings.setdefault(stage, [0.0, 0])
+            timing[0] += seconds
+            timing[1] += calls
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def stage(self, name):
+        import contextlib
+
+        @contextlib.contextmanager
+        def timed():
+            start = self.clock()
+            try:
+                yield
+            finally:
+                self.add(name, self.clock() - start)
+        return timed()
+
+    def timed_batches(self, name, batches, allocations=False):
+        """
+        包装批次迭代器, 把取下一批的时间记入 name。
+        allocations 为 True 时用 sys.getallocatedblocks 统计每批新增 (生成后仍存活) 的内存块数。
+        """
+        clock = self.clock
+        batches = iter(batches)
+        while True:
+            blocks = sys.getallocatedblocks() if allocations else 0
+            start = clock()
+            try:
+                batch = next(batches)
+            except StopIteration:
+                self.add(name, clock() - start, 0)
+                return
+            self.add(name, clock() - start)
+            if allocations:
+                self.count('allocated_blocks', max(0, sys.getallocatedblocks() - blocks))
+            yield batch
+
+    def report(self):
+        """返回可序列化为 JSON 的结果"""
+        wall = self.clock() - self.started
+        counters = dict(self.counters)
+        strings = counters.get('strings', 0)
+        report = {
+            'wall_seconds': wall,
+            'stages': {name: {'seconds': seconds, 'calls': calls, 'share': seconds / wall if wall else 0.0}
+                       for name, (seconds, calls) in self.timings.items()},
+            'counters': counters,
+        }
+        if strings:
+            per_string = {name: value / strings for name, value in counters.items() if name != 'strings'}
+            per_string['nanoseconds'] = wall * 1e9 / strings
+            report['per_string'] = per_string
+        return report
+
+    def format(self):
+        """人类可读的结果, 用于输出到 stderr"""
+        report = self.report()
+        lines = [f"剖析结果 (总耗时 {report['wall_seconds']:.3f} 秒):"]
+        for name, timing in sorted(report['stages'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append(f"  {name:<40} {timing['seconds']:>10.4f} 秒 {timing['share']:>7.1%} {timing['calls']:>10} 次")
+        for name, value in sorted(report['counters'].items()):
+            per = report.get('per_string', {}).get(name)
+            per_text = f"  (每个字符串 {per:.2f})" if per is not None else ""
+            lines.append(f"  {name:<40} {value:>14,}{per_text}")
+        return "\n".join(lines)
+
+class CountingRandom(random.Random):
+    """
+    剖析时包装 rng, 统计消耗的随机字节数 (random() 按 8 字节计)。
+    random.Random 的其他方法 (randint、choices 等) 都经由这里的三个方法取随机数, 因此同样被统计。
+    """
+
+    def __init__(self, wrapped, profiler):
+        self.wrapped = wrapped
+        self.profiler = profiler
+        super().__init__()
+
+    def random(self):
+        self.profiler.count('rng_bytes', 8)
+        return self.wrapped.random()
+
+    def getrandbits(self, k):
+        self.profiler.count('rng_bytes', (k + 7) // 8)
+        return self.wrapped.getrandbits(k)
+
+    def randbytes(self, n):
+        self.profiler.count('rng_bytes', n)
+        return self.wrapped.randbytes(n)
+
+def enable_profiling():
+    """打开剖析并返回新的 Profiler"""
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+def disable_profiling():
+    """关闭剖析, 返回之前的 Profiler (可能为 None)"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+def profile_stage(name):
+    """剖析打开时计时的上下文管理器, 关闭时返回一个空上下文管理器"""
+    global _NO_PROFILE
+    if _profiler is not None:
+        return _profiler.stage(name)
+    if _NO_PROFILE is None:
+        import contextlib
+        _NO_PROFILE = contextlib.nullcontext()
+    return _NO_PROFILE
+
+def _profiled_rng(rng):
+    return rng if _profiler is None else CountingRandom(rng, _profiler)
+
+# --- 批量字符采样 ---
+
+_numpy = None
+
+def _get_numpy():
+    """按需导入 NumPy, 未安装时返回 None"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+RANDOM_CHUNK_SIZE = 1 << 20  # 单次 rng.randbytes 的最大字节数; 超长字符串分块抽取, 避免超出 C int 的范围
+
+def _randbytes(rng, n):
+    """抽取 n 个随机字节, 每次调用 rng.randbytes 最多 RANDOM_CHUNK_SIZE 字节"""
+    if n <= RANDOM_CHUNK_SIZE:
+        return rng.randbytes(n)
+    return b"".join(rng.randbytes(min(RANDOM_CHUNK_SIZE, n - i)) for i in range(0, n, RANDOM_CHUNK_SIZE))
+
+class IndexSampler:
+    """
+    批量均匀下标采样: 返回 [0, size) 中的 n 个无偏随机下标。
+    以大块随机字节 (rng.randbytes) 为输入, 用拒绝采样去掉超出 size 整数倍的取值;
+    size 不超过 256 时每个下标消耗 1 字节, 结果为 bytes, 否则消耗 2 字节 (小端序), 结果为整数序列;
+    size 超过 65536 时 2 字节不够用, 改为逐个调用 rng.randrange。
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.unit = 1 if size <= 256 else 2
+        self.span = 1 << (8 * self.unit)
+        self.limit = self.span - self.span % size if size else 0  # 只接受 [0, limit) 的取值
+        if self.unit == 1 and size:
+            # 字节 -> 下标; 被拒绝的字节在 translate 时删除
+            self.index_table = bytes(b % size for b in range(self.limit)) + bytes(256 - self.limit)
+            self.reject = bytes(range(self.limit, 256))
+
+    def _random_bytes(self, n, rng):
+        """
+        按拒绝率估算并抽取足够产生 n 个被接受取值的随机字节;
+        每次最多 RANDOM_CHUNK_SIZE 字节, 不足部分由 _accepted 循环继续抽取
+        """
+        return rng.randbytes(min(int(n * self.span / self.limit * 1.02) + 16, RANDOM_CHUNK_SIZE // self.unit)
+                             * self.unit)
+
+    def _accepted(self, n, rng, table):
+        """抽取 n 个被接受的取值; 1 字节时经 table 映射后拼接为 bytes, 2 字节时为下标列表"""
+        np = _get_numpy()
+        chunks = []
+        have = 0
+        while have < n:
+            raw = self._random_bytes(n - have, rng)
+            if self.unit == 1:
+                chunk = raw.translate(table, self.reject)
+            elif np is not None:
+                chunk = np.frombuffer(raw, dtype='<u2')
+                chunk = chunk[chunk < self.limit] % self.size
+            else:
+                values = array.array('H', raw)
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                limit, size = self.limit, self.size
+                chunk = [v % size for v in values if v < limit]
+            chunks.append(chunk)
+            have += len(chunk)
+        if self.unit == 1:
+            return b"".join(chunks)[:n]
+        if np is not None:
+            return np.concatenate(chunks)[:n]
+        return list(itertools.islice(itertools.chain.from_iterable(chunks), n))
+
+    def draw_indices(self, n, rng=random):
+        """返回 n 个随机下标 (size <= 256 时为 bytes)"""
+        if n <= 0 or not self.size:
+            return b'' if self.unit == 1 else []
+        if self.size > 65536:
+            randrange, size = rng.randrange, self.size
+            return [randrange(size) for _ in range(n)]
+        return self._accepted(n, rng, self.index_table if self.unit == 1 else None)
+
+_SAMPLER_CACHE_SIZE = 256
+_sampler_cache = {}
+
+def cached_sampler(cls, *args):
+    """
+    按 (类, 参数) 复用采样器: 转换表、别名表等只建立一次。
+    采样器建立后只读 (惰性建立的 NumPy 表是幂等的), 可以在计划、任务和线程之间共享。
+    """
+    key = (cls,) + args
+    sampler = _sampler_cache.get(key)
+    if sampler is None:
+        sampler = cls(*args)
+        if len(_sampler_cache) >= _SAMPLER_CACHE_SIZE:
+            _sampler_cache.clear()
+        _sampler_cache[key] = sampler
+    return sampler
+
+class CharsetSampler(IndexSampler):
+    """
+    批量字符采样引擎。
+    在 IndexSampler 的基础上把下标映射为字符: ASCII 字符集直接经转换表把随机字节映射为字符,
+    因此字符集大小不是 2 的幂时结果依然无偏。
+    安装了 NumPy 时, 非 ASCII 字符集改用向量化映射, 输出与纯 Python 实现完全一致。
+    """
+
+    def __init__(self, charset):
+        super().__init__(len(charset))
+        self.charset = charset
+        self.is_ascii = charset.isascii()
+        self._codes = None
+        if self.unit == 1 and self.size:
+            if self.is_ascii:
+                codes = charset.encode('ascii')
+                self.table = bytes(codes[b % self.size] for b in range(self.limit)) + bytes(256 - self.limit)
+            self.char_table = dict(enumerate(charset))
+
+    def _codepoints(self, np):
+        if self._codes is None:
+            self._codes = np.array([ord(c) for c in self.charset], dtype='<u4')
+        return self._codes
+
+    def draw(self, n, rng=random):
+        """返回由 n 个随机字符组成的字符串"""
+        if n <= 0 or not self.size:
+            return ''
+        if self.size > 65536:
+            return "".join(rng.choices(self.charset, k=n))
+        if self.unit == 1 and self.is_ascii:
+            return self._accepted(n, rng, self.table).decode('ascii')
+        return _indices_to_str(self.draw_indices(n, rng), self)
+
+def _indices_to_str(indices, sampler):
+    """把下标序列映射为 sampler.charset 中的字符"""
+    np = _get_numpy()
+    if np is not None:
+        if isinstance(indices, bytes):
+            indices = np.frombuffer(indices, dtype=np.uint8)
+        return sampler._codepoints(np)[indices].tobytes().decode('utf-32-le')
+    if isinstance(indices, bytes):
+        return indices.decode('latin-1').translate(sampler.char_table)
+    charset = sampler.charset
+    return "".join([charset[i] for i in indices])
+
+# --- 不重复采样 ---
+# NoRepeatSampler 在构造时把字符集去重并建立下标, 之后每次调用批量生成多个不重复字符的字符串,
+# 按 长度 / 字符数 的比例为每个字符串选择策略:
+#   1. 整串无重复的概率不低于 1/2 时 (长度远小于字符数), 与普通模式一样整批生成字符, 丢弃含重复字符的串后补足;
+#   2. 长度不超过字符数一半时逐个字符拒绝采样 (批量抽取下标, 用按字符串复位的标记数组判重,
+#      期望抽取次数不超过 1.39 * 长度);
+#   3. 否则在整个调用复用的下标缓冲区上做部分 Fisher–Yates 洗牌。
+# 三种策略都给出所有不重复排列上的均匀分布。下标拼接后一次映射为字符,
+# 因此任意码点 (CJK、emoji 等) 的字符集都按字符而不是按字节处理。
+
+NO_REPEAT_WHOLE_ACCEPT = 0.5  # 整串无重复的概率不低于该值时使用策略 1
+NO_REPEAT_REJECTION_RATIO = 0.5  # 长度 / 字符数不超过该比例时使用策略 2
+
+class NoRepeatSampler(CharsetSampler):
+    """不重复字符的批量采样, charset 中的重复字符只计一次"""
+
+    def __init__(self, charset):
+        super().__init__("".join(dict.fromkeys(charset)))
+        self._whole = {}  # 长度 -> 是否使用策略 1
+
+    def _use_whole(self, k):
+        if k not in self._whole:
+            accept = 1.0
+            for j in range(k):
+                accept *= 1 - j / self.size
+                if accept < NO_REPEAT_WHOLE_ACCEPT:
+                    break
+            self._whole[k] = accept >= NO_REPEAT_WHOLE_ACCEPT
+        return self._whole[k]
+
+    @staticmethod
+    def _words(n, rng):
+        """n 个 32 位随机整数"""
+        words = array.array('I', _randbytes(rng, 4 * n))
+        if sys.byteorder == 'big':
+            words.byteswap()
+        return words
+
+    @staticmethod
+    def _retry_below(product, m, rng):
+        """x * m 的低 32 位落在偏差区间时重新抽取, 保证 (x * m) >> 32 在 [0, m) 中无偏"""
+        threshold = (0x100000000 - m) % m
+        while (product & 0xFFFFFFFF) < threshold:
+            product = rng.getrandbits(32) * m
+        return product
+
+    def _below(self, m, count, rng):
+        """count 个 [0, m) 中的无偏随机整数 (32 位随机数乘法映射 + 拒绝)"""
+        result = []
+        for x in self._words(count, rng):
+            product = x * m
+            if (product & 0xFFFFFFFF) < m:
+                product = self._retry_below(product, m, rng)
+            result.append(product >> 32)
+        return result
+
+    def _index_stream(self, hint, rng):
+        """无限的均匀下标流, 每次批量抽取约 hint 个"""
+        if self.size > 65536:
+            while True:
+                yield from self._below(self.size, hint, rng)
+        np = _get_numpy()
+        while True:
+            chunk = self.draw_indices(hint, rng)
+            yield from (chunk.tolist() if np is not None and not isinstance(chunk, bytes) else chunk)
+
+    def draw_indices_many(self, lengths, rng=random):
+        """为 lengths 中的每个长度各抽取一组互不相同的下标, 返回拼接后的下标列表"""
+        n = self.size
+        if any(k > n for k in lengths):
+            raise ValueError(f"当不重复时，长度不能超过字符集的唯一字符数 ({n})")
+        sparse = [k for k in lengths if k <= n * NO_REPEAT_REJECTION_RATIO]
+        dense = sum(lengths) - sum(sparse)
+        stream = self._index_stream(int(sum(sparse) * 1.4) + 64, rng) if sparse else None
+        words = iter(self._words(dense, rng)) if dense else None
+        buffer = list(range(n)) if dense else None  # 始终是 0..n-1 的一个排列, 无需复位
+        marks = bytearray(n) if sparse else None
+        result = []
+        draws = 0
+        for k in lengths:
+            if k <= n * NO_REPEAT_REJECTION_RATIO:
+                picked = []
+                while len(picked) < k:
+                    i = next(stream)
+                    draws += 1
+                    if not marks[i]:
+                        marks[i] = 1
+                        picked.append(i)
+                for i in picked:
+                    marks[i] = 0
+                result += picked
+            else:
+                for j, x in zip(range(k), words):
+                    m = n - j
+                    product = x * m
+                    if (product & 0xFFFFFFFF) < m:
+                        product = self._retry_below(product, m, rng)
+                    r = j + (product >> 32)
+                    buffer[j], buffer[r] = buffer[r], buffer[j]
+                result += buffer[:k]
+        if _profiler is not None and sparse:
+            _profiler.count('nr_rejections', draws - sum(sparse))
+        return result
+
+    def draw_many(self, lengths, rng=random):
+        """返回与 lengths 一一对应的不重复字符字符串"""
+        n = self.size
+        if any(k > n for k in lengths):
+            raise ValueError(f"当不重复时，长度不能超过字符集的唯一字符数 ({n})")
+        column = [''] * len(lengths)
+        pending = [i for i, k in enumerate(lengths) if k and self._use_whole(k)]
+        while pending:
+            chars = self.draw(sum(lengths[i] for i in pending), rng)
+            retry = []
+            offset = 0
+            for i in pending:
+                k = lengths[i]
+                item = chars[offset:offset + k]
+                offset += k
+                if len(set(item)) == k:
+                    column[i] = item
+                else:
+                    retry.append(i)
+            if _profiler is not None and retry:
+                _profiler.count('nr_rejections', len(retry))
+            pending = retry
+
+        rest = [i for i, k in enumerate(lengths) if k and not self._use_whole(k)]
+        if rest:
+            rest_lengths = [lengths[i] for i in rest]
+            chars = _indices_to_str(self.draw_indices_many(rest_lengths, rng), self)
+            offset = 0
+            for i, k in zip(rest, rest_lengths):
+                column[i] = chars[offset:offset + k]
+                offset += k
+        return column
+
+# --- 加权采样与长度分布 ---
+# AliasTable 用 Vose 别名法把任意离散分布变为 "均匀选一列 + 与该列阈值比较" 的 O(1) 采样,
+# 列下标由 IndexSampler 批量生成, 阈值比较用 16 位随机数 (精度 1/65536)。
+# WeightedSampler 以此实现按权重的字符采样, DiscreteLength 以此实现长度分布。
+
+ALIAS_THRESHOLD_BITS = 16
+
+class AliasTable:
+    """离散分布的别名表, weights 为非负数且总和大于 0"""
+
+    def __init__(self, weights):
+        weights = [float(w) for w in weights]
+        if not weights or any(w < 0 for w in weights) or sum(weights) <= 0:
+            raise ValueError("权重必须为非负数且总和大于 0")
+        n = len(weights)
+        total = sum(weights)
+        scaled = [w * n / total for w in weights]
+        scale = 1 << ALIAS_THRESHOLD_BITS
+        self.thresholds = [scale] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.thresholds[s] = round(scaled[s] * scale)
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        self.size = n
+        self.uniform = IndexSampler(n)
+        self._np_tables = None
+
+    def sample_indices(self, n, rng=random):
+        """返回 n 个按权重分布的下标 (安装 NumPy 时为数组, 否则为列表)"""
+        if n <= 0:
+            return []
+        columns = self.uniform.draw_indices(n, rng)
+        raw = _randbytes(rng, 2 * n)
+        np = _get_numpy()
+        if np is not None:
+            if self._np_tables is None:
+                self._np_tables = (np.array(self.thresholds, dtype=np.int64), np.array(self.alias, dtype=np.int64))
+            thresholds, alias = self._np_tables
+            if isinstance(columns, bytes):
+                columns = np.frombuffer(columns, dtype=np.uint8)
+            columns = np.asarray(columns, dtype=np.int64)
+            u = np.frombuffer(raw, dtype='<u2')
+            return np.where(u < thresholds[columns], columns, alias[columns])
+        u = array.array('H', raw)
+        if sys.byteorder == 'big':
+            u.byteswap()
+        thresholds, alias = self.thresholds, self.alias
+        return [i if v < thresholds[i] else alias[i] for i, v in zip(columns, u)]
+
+class WeightedSampler:
+    """按字符权重采样, 接口与 CharsetSampler 相同"""
+
+    def __init__(self, charset, weights):
+        if len(weights) != len(charset):
+            raise ValueError(f"权重数量 ({len(weights)}) 与字符集长度 ({len(charset)}) 不一致")
+        self.charset = charset
+        self.table = AliasTable(weights)
+        self._codes = None
+
+    def _codepoints(self, np):
+        if self._codes is None:
+            self._codes = np.array([ord(c) for c in self.charset], dtype='<u4')
+        return self._codes
+
+    def draw(self, n, rng=random):
+        if n <= 0:
+            return ''
+        return _indices_to_str(self.table.sample_indices(n, rng), self)
+
+def parse_weights(text):
+    """解析以逗号分隔的权重列表, 例如 '5,1,2.5'"""
+    try:
+        return [float(w) for w in text.split(',')]
+    except ValueError:
+        raise ValueError(f"无效的权重: {text}")
+
+class LengthDistribution:
+    """长度分布的基类: sample(count, rng) 批量返回 count 个长度, min_length / max_length 为取值范围"""
+
+    min_length = 0
+    max_length = 0
+
+    def sample(self, count, rng=random):
+        raise NotImplementedError
+
+class FixedLength(LengthDistribution):
+    def __init__(self, length):
+        self.min_length = self.max_length = length
+
+    def sample(self, count, rng=random):
+        return [self.min_length] * count
+
+    def __repr__(self):
+        return f"fixed:{self.min_length}"
+
+class UniformLength(LengthDistribution):
+    def __init__(self, min_length, max_length):
+        self.min_length, self.max_length = min_length, max_length
+        self.indices = IndexSampler(max_length - min_length + 1)
+
+    def sample(self, count, rng=random):
+        return [self.min_length + int(i) for i in self.indices.draw_indices(count, rng)]
+
+    def __repr__(self):
+        return f"uniform:{self.min_length},{self.max_length}"
+
+class DiscreteLength(LengthDistribution):
+    """任意离散长度分布 (正态、Zipf、经验直方图), 用别名表采样"""
+
+    def __init__(self, lengths, weights, name='discrete'):
+        pairs = [(length, weight) for length, weight in zip(lengths, weights) if weight > 0]
+        if not pairs:
+            raise ValueError("长度分布为空")
+        self.lengths = [length for length, _ in pairs]
+        self.weights = [weight for _, weight in pairs]
+        self.table = AliasTable(self.weights)
+        self.min_length, self.max_length = min(self.lengths), max(self.lengths)
+        self.name = name
+
+    def sample(self, count, rng=random):
+        lengths = self.lengths
+        return [lengths[i] for i in self.table.sample_indices(count, rng)]
+
+    def __repr__(self):
+        return f"{self.name}:{list(zip(self.lengths, self.weights))}"
+
+def _read_length_histogram(path):
+    """读取经验长度直方图: 每行 '长度 次数' (或 '长度,次数'), 只有长度时次数为 1, # 开头为注释"""
+    counts = collections.Counter()
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            line = line.split('#', 1)[0].replace(',', ' ').split()
+            if not line:
+                continue
+            counts[int(line[0])] += float(line[1]) if len(line) > 1 else 1
+    return counts
+
+def parse_length_distribution(spec, min_length, max_length):
+    """
+    解析长度分布:
+      fixed:N               固定长度
+      uniform:A,B           [A, B] 均匀分布
+      normal:MEAN,STD[,A,B] 离散化的正态分布, 截断到 [A, B] (默认为配置的 min_length/max_length)
+      zipf:S[,A,B]          P(L) 正比于 (L - A + 1) ** -S
+      hist:FILE             从文件读取的经验直方图
+    """
+    kind, _, params = spec.partition(':')
+    kind = kind.strip().lower()
+    if kind == 'hist':
+        counts = _read_length_histogram(params)
+        lengths = sorted(length for length in counts if length >= 0)
+        return DiscreteLength(lengths, [counts[length] for length in lengths], 'hist')
+    try:
+        values = [float(v) for v in params.split(',')] if params.strip() else []
+    except ValueError:
+        raise ValueError(f"无效的长度分布参数: {spec}")
+
+    def bounds(offset):
+        lo = int(values[offset]) if len(values) > offset else min_length
+        hi = int(values[offset + 1]) if len(values) > offset + 1 else max_length
+        if lo < 0 or lo > hi:
+            raise ValueError(f"无效的长度范围: {lo}-{hi}")
+        return lo, hi
+
+    if kind == 'fixed' and len(values) == 1:
+        return FixedLength(int(values[0]))
+    if kind == 'uniform' and len(values) in (0, 2):
+        return UniformLength(*bounds(0))
+    if kind == 'normal' and len(values) in (2, 4):
+        mean, std = values[0], values[1]
+        if std <= 0:
+            return FixedLength(max(0, round(mean)))
+        lo, hi = bounds(2)
+        lo, hi = max(lo, math.floor(mean - 6 * std)), min(hi, math.ceil(mean + 6 * std))
+        lengths = list(range(lo, hi + 1))
+        return DiscreteLength(lengths, [math.exp(-0.5 * ((n - mean) / std) ** 2) for n in lengths], 'normal')
+    if kind == 'zipf' and len(values) in (1, 3):
+        s_param = values[0]
+        lo, hi = bounds(1)
+        lengths = list(range(lo, hi + 1))
+        return DiscreteLength(lengths, [(n - lo + 1) ** -s_param for n in lengths], 'zipf')
+    raise ValueError(f"无效的长度分布: {spec}")
+
+# --- 安全随机数 ---
+
+class SecureRandom(random.Random):
+    """
+    基于操作系统 CSPRNG (os.urandom) 的随机数生成器, 接口与 random.Random 相同。
+    随机字节取自可复用的大块缓冲池, 而不是每个字符一次系统调用;
+    randint / sample / choices 等方法经 getrandbits 同样取自缓冲池。
+    缓冲池的补充和切片在锁内进行, 同一实例可被多个线程共享 (令牌池、asyncio 的 executor 等),
+    不会把同一段随机字节交给两个调用方。
+    fork 之后子进程会丢弃继承来的缓冲池 (和可能被其他线程持有的锁), 避免父子进程输出相同的随机数。
+    """
+
+    POOL_SIZE = 1 << 20  # 缓冲池大小 (字节)
+
+    def __init__(self, pool_size=POOL_SIZE):
+        import threading
+        self.pool_size = pool_size
+        self._pool = b''
+        self._pos = 0
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        super().__init__()
+
+    def seed(self, *args, **kwargs):
+        """CSPRNG 不支持设置种子, 调用被忽略"""
+        return None
+
+    def getstate(self):
+        raise NotImplementedError("SecureRandom 没有可保存的状态")
+
+    def setstate(self, state):
+        raise NotImplementedError("SecureRandom 没有可恢复的状态")
+
+    def randbytes(self, n):
+        if n >= self.pool_size:
+            return os.urandom(n)
+        if self._pid != os.getpid():
+            import threading
+            self._lock = threading.Lock()
+            self._pool, self._pos, self._pid = b'', 0, os.getpid()
+        with self._lock:
+            if self._pos + n > len(self._pool):
+                self._pool = os.urandom(self.pool_size)
+                self._pos = 0
+            data = self._pool[self._pos:self._pos + n]
+            self._pos += n
+        return data
+
+    def getrandbits(self, k):
+        if k < 0:
+            raise ValueError("number of bits must be non-negative")
+        if k == 0:
+            return 0
+        numbytes = (k + 7) // 8
+        return int.from_bytes(self.randbytes(numbytes), 'big') >> (numbytes * 8 - k)
+
+    def random(self):
+        return (int.from_bytes(self.randbytes(7), 'big') >> 3) * (2.0 ** -53)
+
+_secure_random = None
+
+def get_secure_random():
+    """返回进程内共享的 SecureRandom 实例"""
+    global _secure_random
+    if _secure_random is None:
+        _secure_random = SecureRandom()
+    return _secure_random
+
+# --- 生成函数 ---
+# 以下函数均委托给 PlanPart, 字符由 CharsetSampler 批量生成
+
+# --- UUID ---
+# 整批 UUID 的随机位一次取出, 用转换表设置版本号和变体位, 再按步长切片直接填入
+# 预先排好连字符的输出缓冲区, 不为每个 UUID 创建 uuid.UUID 对象。
+
+_UUID_TEMPLATE = b'00000000-0000-0000-0000-000000000000\n'
+_UUID_HEX_POSITIONS = [i for i, c in enumerate(_UUID_TEMPLATE[:36]) if c != ord('-')]
+_UUID_VARIANT = bytes((b & 0x3f) | 0x80 for b in range(256))
+_UUID_VERSION = {version: bytes((b & 0x0f) | (version << 4) for b in range(256)) for version in (4, 7)}
+UUID7_COUNTER_BITS = 42  # rand_a 的 12 位 + rand_b 的高 30 位用作毫秒内的单调计数器
+
+def _format_uuids(data, count):
+    """把 16 * count 字节格式化为 count 个标准 UUID 字符串"""
+    if count <= 0:
+        return []
+    hexdigits = data.hex().encode('ascii')
+    out = bytearray(_UUID_TEMPLATE * count)
+    for j, pos in enumerate(_UUID_HEX_POSITIONS):
+        out[pos::37] = hexdigits[j::32]
+    return out[:-1].decode('ascii').split('\n')
+
+def _set_uuid_bits(data, version):
+    data[6::16] = data[6::16].translate(_UUID_VERSION[version])
+    data[8::16] = data[8::16].translate(_UUID_VARIANT)
+
+def generate_uuid(count, rng=None):
+    """生成 UUID4; 随机位取自 rng, 未指定时取自 os.urandom (与 uuid.uuid4() 相同)"""
+    data = bytearray(os.urandom(16 * count) if rng is None else rng.randbytes(16 * count))
+    _set_uuid_bits(data, 4)
+    return _format_uuids(data, count)
+
+class UUID7Generator:
+    """
+    按时间排序的 UUIDv7 (RFC 9562)。
+    48 位 Unix 毫秒时间戳之后是 42 位单调计数器 (每个新毫秒随机初始化, 最高位清零以留出余量)
+    和 32 位随机数; 同一毫秒内计数器递增, 计数器溢出或时钟回拨时时间戳顺延,
+    因此同一生成器产生的 UUID 严格递增。时间戳和计数器由锁保护, 令牌池的补充线程和请求线程可以共用一个生成器;
+    单调性只在同一进程内成立, 因此 u7 不能与 -j (多进程) 和 --seed (可复现) 一起使用。
+    """
+
+    def __init__(self):
+        import threading
+        self.last_ms = -1
+        self.counter = 0
+        self._lock = threading.Lock()
+
+    def generate(self, count, rng=None):
+        import time
+        randbytes = os.urandom if rng is None else rng.randbytes
+        counter_limit = 1 << UUID7_COUNTER_BITS
+        tail = randbytes(4 * count)
+        data = bytearray()
+        with self._lock:
+            now = time.time_ns() // 1000000
+            if now > self.last_ms:
+                self.last_ms = now
+                self.counter = int.from_bytes(randbytes(6), 'big') >> (48 - UUID7_COUNTER_BITS + 1)
+            for i in range(count):
+                self.counter += 1
+                if self.counter >= counter_limit:
+                    self.last_ms += 1
+                    self.counter = int.from_bytes(randbytes(6), 'big') >> (48 - UUID7_COUNTER_BITS + 1)
+                # 版本号 (第 76-79 位) 和变体位 (第 62-63 位) 留空, 由 _set_uuid_bits 填入
+                value = (self.last_ms << 80) | ((self.counter >> 30) << 64) | ((self.counter & 0x3fffffff) << 32) \
+                    | int.from_bytes(tail[4 * i:4 * i + 4], 'big')
+                data += value.to_bytes(16, 'big')
+        _set_uuid_bits(data, 7)
+        return _format_uuids(data, count)
+
+_uuid7_generator = UUID7Generator()
+
+def generate_uuid7(count, rng=None):
+    """生成 count 个 UUIDv7, 在同一进程内单调递增"""
+    return _uuid7_generator.generate(count, rng)
+
+def generate_numeric(min_length, max_length, count, no_repeat=False):
+    if no_repeat:
+        max_length = min(max_length, 10)
+    return list(PlanPart('chars', string.digits, min_length, max_length, no_repeat).column(count))
+
+def generate_alpha(min_length, max_length, count, case_sensitive='', no_repeat=False):
+    charset = _mode_charset('a', case_sensitive)
+    if no_repeat:
+        max_length = min(max_length, len(set(charset)))
+    return list(PlanPart('chars', charset, min_length, max_length, no_repeat).column(count))
+
+def generate_alphanumeric(min_length, max_length, count, case_sensitive='', no_repeat=False):
+    charset = _mode_charset('an', case_sensitive)
+    if no_repeat:
+        max_length = min(max_length, len(set(charset)))
+    return list(PlanPart('chars', charset, min_length, max_length, no_repeat).column(count))
+
+def generate_from_charset(charset, min_length, max_length, count, no_repeat=False):
+    """从给定字符集生成随机字符串"""
+    return _compile_charset(charset, min_length, max_length, no_repeat).generate(count)
+
+# --- 流式生成 ---
+# 以下 iter_* 函数是对应生成函数的流式版本, 每次产出一批 (list) 字符串,
+# 调用方逐批消费即可让峰值内存与 count 无关。
+
+DEFAULT_BATCH_SIZE = 8192  # 每批字符串数量
+OUTPUT_BUFFER_SIZE = 1 << 20  # 输出文件缓冲区大小 (字节)
+
+def _iter_batch_sizes(count, batch_size=DEFAULT_BATCH_SIZE):
+    """把 count 切分成不超过 batch_size 的若干批, count 为 None 时无限产出"""
+    if count is None:
+        while True:
+            yield batch_size
+    remaining = count
+    while remaining > 0:
+        size = min(batch_size, remaining)
+        yield size
+        remaining -= size
+
+def iter_uuid(count, batch_size=DEFAULT_BATCH_SIZE):
+    for size in _iter_batch_sizes(count, batch_size):
+        yield generate_uuid(size)
+
+def iter_numeric(min_length, max_length, count, no_repeat=False, batch_size=DEFAULT_BATCH_SIZE):
+    for size in _iter_batch_sizes(count, batch_size):
+        yield generate_numeric(min_length, max_length, size, no_repeat)
+
+def iter_alpha(min_length, max_length, count, case_sensitive='', no_repeat=False, batch_size=DEFAULT_BATCH_SIZE):
+    for size in _iter_batch_sizes(count, batch_size):
+        yield generate_alpha(min_length, max_length, size, case_sensitive, no_repeat)
+
+def iter_alphanumeric(min_length, max_length, count, case_sensitive='', no_repeat=False,
+                      batch_size=DEFAULT_BATCH_SIZE):
+    for size in _iter_batch_sizes(count, batch_size):
+        yield generate_alphanumeric(min_length, max_length, size, case_sensitive, no_repeat)
+
+def iter_from_charset(charset, min_length, max_length, count, no_repeat=False, batch_size=DEFAULT_BATCH_SIZE,
+                      rng=random):
+    """generate_from_charset 的流式版本, 与其一致: 整个调用只选取一次长度; 长度和字符都取自 rng"""
+    plan = _compile_charset(charset, min_length, max_length, no_repeat, rng)  # 采样表只建立一次
+    for size in _iter_batch_sizes(count, batch_size):
+        yield plan.generate(size, rng)
+
+# --- 输出 ---
+# 记录格式: lines 为记录之间用换行分隔 (最后一行不加换行符); 其余格式每条记录后都跟一个终止符, 便于拼接和按偏移读取:
+# nul 以 \0 结尾 (xargs -0 等); jsonl 每行一个 JSON 字符串; csv 每行为 "序号,字符串" (序号从 0 开始, 供 COPY ... CSV 导入);
+# raw 为没有分隔符的定长记录, 要求所有记录的字节数相同, 第 k 条记录位于 k * 宽度 处, 可直接 mmap 读取。
+
+RECORD_FORMATS = ('lines', 'nul', 'jsonl', 'csv', 'raw')
+_RECORD_TERMINATORS = {'nul': "\0", 'jsonl': "\n", 'csv': "\n", 'raw': ""}
+
+def _needs_escape(record_format):
+    """返回判断字符串是否需要转义 (JSON 转义或 CSV 加引号) 的正则, 不需要转义的格式返回 None"""
+    import re
+    if record_format == 'jsonl':
+        return re.compile(r'["\\\x00-\x1f]')
+    if record_format == 'csv':
+        return re.compile(r'[",\r\n]')
+    return None
+
+def record_width(plan, case=None, encoding=None):
+    """
+    计划生成的每个字符串编码后都是相同字节数时返回该字节数, 否则返回 None。
+    plan 为 ExpressionPlan, 长度可变、正则片段或字符集中字符的编码宽度不一时返回 None。
+    encoding 默认与 RecordWriter 相同。
+    """
+    if encoding is None:
+        import locale
+        encoding = locale.getpreferredencoding(False)
+    parts = getattr(plan, 'parts', None)
+    if not parts:
+        return None
+    width = 0
+    for part in parts:
+        part_case = getattr(part, 'case', None) or case
+        if part.kind == 'str':
+            width += len(_apply_case(part.value, part_case).encode(encoding))
+        elif part.kind in ('uuid', 'uuid7'):
+            width += 36
+        elif part.kind == 'chars' and part.fixed_length:
+            if not part.min_length:
+                continue
+            chars = {_apply_case(c, part_case) for c in set(part.value)}
+            sizes = {len(c.encode(encoding)) if len(c) == 1 else -1 for c in chars}
+            if len(sizes) != 1 or -1 in sizes:
+                return None
+            width += part.min_length * sizes.pop()
+        else:
+            return None
+    return width
+
+def output_size(width, count, record_format='lines', newline=os.linesep):
+    """count 条字节宽度为 width 的记录写出后的总字节数; 无法预先确定 (csv、jsonl) 时返回 None"""
+    if width is None or count is None or record_format not in ('lines', 'nul', 'raw'):
+        return None
+    if record_format == 'lines':
+        return count * width + max(0, count - 1) * len(newline)
+    return count * (width + len(_RECORD_TERMINATORS[record_format]))
+
+def _is_regular_file(file):
+    """file 是否为普通文件 (/dev/null、管道、终端等不能预分配或截断)"""
+    import stat
+    try:
+        return stat.S_ISREG(os.fstat(file.fileno()).st_mode)
+    except (OSError, ValueError):
+        return False
+
+def _preallocate(file, size):
+    """
+    为输出文件预先分配 size 字节 (减少碎片, 磁盘空间不足时在生成之前就报错);
+    不支持或不是普通文件时忽略, 返回是否已预分配
+    """
+    import errno
+    if not size or not hasattr(os, 'posix_fallocate') or not _is_regular_file(file):
+        return False
+    try:
+        os.posix_fallocate(file.fileno(), 0, size)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise ValueError(f"错误: 磁盘空间不足, 输出需要 {size} 字节") from None
+        return False
+    return True
+
+class RecordWriter:
+    """
+    把字符串批次按 record_format 编码后写入二进制文件并同时喂给哈希器, file 和 hasher 都可以为 None。
+    encoding 默认与文本模式 open() 的默认编码一致。index 为下一条记录的序号 (csv 格式使用)。
+    width 为 raw 格式的记录字节数, 为 None 时取第一条记录的字节数。
+    """
+
+    def __init__(self, file=None, hasher=None, encoding=None, newline=os.linesep, record_format='lines',
+                 index=0, width=None):
+        if encoding is None:
+            import locale
+            encoding = locale.getpreferredencoding(False)
+        if record_format not in RECORD_FORMATS:
+            raise ValueError(f"错误: 不支持的记录格式 '{record_format}'")
+        self.file = file
+        self.hasher = hasher
+        self.encoding = encoding
+        self.newline = newline
+        self.record_format = record_format
+        self.index = index
+        self.width = width
+        self.first = True
+        self._escape = _needs_escape(record_format)
+
+    def records(self, batch):
+        """batch 中每条记录 (含分隔符) 编码前的文本, 不改变写入状态; 用于按字节数切分"""
+        record_format = self.record_format
+        if record_format == 'lines':
+            records = [self.newline + item for item in batch]
+            if self.first and records:
+                records[0] = batch[0]
+            return records
+        if record_format == 'jsonl':
+            import json
+            return [json.dumps(item, ensure_ascii=False) + "\n" for item in batch]
+        if record_format == 'csv':
+            return [f"{index},{self._csv_field(item)}\n" for index, item in enumerate(batch, self.index)]
+        terminator = _RECORD_TERMINATORS[record_format]
+        return [item + terminator for item in batch]
+
+    @staticmethod
+    def _csv_field(item):
+        if any(c in item for c in ',"\r\n'):
+            return '"' + item.replace('"', '""') + '"'
+        return item
+
+    def _text(self, batch):
+        """整批编码前的文本: 常见情况 (无需转义) 只做一次 join, 不为每条记录建立字符串"""
+        record_format = self.record_format
+        if record_format == 'lines':
+            data = self.newline.join(batch)
+            return data if self.first else self.newline + data
+        if record_format in ('nul', 'raw'):
+            terminator = _RECORD_TERMINATORS[record_format]
+            return terminator.join(batch) + terminator
+        joined = "".join(batch)
+        if self._escape.search(joined):
+            return "".join(self.records(batch))
+        if record_format == 'jsonl':
+            return '"' + '"\n"'.join(batch) + '"\n'
+        indexes = map(str, range(self.index, self.index + len(batch)))
+        return "\n".join(map(",".join, zip(indexes, batch))) + "\n"
+
+    def _check_width(self, batch, data):
+        """raw 格式没有分隔符, 记录必须等宽, 否则无法按偏移读取"""
+        width = self.width
+        if width is None:
+            width = self.width = len(batch[0].encode(self.encoding))
+        if len(data) == width * len(batch):
+            if data.isascii() or {len(item.encode(self.encoding)) for item in batch} == {width}:
+                return
+        raise ValueError(f"错误: raw 格式要求所有字符串编码后的长度相同 ({width} 字节)")
+
+    def encode(self, batch):
+        data = self._text(batch).encode(self.encoding)
+        if self.record_format == 'raw':
+            self._check_width(batch, data)
+        self.first = False
+        self.index += len(batch)
+        return data
+
+    def write(self, batch):
+        if not batch:
+            return
+        if _profiler is not None:
+            with _profiler.stage('encode'):
+                data = self.encode(batch)
+            _profiler.count('bytes_written', len(data))
+            if self.file is not None:
+                with _profiler.stage('write'):
+                    self.file.write(data)
+        else:
+            data = self.encode(batch)
+            if self.file is not None:
+                self.file.write(data)
+        if self.hasher is not None:
+            self.hasher.update(data)
+
+def print_batch(batch):
+    """把一批字符串输出到控制台"""
+    if not batch:
+        return
+    if _profiler is not None:
+        with _profiler.stage('console'):
+            sys.stdout.write("\n".join(batch) + "\n")
+        return
+    sys.stdout.write("\n".join(batch) + "\n")
+
+def generate_hash(file_path, hash_algorithm):
+    import hashlib
+    hash_obj = hashlib.new(hash_algorithm)
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(8192):
+            hash_obj.update(chunk)
+    return hash_obj.hexdigest()
+
+class MultiHasher:
+    """
+    在写出数据的同一遍中增量计算多个摘要。
+    每个数据块的各算法 update 分派到线程池并行执行 (hashlib 对大块数据会释放 GIL),
+    提交下一块前等待上一块完成, 以保证每个算法按顺序接收数据。
+    """
+
+    def __init__(self, algorithms, threads=True):
+        import hashlib
+        self.algorithms = list(algorithms)
+        self.hash_objs = [hashlib.new(algo) for algo in self.algorithms]
+        self.executor = None
+        if threads and len(self.hash_objs) > 1:
+            import concurrent.futures
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(self.hash_objs))
+        self.pending = []
+
+    def _wait(self):
+        for future in self.pending:
+            future.result()
+        self.pending = []
+
+    def update(self, data):
+        self._wait()
+        if _profiler is not None:
+            import functools
+            updates = [functools.partial(_profiled_update, f"hash:{algo}", hash_obj, _profiler)
+                       for algo, hash_obj in zip(self.algorithms, self.hash_objs)]
+        else:
+            updates = [hash_obj.update for hash_obj in self.hash_objs]
+        if self.executor is None:
+            for update in updates:
+                update(data)
+        else:
+            self.pending = [self.executor.submit(update, data) for update in updates]
+
+    def snapshot(self):
+        """返回目前为止数据的 [(算法, 摘要)], 之后仍可继续 update"""
+        self._wait()
+        return [(algo, hash_obj.copy().hexdigest()) for algo, hash_obj in zip(self.algorithms, self.hash_objs)]
+
+    def hexdigests(self):
+        """返回 [(算法, 摘要)], 并释放线程池"""
+        self._wait()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        return [(algo, hash_obj.hexdigest()) for algo, hash_obj in zip(self.algorithms, self.hash_objs)]
+
+def _profiled_update(stage, hash_obj, profiler, data):
+    with profiler.stage(stage):
+        hash_obj.update(data)
+
+def parse_hashes(hash_string):
+    """解析哈希算法字符串，支持 'n' 和 'a'"""
+    import hashlib
+    if hash_string == 'n':
+        return ['md5', 'sha1', 'sha256', 'sha512']
+    elif hash_string == 'a':
+        return ['md5', 'sha1', 'sha256', 'sha512', 'sha3_224', 'sha3_256', 'sha3_384', 'sha3_512']
+    else:
+        algorithms = hash_string.split(',')
+        valid_algorithms = []
+        for algo in algorithms:
+            algo = algo.lower().strip()  # 统一转为小写并去除空格
+            if algo in hashlib.algorithms_available:
+                valid_algorithms.append(algo)
+            else:
+                print(f"警告: 不支持的哈希算法 '{algo}'，已忽略")
+        return valid_algorithms
+
+# --- 表达式解析 ---
+
+def parse_expression(expression):
+    """
+    解析表达式。
+    cc 模式:  params 是一个字典: {'length': '...', 'chars': '...', 'no_repeat': True/False, 'case': 'lower'/'upper'/None,
+                                'weights': '权重列表' 或 None}  (权重写作 w=5,1,2, 与字符集逐一对应)
+    其他模式: params 是一个列表
+    """
+    parts = []
+    i = 0
+    while i < len(expression):
+        char = expression[i]
+        if char.isalpha():
+            j = i + 1
+            while j < len(expression) and expression[j].isalnum():
+                j += 1
+            mode = expression[i:j]
+            i = j
+            if i < len(expression) and expression[i] == '(':
+                j = i + 1
+                while j < len(expression) and expression[j] != ')':
+                    j += 1
+                if j < len(expression):
+                    param_str = expression[i + 1:j]
+                    params = param_str.split(';')
+
+                    # --- cc 模式特殊处理 ---
+                    if mode == 'cc':
+                        cc_params = {'length': '', 'chars': '', 'no_repeat': False, 'case': None, 'weights': None}
+                        if len(params) >= 2:  # 至少要有长度和字符集
+                            cc_params['length'] = params[0]
+                            cc_params['chars'] = params[1]
+                            for p in params[2:]:  # 处理可选参数
+                                if p == 'nr':
+                                    cc_params['no_repeat'] = True
+                                elif p == 's':
+                                    cc_params['case'] = 'lower'
+                                elif p == 'S':
+                                    cc_params['case'] = 'upper'
+                                elif p.startswith('w='):
+                                    cc_params['weights'] = p[2:]
+                        else:
+                            print("错误: cc 模式至少需要两个参数 (长度和字符集)")
+                            return [] #错误就返回空
+                        parts.append((mode, cc_params)) # cc模式返回字典
+                    else:
+                        # 其他模式保持原样, 返回列表
+                        parts.append((mode, params))
+
+                    i = j + 1
+                else:
+                    print("错误: 表达式语法错误，缺少右括号")
+                    return []
+            else:
+                # 对于没有括号的 n, a, an, u，params 设置为空列表
+                parts.append((mode, []))
+        elif char in ("'", '"'):
+            j = i + 1
+            while j < len(expression) and expression[j] != char:
+                j += 1
+            if j < len(expression):
+                parts.append(('str', [expression[i + 1:j]]))
+                i = j + 1
+            else:
+                print("错误，表达式语法错误，缺少结束引号")
+                return []
+        elif char.isspace() or char == ',' or char == '[' or char == ']':
+            i += 1
+        else:
+            parts.append(('str', [char]))
+            i += 1
+    return parts
+
+
+# --- 表达式编译 ---
+# compile_expression 把 parse_expression 的结果一次性编译为 ExpressionPlan:
+# 字符集、长度、nr/大小写标志和字面量都在编译时确定, 生成时按片段整列批量生成后再拼接。
+
+def _mode_charset(mode, case_sensitive=''):
+    """返回 n / a / an 模式对应的字符集"""
+    if mode == 'n':
+        return string.digits
+    if case_sensitive == 'lower':
+        letters = string.ascii_lowercase
+    elif case_sensitive == 'upper':
+        letters = string.ascii_uppercase
+    else:
+        letters = string.ascii_letters
+    return letters + string.digits if mode == 'an' else letters
+
+def _apply_case(s, case):
+    if case == 'lower':
+        return s.lower()
+    elif case == 'upper':
+        return s.upper()
+    return s
+
+class PlanPart:
+    """
+    编译后的表达式片段。
+    kind: 'str' (字面量), 'chars' (从字符集生成), 'uuid', 'uuid7'
+    长度固定时 min_length == max_length, 否则每个字符串在 [min_length, max_length] 中随机取长度;
+    指定 length_dist 时长度按该分布抽取 (min_length / max_length 为其取值范围)。
+    weights 为与字符集逐一对应的字符权重, 为 None 时均匀采样。
+    """
+
+    def __init__(self, kind, value='', min_length=0, max_length=0, no_repeat=False, case=None,
+                 weights=None, length_dist=None):
+        self.kind = kind
+        self.value = value  # 字面量或字符集
+        self.min_length = min_length
+        self.max_length = max_length
+        self.no_repeat = no_repeat
+        self.case = case
+        self.weights = tuple(weights) if weights is not None else None
+        self.length_dist = length_dist
+        if length_dist is not None:
+            self.min_length, self.max_length = length_dist.min_length, length_dist.max_length
+        self._sampler = None
+        self._no_repeat_sampler = None
+        if self.weights is not None:
+            self._sampler = cached_sampler(WeightedSampler, value, self.weights)  # 编译期即校验权重
+
+    @property
+    def sampler(self):
+        if self._sampler is None:
+            self._sampler = cached_sampler(CharsetSampler, self.value)
+        return self._sampler
+
+    @property
+    def no_repeat_sampler(self):
+        """不重复采样器, 字符集先按片段的大小写转换再去重"""
+        if self._no_repeat_sampler is None:
+            self._no_repeat_sampler = cached_sampler(NoRepeatSampler, _apply_case(self.value, self.case))
+        return self._no_repeat_sampler
+
+    def describe(self):
+        """片段内容的描述, 用于计划的指纹"""
+        return (self.kind, self.value, self.min_length, self.max_length, self.no_repeat, self.case,
+                self.weights, self.length_dist)
+
+    def max_bytes(self):
+        """该片段 UTF-8 编码后的最大字节数"""
+        if self.kind == 'str':
+            return len(self.value.encode('utf-8'))
+        if self.kind in ('uuid', 'uuid7'):
+            return 36
+        if not self.value:
+            return 0
+        return self.max_length * max(len(c.encode('utf-8')) for c in set(self.value))
+
+    @property
+    def fixed_length(self):
+        return self.length_dist is None and self.min_length == self.max_length
+
+    def column(self, count, rng=random):
+        """生成该片段的一整列 (count 个字符串), 随机数取自 rng"""
+        if self.kind == 'str':
+            return itertools.repeat(self.value, count)
+        if self.kind in ('uuid', 'uuid7'):
+            # 使用全局默认 random 时随机位取自 os.urandom, 与 uuid.uuid4() 一致
+            generator = generate_uuid if self.kind == 'uuid' else generate_uuid7
+            uuids = generator(count, None if getattr(rng, 'wrapped', rng) is random else rng)
+            if self.case == 'upper':
+                return [item.upper() for item in uuids]
+            return uuids
+
+        charset = self.value
+        if not charset:
+            return [''] * count
+        if self.length_dist is not None:
+            lengths = self.length_dist.sample(count, rng)
+        elif self.min_length == self.max_length:
+            lengths = None
+            length = self.min_length
+        else:
+            lengths = cached_sampler(UniformLength, self.min_length, self.max_length).sample(count, rng)
+
+        if self.no_repeat:
+            return self.no_repeat_sampler.draw_many([length] * count if lengths is None else lengths, rng)
+
+        # 整列字符一次生成, 再按长度切片
+        if lengths is None:
+            chars = _apply_case(self.sampler.draw(length * count, rng), self.case)
+            return [chars[i:i + length] for i in range(0, length * count, length)]
+        chars = _apply_case(self.sampler.draw(sum(lengths), rng), self.case)
+        column = []
+        offset = 0
+        for n in lengths:
+            column.append(chars[offset:offset + n])
+            offset += n
+        return column
+
+def _join_columns(parts, count, rng=random):
+    """每个片段生成一列, 再逐行拼接"""
+    if not parts:
+        return [''] * count
+    if _profiler is not None:
+        return _join_columns_profiled(parts, count, rng, _profiler)
+    if len(parts) == 1:
+        return list(parts[0].column(count, rng))
+    return list(map("".join, zip(*(part.column(count, rng) for part in parts))))
+
+def _part_label(part):
+    """片段的简短描述, 用作剖析中的阶段名"""
+    kind = part.kind
+    if kind == 'str':
+        return repr(part.value[:16])
+    if kind != 'chars':
+        return kind
+    length = part.min_length if part.fixed_length else f"{part.min_length}-{part.max_length}"
+    flags = (" nr" if part.no_repeat else "") + (" w" if part.weights else "")
+    return f"chars[{len(part.value)}]({length}){flags}"
+
+def _join_columns_profiled(parts, count, rng, profiler):
+    """_join_columns 的剖析版本: 分别记录每个片段和拼接的耗时"""
+    columns = []
+    for i, part in enumerate(parts):
+        with profiler.stage(f"part {i}: {_part_label(part)}"):
+            columns.append(list(part.column(count, rng)))
+    with profiler.stage('join'):
+        return columns[0] if len(columns) == 1 else list(map("".join, zip(*columns)))
+
+class GenerationPlan:
+    """生成计划的基类: 子类实现 generate(count, rng, start)"""
+
+    def generate(self, count, rng=random, start=0):
+        raise NotImplementedError
+
+    def iter_batches(self, count, batch_size=DEFAULT_BATCH_SIZE, rng=random, start=0):
+        """逐批生成, start 为第一个字符串的序号"""
+        for size in _iter_batch_sizes(count, batch_size):
+            yield self.generate(size, rng, start)
+            start += size
+
+class ExpressionPlan(GenerationPlan):
+    """可重复执行的表达式生成计划"""
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    def generate(self, count, rng=random, start=0):
+        """
+        生成 count 个字符串: 每个片段生成一列, 再逐行拼接。
+        start 是第一个字符串在整个任务中的序号, 供按序号生成的计划 (如 UniquePlan) 使用。
+        """
+        if count <= 0:
+            return []
+        return _join_columns(self.parts, count, rng)
+
+    def max_bytes(self):
+        """单个字符串 UTF-8 编码后的最大字节数"""
+        return sum(part.max_bytes() for part in self.parts)
+
+    def fingerprint(self):
+        """计划内容的摘要, 用于派生与表达式绑定的种子"""
+        import hashlib
+        desc = repr([p.describe() for p in self.parts])
+        return hashlib.blake2b(desc.encode('utf-8'), digest_size=16).digest()
+
+_EXPRESSION_CACHE_SIZE = 256
+_expression_cache = {}
+
+def _parse_expression_cached(expression):
+    """
+    parse_expression 的缓存版本; 解析结果只读, 同一进程中重复使用的表达式 (如批量任务) 只解析一次,
+    配置缓存中已解析过的表达式直接使用
+    """
+    parsed = _expression_cache.get(expression)
+    if parsed is None:
+        parsed = _config_expressions.get(expression)
+        if parsed is None:
+            parsed = parse_expression(expression)
+        if len(_expression_cache) >= _EXPRESSION_CACHE_SIZE:
+            _expression_cache.clear()
+        _expression_cache[expression] = parsed
+    return parsed
+
+def compile_expression(expression, min_length, max_length, args):
+    """把表达式编译为 ExpressionPlan, 出错时打印错误并返回 None"""
+    try:
+        with profile_stage('parse'):
+            parsed_parts = _parse_expression_cached(expression)
+    except (SyntaxError, ValueError) as e:
+        print(f"表达式解析错误: {e}")
+        return None
+
+    if not parsed_parts:
+        return None
+
+    length_dist = _option_length_dist(args, min_length, max_length)
+    parts = []
+    for mode, params in parsed_parts:
+        if mode == 'str':
+            # 相邻字面量合并为一个片段
+            if parts and parts[-1].kind == 'str':
+                parts[-1].value += params[0]
+            else:
+                parts.append(PlanPart('str', params[0]))
+            continue
+
+        if mode in ('u', 'u7'):
+            case = next((p for p in params if p in ('s', 'S')), None)  # 获取 s 或 S
+            parts.append(PlanPart('uuid' if mode == 'u' else 'uuid7',
+                                  case='lower' if case == 's' else 'upper' if case == 'S' else None))
+            continue
+
+        if mode == 'cc':
+            # --- cc 模式: params 是字典, 大小写在生成后转换 ---
+            length_param = params['length']
+            charset = args.input or params['chars']
+            no_repeat = params['no_repeat']
+            case = params['case']
+            weights = parse_weights(params['weights']) if params['weights'] else None
+        elif mode in ('n', 'a', 'an'):
+            length_param = params[0] if params else ''
+            no_repeat = 'nr' in params
+            flag = next((p for p in params if p in ('s', 'S')), None)
+            case_sensitive = 'lower' if flag == 's' else 'upper' if flag == 'S' else ''
+            charset = _mode_charset(mode, case_sensitive)
+            case = None
+            weights = None
+        else:
+            # 未知模式不产生输出
+            continue
+
+        if no_repeat and weights is not None:
+            print(f"错误: nr 不能与字符权重同时使用")
+            return None
+
+        unique_chars = len(set(_apply_case(charset, case)))
+        part_dist = None
+        if length_param.isdigit():
+            part_min = part_max = int(length_param)
+        elif length_param == 'r':
+            if length_dist is not None:
+                part_dist = length_dist
+                part_min, part_max = length_dist.min_length, length_dist.max_length
+            elif args.length:
+                part_min = part_max = args.length
+            else:
+                part_min = min_length
+                part_max = min(max_length, unique_chars) if no_repeat else max_length
+        else:
+            part_min = part_max = args.length or 8
+
+        if no_repeat and part_max > unique_chars:
+            print(f"错误: 长度大于唯一字符数")
+            return None
+
+        parts.append(PlanPart('chars', charset, part_min, part_max, no_repeat, case, weights, part_dist))
+
+    return ExpressionPlan(parts)
+
+def generate_from_expression(expression, min_length, max_length, args):
+    """解析表达式并生成字符串"""
+    plan = compile_expression(expression, min_length, max_length, args)
+    if plan is None:
+        return []
+    return plan.generate(args.count)
+
+def iter_from_expression(expression, min_length, max_length, args, count, batch_size=DEFAULT_BATCH_SIZE):
+    """generate_from_expression 的流式版本, 表达式只编译一次"""
+    plan = compile_expression(expression, min_length, max_length, args)
+    if plan is None:
+        return iter(())
+    return plan.iter_batches(count, batch_size)
+
+# --- 正则表达式 ---
+# 模式写作 /正则/ (或 re 类型配置的值写作 /正则/) 时, 按正则表达式的一个子集生成匹配的字符串:
+# 字符、转义 (\d \w \s 及其大写取反、\n \t \xHH \uHHHH 等)、. 、字符类 [a-z0-9_] 和 [^...]、
+# 量词 ? * + {m} {m,} {m,n}、分组 (...) (?:...) 和选择 |; 开头的 ^ 和结尾的 $ 被忽略, 不支持反向引用和断言。
+# 正则只编译一次: 字符类及其量词直接变为 'chars' 片段 (与表达式模式共用采样表),
+# 只有分组的重复和选择才需要 RegexRepeat / RegexAlternation, 它们同样按列批量生成。
+# 编译结果按正则文本缓存, 反复引用同一个 re 配置时不会重新编译。
+
+REGEX_EXTRA_REPEAT = 16  # 无上限的量词 (* + {m,}) 最多重复 m + REGEX_EXTRA_REPEAT 次
+REGEX_ANY = "".join(chr(c) for c in range(0x20, 0x7f))  # . 和取反字符类的全集: 可打印 ASCII
+REGEX_CLASSES = {
+    'd': string.digits,
+    'w': string.ascii_letters + string.digits + '_',
+    's': ' \t',  # 只生成空格和制表符 (re 的 \s 的子集, 结果仍然匹配), 不生成换行等会拆开按行输出的记录的字符
+}
+REGEX_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'f': '\f', 'v': '\v', '0': '\0'}
+_regex_cache = {}
+_REGEX_CACHE_SIZE = 256
+
+def _regex_negate(chars):
+    excluded = set(chars)
+    return "".join(c for c in REGEX_ANY if c not in excluded)
+
+class _RegexParser:
+    """
+    递归下降解析, 语法树节点:
+      ('lit', 字符)  ('set', 字符集)  ('alt', [序列, ...])  ('rep', 节点, 最少次数, 最多次数)
+    序列是节点的列表。
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.pos = 0
+
+    def error(self, message):
+        return ValueError(f"正则表达式错误 (位置 {self.pos}): {message}")
+
+    def peek(self):
+        return self.pattern[self.pos] if self.pos < len(self.pattern) else None
+
+    def next(self):
+        char = self.peek()
+        if char is None:
+            raise self.error("意外的结尾")
+        self.pos += 1
+        return char
+
+    def parse(self):
+        if self.peek() == '^':
+            self.pos += 1
+        node = self.alternation()
+        if self.peek() is not None:
+            raise self.error("多余的右括号")
+        return node
+
+    def alternation(self):
+        branches = [self.sequence()]
+        while self.peek() == '|':
+            self.pos += 1
+            branches.append(self.sequence())
+        return ('alt', branches)
+
+    def sequence(self):
+        items = []
+        while self.peek() not in (None, '|', ')'):
+            if self.peek() == '$' and self.pos == len(self.pattern) - 1:
+                self.pos += 1
+                break
+            atom = self.atom()
+            items.append(self.quantifier(atom))
+        return items
+
+    def atom(self):
+        char = self.next()
+        if char == '(':
+            if self.pattern.startswith('?:', self.pos):
+                self.pos += 2
+            elif self.peek() == '?':
+                raise self.error("不支持 (? 扩展语法")
+            node = self.alternation()
+            if self.peek() != ')':
+                raise self.error("缺少右括号")
+            self.pos += 1
+            return node
+        if char == '[':
+            return ('set', self.char_class())
+        if char == '.':
+            return ('set', REGEX_ANY)
+        if char == '\\':
+            return self.escape()
+        if char in '*+?':
+            raise self.error(f"量词 {char} 前没有可重复的内容")
+        return ('lit', char)
+
+    def escape(self, in_class=False):
+        char = self.next()
+        if char.lower() in REGEX_CLASSES:
+            chars = REGEX_CLASSES[char.lower()]
+            return ('set', chars if char.islower() else _regex_negate(chars))
+        if char in REGEX_ESCAPES:
+            return ('lit', REGEX_ESCAPES[char])
+        if char in 'xu':
+            digits = 2 if char == 'x' else 4
+            code = self.pattern[self.pos:self.pos + digits]
+            try:
+                value = int(code, 16)
+            except ValueError:
+                raise self.error(f"无效的转义 \\{char}{code}")
+            self.pos += digits
+            return ('lit', chr(value))
+        if char.isdigit() or (char.isalpha() and not in_class):
+            raise self.error(f"不支持的转义 \\{char} (反向引用和断言无法用于生成)")
+        return ('lit', char)
+
+    def class_item(self):
+        """字符类中的一项, 返回 ('lit', 字符) 或 ('set', 字符集)"""
+        char = self.next()
+        if char == '\\':
+            return self.escape(in_class=True)
+        return ('lit', char)
+
+    def char_class(self):
+        negate = self.peek() == '^'
+        if negate:
+            self.pos += 1
+        chars = []
+        first = True
+        while first or self.peek() != ']':
+            if self.peek() is None:
+                raise self.error("缺少 ]")
+            first = False
+            kind, value = self.class_item()
+            if kind == 'lit' and self.peek() == '-' and self.pattern[self.pos + 1:self.pos + 2] not in ('', ']'):
+                self.pos += 1
+                end_kind, end = self.class_item()
+                if end_kind != 'lit' or ord(end) < ord(value):
+                    raise self.error(f"无效的范围 {value}-{end}")
+                chars.append("".join(chr(c) for c in range(ord(value), ord(end) + 1)))
+            else:
+                chars.append(value)
+        self.pos += 1
+        charset = "".join(dict.fromkeys("".join(chars)))  # 去重, 保证字符类内均匀
+        if negate:
+            charset = _regex_negate(charset)
+        if not charset:
+            raise self.error("字符类为空")
+        return charset
+
+    def quantifier(self, atom):
+        char = self.peek()
+        if char == '*':
+            low, high = 0, None
+        elif char == '+':
+            low, high = 1, None
+        elif char == '?':
+            low, high = 0, 1
+        elif char == '{':
+            end = self.pattern.find('}', self.pos)
+            body = self.pattern[self.pos + 1:end] if end >= 0 else ''
+            low_text, comma, high_text = body.partition(',')
+            if end < 0 or not (low_text.isdigit() or (comma and not low_text)) or \
+                    (high_text and not high_text.isdigit()):
+                return atom  # 与 re 一致: 不是量词的 { 按普通字符处理
+            low = int(low_text) if low_text else 0
+            high = (int(high_text) if high_text else None) if comma else low
+            if high is not None and high < low:
+                raise self.error(f"无效的量词 {{{body}}}")
+            self.pos = end
+        else:
+            return atom
+        self.pos += 1
+        if self.peek() in ('?', '+'):  # 非贪婪 / 占有量词对生成没有影响
+            self.pos += 1
+        if high is None:
+            high = low + REGEX_EXTRA_REPEAT
+        return ('rep', atom, low, high)
+
+class RegexAlternation:
+    """选择 (a|b|c): 每行均匀地选一个分支, 各分支按选中的行数批量生成"""
+
+    kind = 'alt'
+    fixed_length = False
+
+    def __init__(self, branches):
+        self.branches = branches  # 每个分支是片段列表
+        self.chooser = IndexSampler(len(branches))
+
+    def column(self, count, rng=random):
+        choices = self.chooser.draw_indices(count, rng)
+        rows = [[] for _ in self.branches]
+        for row, choice in enumerate(choices):
+            rows[choice].append(row)
+        result = [''] * count
+        for parts, branch_rows in zip(self.branches, rows):
+            if branch_rows:
+                for row, item in zip(branch_rows, _join_columns(parts, len(branch_rows), rng)):
+                    result[row] = item
+        return result
+
+    def describe(self):
+        return (self.kind, [[part.describe() for part in parts] for parts in self.branches])
+
+    def max_bytes(self):
+        return max(sum(part.max_bytes() for part in parts) for parts in self.branches)
+
+    def entropy_bits(self, case=None):
+        """均匀选择分支的熵加上各分支熵的平均值"""
+        branches = [_parts_entropy_bits(parts, case) for parts in self.branches]
+        return math.log2(len(branches)) + sum(branches) / len(branches)
+
+    def keyspace_at_least(self, case, limit):
+        total = 0
+        for parts in self.branches:
+            total += _parts_keyspace_at_least(parts, case, limit)
+            if total > limit:
+                break
+        return total
+
+class RegexRepeat:
+    """分组的重复 (...){m,n}: 每行均匀地选取重复次数, 所有重复一次批量生成后按行拼接"""
+
+    kind = 'repeat'
+    fixed_length = False
+
+    def __init__(self, parts, min_count, max_count):
+        self.parts = parts
+        self.min_count = min_count
+        self.max_count = max_count
+        self.counts = IndexSampler(max_count - min_count + 1)
+
+    def column(self, count, rng=random):
+        low = self.min_count
+        if low == self.max_count:
+            repeats = [low] * count
+        else:
+            repeats = [low + n for n in self.counts.draw_indices(count, rng)]
+        items = _join_columns(self.parts, sum(repeats), rng)
+        result = []
+        offset = 0
+        for n in repeats:
+            result.append("".join(items[offset:offset + n]))
+            offset += n
+        return result
+
+    def describe(self):
+        return (self.kind, [part.describe() for part in self.parts], self.min_count, self.max_count)
+
+    def max_bytes(self):
+        return self.max_count * sum(part.max_bytes() for part in self.parts)
+
+    def entropy_bits(self, case=None):
+        """均匀选择重复次数的熵加上期望重复次数乘以每次重复的熵"""
+        choices = self.max_count - self.min_count + 1
+        mean = (self.min_count + self.max_count) / 2
+        return math.log2(choices) + mean * _parts_entropy_bits(self.parts, case)
+
+    def keyspace_at_least(self, case, limit):
+        inner = _parts_keyspace_at_least(self.parts, case, limit)
+        total = 0
+        term = 1  # inner ** n, 超过 limit 后不再增长
+        for n in range(self.max_count + 1):
+            if n >= self.min_count:
+                total += term
+                if total > limit:
+                    break
+            term = min(term * inner, limit + 1)
+        return total
+
+def _regex_parts(sequence):
+    """把语法树序列编译为片段列表, 相邻字面量合并为一个 'str' 片段"""
+    parts = []
+    for node in sequence:
+        kind = node[0]
+        if kind == 'lit':
+            if parts and parts[-1].kind == 'str':
+                parts[-1].value += node[1]
+            else:
+                parts.append(PlanPart('str', node[1]))
+        elif kind == 'set':
+            parts.append(PlanPart('chars', node[1], 1, 1))
+        elif kind == 'rep':
+            _, atom, low, high = node
+            if atom[0] in ('lit', 'set'):
+                # 单个字符或字符类的重复就是表达式模式中的 cc(长度范围; 字符集)
+                parts.append(PlanPart('chars', atom[1], low, high))
+            elif high > 0:
+                inner = _regex_parts([atom])
+                if inner:
+                    parts.append(RegexRepeat(inner, low, high))
+        else:
+            branches = [_regex_parts(branch) for branch in node[1]]
+            if len(branches) == 1:
+                for part in branches[0]:  # 没有选择的分组直接展开
+                    if part.kind == 'str' and parts and parts[-1].kind == 'str':
+                        parts[-1].value += part.value
+                    else:
+                        parts.append(part)
+            elif all(len(b) == 1 and b[0].kind == 'str' and len(b[0].value) == 1 for b in branches) and \
+                    len({b[0].value for b in branches}) == len(branches):
+                # (a|b|c) 与 [abc] 等价
+                parts.append(PlanPart('chars', "".join(b[0].value for b in branches), 1, 1))
+            else:
+                parts.append(RegexAlternation(branches))
+    return parts
+
+def compile_regex(pattern):
+    """把正则表达式编译为 ExpressionPlan (结果被缓存), 语法错误或不支持的语法抛出 ValueError"""
+    plan = _regex_cache.get(pattern)
+    if plan is None:
+        tree = _config_regexes.get(pattern)  # 来自配置缓存的正则无需再解析
+        if tree is None:
+            tree = _RegexParser(pattern).parse()
+        plan = ExpressionPlan(_regex_parts([tree]))
+        if len(_regex_cache) >= _REGEX_CACHE_SIZE:
+            _regex_cache.clear()
+        _regex_cache[pattern] = plan
+    return plan
+
+def _is_regex(text):
+    return len(text) >= 2 and text.startswith('/') and text.endswith('/')
+
+# --- 模式编译与并行生成 ---
+
+def compile_mode(args, min_length, max_length, rng=random, config=None):
+    """
+    把命令行的 -m 模式 (单一模式、表达式或 $引用) 统一编译为 ExpressionPlan。
+    编译期的随机选择 (如 cc 的长度) 取自 rng; $引用从 config (默认为当前配置) 中查找。
+    出错时打印错误并返回 None; 参数不合法时抛出 ValueError。
+    """
+    # --- 处理 $ 引用 ---
+    if args.mode.startswith('$'):
+        if config is None:
+            config = get_config()
+        config_name = args.mode[1:]  # 去掉 $
+        if not config.has_section(config_name):
+            print(f"错误: 配置 '{config_name}' 不存在")
+            return None
+        config_type = get_config_value(config_name, 'type', '', config)
+        config_value = get_config_value(config_name, 'value', '', config)
+        if config_type == 're':
+            if _is_regex(config_value):
+                return compile_regex(config_value[1:-1])
+            return compile_expression(config_value, min_length, max_length, args)
+        elif config_type == 'cc':
+            weights = _option_weights(args)
+            if weights is None and get_config_value(config_name, 'weights', '', config):
+                weights = parse_weights(get_config_value(config_name, 'weights', '', config))
+            length_dist = _option_length_dist(args, min_length, max_length)
+            if args.length is not None:
+                return _compile_charset(str(config_value), args.length, args.length, args.no_repeat, rng, weights)
+            return _compile_charset(str(config_value), min_length, max_length, args.no_repeat, rng,
+                                    weights, length_dist)
+        print(f"错误: 配置 '{config_name}' 的类型无效")
+        return None
+
+    if args.mode.startswith('[') and args.mode.endswith(']'):
+        return compile_expression(args.mode, min_length, max_length, args)
+    if _is_regex(args.mode):
+        return compile_regex(args.mode[1:-1])
+    if args.mode == 'u':
+        return ExpressionPlan([PlanPart('uuid')])
+    if args.mode == 'u7':
+        return ExpressionPlan([PlanPart('uuid7')])
+
+    # --- 单一模式 ---
+    if args.length is not None:  # 指定了 -l
+        current_min_length = current_max_length = args.length
+    elif args.random_length:  # 指定了 -r, 使用配置文件中的 min_length 和 max_length
+        current_min_length, current_max_length = min_length, max_length
+    else:  # 没有指定 -r 或 -l
+        current_min_length = current_max_length = 8
+
+    # 不重复字符检查 (只在指定了 -l 时检查)
+    if args.no_repeat and args.length:
+        max_possible_length = 0
+        if args.mode == 'n':
+            max_possible_length = 10
+        elif args.mode == 'a':
+            max_possible_length = 26 if args.lower or args.upper else 52
+        elif args.mode == 'an':
+            max_possible_length = 36 if args.lower or args.upper else 62
+        elif args.mode == 'cc':
+            max_possible_length = len(set(args.input)) if args.input else 0
+
+        if args.length > max_possible_length:
+            raise ValueError(
+                f"对于模式 '{args.mode}'，使用 '-nr' 时的最大长度为 {max_possible_length}。"
+            )
+
+    length_dist = _option_length_dist(args, min_length, max_length)
+    if args.mode in ('n', 'a', 'an'):
+        charset = _mode_charset(args.mode)  # 大小写由 -s/-S 后处理
+        if args.no_repeat:
+            unique_chars = len(set(charset))
+            current_max_length = min(current_max_length, unique_chars)
+            if length_dist is not None and length_dist.max_length > unique_chars:
+                raise ValueError(f"对于模式 '{args.mode}'，使用 '-nr' 时的最大长度为 {unique_chars}。")
+        return ExpressionPlan([PlanPart('chars', charset, current_min_length, current_max_length, args.no_repeat,
+                                        length_dist=length_dist)])
+    if args.mode == 'cc':
+        if not args.input:
+            raise ValueError("cc 模式需要使用 -i 参数指定字符集")
+        return _compile_charset(args.input, current_min_length, current_max_length, args.no_repeat, rng,
+                                _option_weights(args), length_dist)
+
+    print(f"错误: 未知模式 '{args.mode}'")
+    return None
+
+def _compile_charset(charset, min_length, max_length, no_repeat=False, rng=random, weights=None, length_dist=None):
+    """
+    与 generate_from_charset 一致: 整个任务只选取一次长度;
+    指定了 length_dist 时改为每个字符串按该分布取长度。
+    """
+    if no_repeat and weights:
+        raise ValueError("-nr 不能与字符权重 (-w) 同时使用")
+    if no_repeat:
+        max_possible_length = len(set(charset))
+        if length_dist is not None:
+            if length_dist.max_length > max_possible_length:
+                raise ValueError(f"当不重复时，长度不能超过字符集的唯一字符数 ({max_possible_length})")
+            return ExpressionPlan([PlanPart('chars', charset, no_repeat=True, length_dist=length_dist)])
+        if min_length > max_possible_length:
+            raise ValueError(f"当不重复时，长度不能超过字符集的唯一字符数 ({max_possible_length})")
+        length = rng.randint(min_length, min(max_possible_length, max_length))
+    elif length_dist is not None:
+        return ExpressionPlan([PlanPart('chars', charset, weights=weights or None, length_dist=length_dist)])
+    else:
+        length = rng.randint(min_length, max_length)
+    return ExpressionPlan([PlanPart('chars', charset, length, length, no_repeat, weights=weights or None)])
+
+def _option_weights(options):
+    """取出 -w 指定的字符权重, 可以是逗号分隔的字符串或数值列表"""
+    weights = getattr(options, 'weights', None)
+    if isinstance(weights, str):
+        return parse_weights(weights)
+    return weights
+
+def _option_length_dist(options, min_length, max_length):
+    """取出 --length-dist 指定的长度分布, 可以是分布描述字符串或 LengthDistribution 对象"""
+    length_dist = getattr(options, 'length_dist', None)
+    if isinstance(length_dist, str):
+        return parse_length_distribution(length_dist, min_length, max_length)
+    return length_dist
+
+def _generate_chunk(plan, count, seed, start):
+    """工作进程入口: 用独立种子的随机数生成器生成一块, seed 为 None 时使用 SecureRandom"""
+    rng = get_secure_random() if seed is None else random.Random(seed)
+    return plan.generate(count, rng, start)
+
+def iter_parallel(plan, count, jobs, batch_size=DEFAULT_BATCH_SIZE, secure=False, start=0):
+    """
+    用 jobs 个进程并行生成, 按顺序产出批次。
+    每块使用 os.urandom 派生的独立种子 (secure 时各进程直接使用自己的 SecureRandom),
+    各进程的随机序列互不相关; 同时在途的块数受限, 内存占用与 count 无关。
+    """
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = collections.deque()
+        for size in _iter_batch_sizes(count, batch_size):
+            seed = None if secure else int.from_bytes(os.urandom(32), 'big')
+            pending.append(executor.submit(_generate_chunk, plan, size, seed, start))
+            start += size
+            if len(pending) >= jobs * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# --- 可复现生成 ---
+# 指定 --seed 时, 把序号按 SEED_BLOCK_SIZE 分块, 每块的随机数生成器由 (种子, 计划摘要, 块号)
+# 经 blake2b 派生 (计数器模式)。第 k 个字符串因此只取决于 (种子, 表达式, k):
+# 从任意位置开始生成只需重算所在块的开头部分, 不同进程、不同机器分片生成的结果也完全一致。
+
+SEED_BLOCK_SIZE = 1024
+
+def derive_seed(seed, *labels):
+    """由用户种子和若干标签派生 256 位整数种子"""
+    import hashlib
+    h = hashlib.blake2b(str(seed).encode('utf-8'), digest_size=32, person=b'RandGen-seed')
+    for label in labels:
+        h.update(b'\0' + label)
+    return int.from_bytes(h.digest(), 'big')
+
+class SeededPlan(GenerationPlan):
+    """按序号随机访问的可复现生成计划"""
+
+    def __init__(self, plan, seed):
+        self.plan = plan
+        self.key = derive_seed(seed, plan.fingerprint()).to_bytes(32, 'big')
+
+    def block_rng(self, block):
+        import hashlib
+        digest = hashlib.blake2b(block.to_bytes(8, 'little'), key=self.key, digest_size=32).digest()
+        return _profiled_rng(random.Random(int.from_bytes(digest, 'big')))
+
+    def generate(self, count, rng=random, start=0):
+        """生成序号 [start, start + count) 的字符串, 忽略 rng"""
+        result = []
+        block, offset = divmod(start, SEED_BLOCK_SIZE)
+        while len(result) < count:
+            items = self.plan.generate(SEED_BLOCK_SIZE, self.block_rng(block), block * SEED_BLOCK_SIZE)
+            result.extend(items[offset:offset + count - len(result)])
+            block += 1
+            offset = 0
+        return result
+
+# --- 唯一输出 ---
+# 键空间可枚举时 (所有片段长度固定), 用带密钥的 Feistel 置换把序号 0..count-1 一一映射到
+# 键空间中的随机位置再解码为字符串, 天然不重复且无需记录已生成的字符串;
+# 否则退回到 FingerprintSet, 按 64 位指纹过滤重复并补足数量。
+# 置换和解码都按批进行: Feistel 的每一轮对整批下标一起计算, 半块不超过 16 位时轮函数改为查表;
+# 字符片段按每组若干字符查表解码, 每个字符串只需几次取模和拼接。结果与逐个 decode(permute(i)) 完全相同。
+
+UUID_KEYSPACE_BITS = 122  # UUID4 中随机位的数量
+FEISTEL_ROUNDS = 4
+MAX_FEISTEL_BITS = 1024  # 超过该位数的键空间改用指纹集合
+FEISTEL_TABLE_BITS = 16  # 半块不超过该位数时, 轮函数在计算量超过一张表后改为查表
+DECODE_TABLE_SIZE = 1 << 16  # 解码时每组字符的查找表最多包含的字符串数
+
+def _unique_alphabet(charset, case=None):
+    """应用大小写后按首次出现顺序去重, 保证不同下标对应不同字符"""
+    return "".join(dict.fromkeys(_apply_case(charset, case)))
+
+def _permutations_count(n, k):
+    result = 1
+    for i in range(k):
+        result *= n - i
+    return result
+
+class FeistelPermutation:
+    """
+    [0, size) 上由密钥决定的双射 (格式保持加密)。
+    在覆盖 size 的 2 的偶数次幂的定义域上做平衡 Feistel 网络,
+    结果落在 size 之外时继续迭代 (cycle walking), 期望迭代次数不超过 4。
+    """
+
+    def __init__(self, size, key):
+        import hashlib
+        self._blake2b = hashlib.blake2b
+        self.size = size
+        bits = max(2, (size - 1).bit_length())
+        self.half_bits = (bits + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        self.digest_size = (self.half_bits + 7) // 8
+        self.round_keys = [self._blake2b(key, digest_size=32, person=b'RandGen' + bytes([r])).digest()
+                           for r in range(FEISTEL_ROUNDS)]
+        self._hashers = None  # 已载入轮密钥的哈希对象, 由 _round_many 按需建立 (不能 pickle, 不随计划传给子进程)
+        self._tables = None  # 每轮的轮函数表 (array('H')), 由 permute_many 按需建立
+        self._evaluated = 0  # 未建表时已计算的半块数
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_hashers'] = None
+        return state
+
+    def _round(self, r, value):
+        data = value.to_bytes(self.digest_size, 'little')
+        digest = self._blake2b(data, digest_size=self.digest_size, key=self.round_keys[r]).digest()
+        return int.from_bytes(digest, 'little') & self.half_mask
+
+    def _round_many(self, r, values):
+        """对 values 中的每个半块计算第 r 轮的轮函数"""
+        if self._tables is not None:
+            return list(map(self._tables[r].__getitem__, values))
+        if self._hashers is None:
+            # 每次复制后再输入半块, 省去每次重新处理密钥
+            self._hashers = [self._blake2b(key=round_key, digest_size=self.digest_size) for round_key in self.round_keys]
+        copy, size, mask = self._hashers[r].copy, self.digest_size, self.half_mask
+        from_bytes = int.from_bytes
+        result = []
+        append = result.append
+        for value in values:
+            hasher = copy()
+            hasher.update(value.to_bytes(size, 'little'))
+            append(from_bytes(hasher.digest(), 'little') & mask)
+        return result
+
+    def permute(self, index):
+        half_bits, half_mask = self.half_bits, self.half_mask
+        while True:
+            left, right = index >> half_bits, index & half_mask
+            for r in range(FEISTEL_ROUNDS):
+                left, right = right, left ^ self._round(r, right)
+            index = (left << half_bits) | right
+            if index < self.size:
+                return index
+
+    def permute_many(self, indices):
+        """对整批下标做 permute, 每一轮对整批一起计算; 落在 size 之外的继续迭代"""
+        half_bits, half_mask, size = self.half_bits, self.half_mask, self.size
+        if self._tables is None and half_bits <= FEISTEL_TABLE_BITS:
+            self._evaluated += len(indices)
+            if self._evaluated >= 1 << half_bits:  # 查表的建表开销已经不超过逐个计算
+                values = range(1 << half_bits)
+                self._tables = [array.array('H', self._round_many(r, values)) for r in range(FEISTEL_ROUNDS)]
+        result = list(indices)
+        positions, values = range(len(result)), result
+        while positions:
+            left = [value >> half_bits for value in values]
+            right = [value & half_mask for value in values]
+            for r in range(FEISTEL_ROUNDS):
+                left, right = right, [a ^ b for a, b in zip(left, self._round_many(r, right))]
+            values = [(a << half_bits) | b for a, b in zip(left, right)]
+            walking, walked = [], []
+            for position, value in zip(positions, values):
+                if value < size:
+                    result[position] = value
+                else:
+                    walking.append(position)
+                    walked.append(value)
+            positions, values = walking, walked
+        return result
+
+class KeyspaceEnumerator:
+    """把 [0, size) 中的下标一一解码为计划可能生成的字符串 (混合进制, 最后一个片段为最低位)"""
+
+    def __init__(self, parts, case=None):
+        self.fields = []  # (kind, alphabet 或字面量, 长度, 该片段的取值数)
+        self.size = 1
+        for part in parts:
+            if part.kind == 'str':
+                self.fields.append(('str', _apply_case(part.value, case), 0, 1))
+                continue
+            if part.kind == 'uuid':
+                self.fields.append(('uuid', part.case or case, 0, 1 << UUID_KEYSPACE_BITS))
+                self.size <<= UUID_KEYSPACE_BITS
+                continue
+            alphabet = _unique_alphabet(part.value, part.case or case)
+            length = part.min_length
+            if part.no_repeat:
+                radix = _permutations_count(len(alphabet), length)
+            else:
+                radix = len(alphabet) ** length
+            self.fields.append(('nr' if part.no_repeat else 'chars', alphabet, length, radix))
+            self.size *= radix
+        self._group_tables = {}
+
+    def _group_table(self, alphabet, length):
+        """alphabet 上长度为 length 的所有字符串, 按解码顺序 (第一个字符为最低位) 排列"""
+        key = (alphabet, length)
+        table = self._group_tables.get(key)
+        if table is None:
+            table = self._group_tables[key] = ["".join(reversed(chars))
+                                               for chars in itertools.product(alphabet, repeat=length)]
+        return table
+
+    def _decode_chars(self, alphabet, length, digits):
+        """把一列取值解码为长度为 length 的字符串, 每次按一组字符查表"""
+        size = len(alphabet)
+        group = 1
+        while group < length and size ** (group + 1) <= DECODE_TABLE_SIZE:
+            group += 1
+        column = None
+        while length > 0:
+            step = min(group, length)
+            table, base = self._group_table(alphabet, step), size ** step
+            piece = [table[digit % base] for digit in digits]
+            column = piece if column is None else [a + b for a, b in zip(column, piece)]
+            length -= step
+            if length:
+                digits = [digit // base for digit in digits]
+        return column if column is not None else [""] * len(digits)
+
+    def decode_many(self, indices):
+        """decode 的批量版本; 含 UUID 或不重复片段时逐个解码"""
+        if any(kind in ('uuid', 'nr') for kind, _, _, _ in self.fields):
+            return list(map(self.decode, indices))
+        columns = []
+        for kind, value, length, radix in reversed(self.fields):
+            if kind == 'str':
+                columns.append(itertools.repeat(value))
+                continue
+            columns.append(self._decode_chars(value, length, [index % radix for index in indices]))
+            indices = [index // radix for index in indices]
+        if len(columns) == 1:
+            return list(columns[0]) if self.fields[0][0] == 'chars' else [self.fields[0][1]] * len(indices)
+        return ["".join(pieces) for pieces in zip(*reversed(columns))]
+
+    def decode(self, index):
+        import uuid
+        pieces = []
+        for kind, value, length, radix in reversed(self.fields):
+            if kind == 'str':
+                pieces.append(value)
+                continue
+            index, digit = divmod(index, radix)
+            if kind == 'uuid':
+                # 把 122 个随机位分布到 UUID4 的版本号和变体位两侧
+                bits = ((digit >> 74) << 80) | (4 << 76) | (((digit >> 62) & 0xfff) << 64) \
+                    | (0b10 << 62) | (digit & ((1 << 62) - 1))
+                pieces.append(_apply_case(str(uuid.UUID(int=bits)), value))
+            elif kind == 'chars':
+                size = len(value)
+                chars = []
+                for _ in range(length):
+                    digit, d = divmod(digit, size)
+                    chars.append(value[d])
+                pieces.append("".join(chars))
+            else:
+                # 不重复: 阶乘进制 (Lehmer 码) 解码为排列
+                pool = list(value)
+                chars = []
+                for _ in range(length):
+                    digit, d = divmod(digit, len(pool))
+                    chars.append(pool.pop(d))
+                pieces.append("".join(chars))
+        return "".join(reversed(pieces))
+
+class UniquePlan(GenerationPlan):
+    """保证不重复的生成计划: 第 i 个字符串 = decode(permute(i))"""
+
+    def __init__(self, enumerator, key):
+        self.enumerator = enumerator
+        self.permutation = FeistelPermutation(enumerator.size, key)
+
+    def generate(self, count, rng=random, start=0):
+        return self.enumerator.decode_many(self.permutation.permute_many(range(start, start + count)))
+
+def _fingerprint(item):
+    """字符串的稳定 64 位指纹 (跨进程一致), 0 保留为空槽"""
+    return _fingerprint_bytes(item.encode('utf-8'))
+
+def _fingerprint_bytes(data):
+    """UTF-8 编码后的字符串的指纹, 与 _fingerprint 一致"""
+    import hashlib
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little') or 1
+
+class FingerprintSet:
+    """
+    以 64 位指纹为元素、线性探测的开放寻址哈希集合, 底层为 array('Q'), 每个元素约占 16 字节。
+    指纹碰撞只会让少量新字符串被误判为重复, 不会放过真正的重复。
+    """
+
+    def __init__(self, capacity=1 << 16):
+        self.table = array.array('Q', bytes(8 * capacity))
+        self.mask = capacity - 1
+        self.size = 0
+
+    def _insert(self, fp):
+        table, mask = self.table, self.mask
+        i = fp & mask
+        while True:
+            slot = table[i]
+            if slot == 0:
+                table[i] = fp
+                self.size += 1
+                return True
+            if slot == fp:
+                return False
+            i = (i + 1) & mask
+
+    def _grow(self):
+        old = self.table
+        self.table = array.array('Q', bytes(16 * len(old)))
+        self.mask = len(self.table) - 1
+        self.size = 0
+        for fp in old:
+            if fp:
+                self._insert(fp)
+
+    def add(self, item):
+        """加入 item, 之前不存在时返回 True"""
+        if (self.size + 1) * 2 > len(self.table):
+            self._grow()
+        return self._insert(_fingerprint(item))
+
+    def __contains__(self, item):
+        table, mask = self.table, self.mask
+        fp = _fingerprint(item)
+        i = fp & mask
+        while table[i]:
+            if table[i] == fp:
+                return True
+            i = (i + 1) & mask
+        return False
+
+    def __len__(self):
+        return self.size
+
+def _keyspace_at_least(plan, case, limit):
+    """计算计划的键空间大小, 超过 limit 后提前返回 (避免计算巨大的整数)"""
+    return _parts_keyspace_at_least(plan.parts, case, limit)
+
+def _parts_keyspace_at_least(parts, case, limit):
+    total = 1
+    for part in parts:
+        if part.kind == 'str':
+            continue
+        if part.kind == 'uuid':
+            total <<= UUID_KEYSPACE_BITS
+        elif part.kind == 'uuid7':
+            total <<= 48 + UUID7_COUNTER_BITS
+        elif part.kind in ('alt', 'repeat'):
+            total *= part.keyspace_at_least(case, limit)
+        else:
+            charset = part.value
+            if part.weights is not None:  # 权重为 0 的字符不会出现
+                charset = "".join(c for c, w in zip(charset, part.weights) if w > 0)
+            k = len(_unique_alphabet(charset, part.case or case))
+            options = 0
+            for length in range(part.min_length, part.max_length + 1):
+                options += _permutations_count(k, length) if part.no_repeat else k ** length
+                if options * total > limit:
+                    break
+            total *= options
+        if total > limit:
+            return total
+    return total
+
+def _has_uuid7(parts):
+    """片段列表 (含正则的选择和重复分支) 中是否有 u7 片段"""
+    for part in parts:
+        if part.kind == 'uuid7':
+            return True
+        if part.kind == 'alt' and any(_has_uuid7(branch) for branch in part.branches):
+            return True
+        if part.kind == 'repeat' and _has_uuid7(part.parts):
+            return True
+    return False
+
+def compile_unique(plan, count, case=None, rng=random):
+    """
+    为 --unique 准备生成计划, 返回 (plan, seen):
+    键空间可枚举时返回 UniquePlan 和 None; 否则返回原计划和用于过滤的 FingerprintSet。
+    count 超过键空间时抛出 ValueError。
+    """
+    keyspace = _keyspace_at_least(plan, case, count)
+    if count > keyspace:
+        raise ValueError(f"错误: 请求数量 {count} 超过了可生成的不同字符串总数 {keyspace}")
+
+    # UUIDv7 含时间戳, 不可枚举; 它本身在进程内单调递增, 由指纹集合兜底
+    # 加权采样和长度分布不是均匀分布, 不能用均匀的键空间枚举代替, 同样由指纹集合过滤
+    enumerable = all(part.kind in ('str', 'uuid') or
+                     (part.kind == 'chars' and part.fixed_length and part.weights is None)
+                     for part in plan.parts)
+    if enumerable:
+        enumerator = KeyspaceEnumerator(plan.parts, case)
+        if enumerator.size.bit_length() <= MAX_FEISTEL_BITS:
+            return UniquePlan(enumerator, rng.randbytes(32)), None
+    return plan, FingerprintSet()
+
+def iter_unique(batches, count, seen):
+    """从 (可能无限的) 批次流中过滤掉重复项, 产出恰好 count 个不重复的字符串"""
+    return iter_filtered(batches, count, seen.add)
+
+def iter_filtered(batches, count, keep=None):
+    """
+    从 (可能无限的) 批次流中保留 keep(item) 为真的项 (keep 为 None 时保留全部), 产出恰好 count 个;
+    批次流提前结束时抛出 ValueError
+    """
+    remaining = count
+    for batch in batches:
+        if remaining <= 0:
+            return
+        if keep is None:
+            fresh = batch
+        else:
+            with profile_stage('unique'):
+                fresh = [item for item in batch if keep(item)]
+        if len(fresh) > remaining:
+            fresh = fresh[:remaining]
+        remaining -= len(fresh)
+        yield fresh
+    if remaining > 0:
+        raise ValueError(f"错误: 可生成的字符串不足, 还缺少 {remaining} 个")
+
+# --- 排除索引 ---
+# --exclude FILE 中已发放的令牌 (每行一个) 被转换为排好序的 64 位指纹数组, 保存在配置文件旁的
+# RandGen.exclude 目录中并以内存映射方式打开, 不会把令牌读成 Python 字符串。
+# 查找时先按指纹的高位查桶表得到一个约含 128 个条目的区间, 再在映射上二分查找。
+# 指纹相同而字符串不同的概率约为 条目数 / 2^64, 误判只会让一个新字符串被多重新生成一次, 不会漏掉已发放的令牌。
+# 建立索引时按块排序后归并 (外部排序), 内存占用与文件大小无关; 源文件的大小或修改时间变化后自动重建。
+#
+# 索引文件: 文件头 (magic, 源文件大小, 源文件修改时间 ns, 条目数, 桶位数 k) | 桶表 (2^k + 1 个起始下标) | 指纹数组
+
+EXCLUDE_INDEX_DIR = 'RandGen.exclude'
+EXCLUDE_MAGIC = b'RGEXC002'
+_EXCLUDE_FIELDS = '<8sQQQQ'
+EXCLUDE_HEADER = 40
+EXCLUDE_RUN_SIZE = 1 << 23  # 外部排序每块的指纹数 (64 MiB)
+EXCLUDE_BUCKET_BITS_MAX = 24
+
+def _read_fingerprints(path, chunk_size=1 << 16):
+    """逐个产出 path 中保存的指纹"""
+    with open(path, 'rb') as file:
+        while True:
+            chunk = array.array('Q')
+            try:
+                chunk.fromfile(file, chunk_size)
+            except EOFError:
+                pass  # 最后一块不足 chunk_size
+            if not chunk:
+                return
+            yield from chunk
+
+def _spill_run(chunk, directory):
+    """把一块指纹排序后写入临时文件"""
+    import tempfile
+    np = _get_numpy()
+    fd, run_path = tempfile.mkstemp(dir=directory, suffix='.run')
+    with os.fdopen(fd, 'wb') as file:
+        if np is not None:
+            file.write(np.sort(np.frombuffer(chunk, dtype=np.uint64)).tobytes())
+        else:
+            array.array('Q', sorted(chunk)).tofile(file)
+    return run_path
+
+def _iter_line_fingerprints(source):
+    """逐块产出 source 中每个非空行的指纹 (array('Q'))"""
+    import hashlib
+    blake2b = hashlib.blake2b
+    with open(source, 'rb') as file:
+        while True:
+            lines = file.readlines(1 << 24)
+            if not lines:
+                return
+            yield array.array('Q', [int.from_bytes(blake2b(line, digest_size=8).digest(), 'little') or 1
+                                    for line in (raw.rstrip(b'\r\n') for raw in lines) if line])
+
+def build_exclusion_index(source, path):
+    """读取 source (每行一个令牌) 建立指纹索引并原子地写入 path, 返回条目数"""
+    import heapq
+    import struct
+    import tempfile
+    directory = os.path.dirname(path) or '.'
+    stat = os.stat(source)
+    runs = []
+    total = 0
+    try:
+        chunk = array.array('Q')
+        for fingerprints in _iter_line_fingerprints(source):
+            chunk.extend(fingerprints)
+            if len(chunk) >= EXCLUDE_RUN_SIZE:
+                runs.append(_spill_run(chunk, directory))
+                total += len(chunk)
+                chunk = array.array('Q')
+        runs.append(_spill_run(chunk, directory))
+        total += len(chunk)
+
+        bits = min(EXCLUDE_BUCKET_BITS_MAX, max(0, total.bit_length() - 7))
+        shift = 64 - bits
+        buckets = array.array('Q', bytes(8 * ((1 << bits) + 1)))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as out:
+            out.write(bytes(EXCLUDE_HEADER + 8 * len(buckets)))
+            count = 0
+            next_bucket = 0
+            previous = None
+            pending = array.array('Q')
+            for value in heapq.merge(*(_read_fingerprints(run) for run in runs)):
+                if value == previous:
+                    continue
+                previous = value
+                bucket = value >> shift
+                while next_bucket <= bucket:
+                    buckets[next_bucket] = count
+                    next_bucket += 1
+                pending.append(value)
+                count += 1
+                if len(pending) >= 1 << 16:
+                    pending.tofile(out)
+                    pending = array.array('Q')
+            pending.tofile(out)
+            for i in range(next_bucket, len(buckets)):
+                buckets[i] = count
+            out.seek(0)
+            out.write(struct.pack(_EXCLUDE_FIELDS, EXCLUDE_MAGIC, stat.st_size, stat.st_mtime_ns, count, bits))
+            buckets.tofile(out)
+            out.flush()
+            os.fsync(out.fileno())
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    finally:
+        for run in runs:
+            os.unlink(run)
+    return count
+
+class ExclusionIndex:
+    """只读的指纹索引, `item in index` 在内存映射的有序数组上查找"""
+
+    def __init__(self, path):
+        import mmap
+        import struct
+        with open(path, 'rb') as file:
+            header = file.read(EXCLUDE_HEADER)
+            if len(header) < EXCLUDE_HEADER or header[:8] != EXCLUDE_MAGIC:
+                raise ValueError(f"错误: {path} 不是排除索引文件")
+            _, self.source_size, self.source_mtime, self.count, bits = struct.unpack(_EXCLUDE_FIELDS, header)
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._shift = 64 - bits
+        view = memoryview(self._map)
+        table_end = EXCLUDE_HEADER + 8 * ((1 << bits) + 1)
+        self._buckets = view[EXCLUDE_HEADER:table_end].cast('Q')
+        self._values = view[table_end:table_end + 8 * self.count].cast('Q')
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, item):
+        return self.hits([_fingerprint(item)])[0]
+
+    def hits(self, fingerprints):
+        """对每个指纹返回它是否在索引中"""
+        np = _get_numpy() if len(fingerprints) >= 64 else None
+        if np is not None and self.count:
+            values = np.frombuffer(self._values, dtype=np.uint64)
+            queries = np.array(fingerprints, dtype=np.uint64)
+            positions = np.minimum(np.searchsorted(values, queries), self.count - 1)
+            return (values[positions] == queries).tolist()
+        import bisect
+        bisect_left = bisect.bisect_left
+        values, buckets, shift, count = self._values, self._buckets, self._shift, self.count
+        result = []
+        for fp in fingerprints:
+            bucket = fp >> shift
+            i = bisect_left(values, fp, buckets[bucket], buckets[bucket + 1])
+            result.append(i < count and values[i] == fp)
+        return result
+
+    def close(self):
+        self._buckets.release()
+        self._values.release()
+        self._map.close()
+
+def _fingerprints(items):
+    """批量计算 _fingerprint"""
+    import hashlib
+    blake2b = hashlib.blake2b
+    return [int.from_bytes(blake2b(item.encode('utf-8'), digest_size=8).digest(), 'little') or 1 for item in items]
+
+def iter_excluding(batches, indexes):
+    """从每批中去掉命中任一排除索引的字符串"""
+    for batch in batches:
+        with profile_stage('exclude'):
+            fingerprints = _fingerprints(batch)
+            excluded = [False] * len(batch)
+            for index in indexes:
+                excluded = [a or b for a, b in zip(excluded, index.hits(fingerprints))]
+            batch = [item for item, hit in zip(batch, excluded) if not hit]
+        yield batch
+
+def open_exclusion_index(source, index_dir='.'):
+    """打开 source 的排除索引, 不存在或已过期时先建立; 索引保存在 index_dir/RandGen.exclude 中"""
+    import hashlib
+    if not os.path.isfile(source):
+        raise ValueError(f"错误: 排除文件 {source} 不存在")
+    directory = os.path.join(index_dir, EXCLUDE_INDEX_DIR)
+    os.makedirs(directory, exist_ok=True)
+    key = hashlib.blake2b(f"{os.path.abspath(source)}|{sys.byteorder}".encode('utf-8'), digest_size=8).hexdigest()
+    path = os.path.join(directory, f"{os.path.basename(source)}.{key}.idx")
+    stat = os.stat(source)
+    if os.path.exists(path):
+        index = ExclusionIndex(path)
+        if (index.source_size, index.source_mtime) == (stat.st_size, stat.st_mtime_ns):
+            return index
+        index.close()
+    print(f"正在建立排除索引: {source}", file=sys.stderr)
+    build_exclusion_index(source, path)
+    return ExclusionIndex(path)
+
+# --- 计算熵值函数 ---
+def calculate_entropy(s):
+    """计算字符串的经验熵值 (每个字符的比特数), 适用于任意 Unicode 字符"""
+    length = len(s)
+    if length < 2:
+        return 0.0
+    distinct = len(set(s))
+    if distinct == length:  # 没有重复字符时每个字符的频率相同
+        return math.log2(length)
+    if distinct == length - 1:  # 恰好一个字符出现两次
+        return math.log2(length) - 2 / length
+    return math.log2(length) - sum(c * math.log2(c) for c in collections.Counter(s).values() if c > 1) / length
+
+# --- 熵 ---
+# 理论强度: 由编译后的计划直接计算每个字符串的熵 (比特), 不做任何采样。
+# 各片段独立生成, 因此总熵为各片段之和; 字符集片段的熵 = 长度分布的熵 + 各长度下字符部分的期望熵,
+# 所有字符等概率且长度固定时即为 log2(键空间)。不同片段的组合恰好拼出相同字符串时实际熵会略低, 因此这是上界。
+# 统计: EntropyStats 在输出的同一遍中累计字符直方图、卡方均匀性检验和单个字符串熵的最小值 / 平均值。
+
+UUID7_RANDOM_BITS = 32  # 每个 UUIDv7 中不可预测的位数 (计数器可由同一毫秒内的前一个推出)
+
+def _distribution_bits(weights):
+    """离散分布 (权重不必归一化) 的熵 (比特)"""
+    total = sum(weights)
+    return -sum(w / total * math.log2(w / total) for w in weights if w > 0)
+
+def _length_pmf(part):
+    """字符集片段的长度分布: [(长度, 概率)]"""
+    dist = part.length_dist
+    if isinstance(dist, DiscreteLength):
+        total = sum(dist.weights)
+        return [(length, weight / total) for length, weight in zip(dist.lengths, dist.weights)]
+    low, high = (dist.min_length, dist.max_length) if dist is not None else (part.min_length, part.max_length)
+    return [(length, 1 / (high - low + 1)) for length in range(low, high + 1)]
+
+def _chars_entropy_bits(part, case):
+    charset = part.value
+    if not charset:
+        return 0.0
+    case = part.case or case
+    pmf = _length_pmf(part)
+    bits = _distribution_bits([p for _, p in pmf])
+    if part.no_repeat:
+        n = len(_unique_alphabet(charset, case))
+        # log2(n! / (n - L)!): 长度为 L 的不重复排列均匀分布
+        return bits + sum(p * (math.lgamma(n + 1) - math.lgamma(n - length + 1)) / math.log(2) for length, p in pmf)
+    merged = collections.Counter()  # 应用大小写后相同的字符合并概率
+    for char, weight in zip(charset, part.weights or itertools.repeat(1)):
+        merged[_apply_case(char, case)] += weight
+    per_char = _distribution_bits(list(merged.values()))
+    return bits + per_char * sum(length * p for length, p in pmf)
+
+def _parts_entropy_bits(parts, case=None):
+    """片段列表 (逐行拼接) 的理论熵 (比特)"""
+    total = 0.0
+    for part in parts:
+        if part.kind == 'uuid':
+            total += UUID_KEYSPACE_BITS
+        elif part.kind == 'uuid7':
+            total += UUID7_RANDOM_BITS
+        elif part.kind in ('alt', 'repeat'):
+            total += part.entropy_bits(case)
+        elif part.kind != 'str':
+            total += _chars_entropy_bits(part, case)
+    return total
+
+def plan_entropy(plan, case=None):
+    """
+    编译后的 ExpressionPlan 的理论强度: 返回 (每个字符串的总熵, [(片段描述, 熵)]), 单位为比特。
+    case 为 -s / -S 的全局大小写转换。
+    """
+    parts = [(_part_label(part), _parts_entropy_bits([part], case)) for part in plan.parts]
+    return sum(bits for _, bits in parts), parts
+
+def _chi_square_p_value(chi_square, df):
+    """卡方分布的上尾概率, 用 Wilson–Hilferty 正态近似 (自由度较大时足够精确)"""
+    z = ((chi_square / df) ** (1 / 3) - (1 - 2 / (9 * df))) / math.sqrt(2 / (9 * df))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+def _string_entropies(batch, text):
+    """batch 中每个字符串的 calculate_entropy, text 为 batch 拼接后的字符串; 安装了 NumPy 时整批向量化计算"""
+    np = _get_numpy()
+    if np is None:
+        return list(map(calculate_entropy, batch))
+    lengths = np.fromiter(map(len, batch), dtype=np.int64, count=len(batch))
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype='<u4').astype(np.int64)
+    rows = np.repeat(np.arange(len(batch), dtype=np.int64), lengths)
+    keys = np.sort((rows << 21) | codes)  # 码点小于 2^21, (行, 字符) 排序后相同字符相邻
+    if not len(keys):
+        return [0.0] * len(batch)
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    counts = np.diff(np.append(starts, len(keys))).astype(np.float64)
+    weighted = np.bincount(keys[starts] >> 21, weights=counts * np.log2(counts), minlength=len(batch))
+    safe = np.maximum(lengths, 1)
+    entropies = np.where(lengths > 1, np.log2(safe) - weighted / safe, 0.0)
+    return entropies.tolist()
+
+class EntropyStats:
+    """在输出的同一遍中累计的熵统计, 每批调用一次 update, 内存占用只与出现过的字符种数有关"""
+
+    def __init__(self):
+        self.histogram = collections.Counter()
+        self.strings = 0
+        self.characters = 0
+        self.min_entropy = None
+        self.entropy_sum = 0.0
+
+    def update(self, batch):
+        if not batch:
+            return
+        text = "".join(batch)
+        self.histogram.update(text)
+        self.strings += len(batch)
+        self.characters += len(text)
+        entropies = _string_entropies(batch, text)
+        self.entropy_sum += sum(entropies)
+        lowest = min(entropies)
+        if self.min_entropy is None or lowest < self.min_entropy:
+            self.min_entropy = lowest
+
+    def report(self):
+        """
+        返回统计结果: 字符熵 (char_entropy) 与同样字符种数下均匀分布的熵 (uniform_entropy) 对比,
+        卡方检验的原假设为 "出现过的字符等概率", p 值很小说明字符分布不均匀
+        (权重、大小写转换或表达式中的字面量都会造成这种结果)。
+        """
+        alphabet = len(self.histogram)
+        result = {
+            'strings': self.strings,
+            'characters': self.characters,
+            'alphabet': alphabet,
+            'char_entropy': _distribution_bits(list(self.histogram.values())) if alphabet else 0.0,
+            'uniform_entropy': math.log2(alphabet) if alphabet else 0.0,
+            'min_string_entropy': self.min_entropy or 0.0,
+            'mean_string_entropy': self.entropy_sum / self.strings if self.strings else 0.0,
+        }
+        if alphabet > 1:
+            expected = self.characters / alphabet
+            chi_square = sum((observed - expected) ** 2 for observed in self.histogram.values()) / expected
+            result.update(chi_square=chi_square, degrees_of_freedom=alphabet - 1,
+                          p_value=_chi_square_p_value(chi_square, alphabet - 1))
+        return result
+
+def format_entropy_report(strength=None, stats=None, seeded=False):
+    """把理论强度 (plan_entropy 的结果) 和 EntropyStats 格式化为多行文本"""
+    lines = []
+    if strength is not None:
+        total, parts = strength
+        lines.append(f"理论强度: 每个字符串 {total:.2f} 比特")
+        if len(parts) > 1:
+            lines += [f"  {label:<40} {bits:>10.2f} 比特" for label, bits in parts]
+        if seeded:
+            lines.append("  注意: 使用 --seed 时输出完全由种子决定, 实际强度不超过种子本身的熵")
+    if stats is not None and stats.strings:
+        report = stats.report()
+        lines.append(f"统计: {report['strings']:,} 个字符串, {report['characters']:,} 个字符, "
+                     f"{report['alphabet']} 种字符")
+        lines.append(f"  字符熵: {report['char_entropy']:.4f} 比特/字符 (同样字符种数的均匀分布为 "
+                     f"{report['uniform_entropy']:.4f})")
+        if 'chi_square' in report:
+            lines.append(f"  卡方: {report['chi_square']:.2f} (自由度 {report['degrees_of_freedom']}, "
+                         f"p = {report['p_value']:.4f})")
+        lines.append(f"  单个字符串的熵: 最小 {report['min_string_entropy']:.4f}, "
+                     f"平均 {report['mean_string_entropy']:.4f} 比特/字符")
+    return "\n".join(lines)
+
+# --- 库接口 ---
+
+class GenerateOptions:
+    """生成参数, 字段与命令行参数同名, 未指定的字段取类属性中的默认值"""
+
+    mode = None
+    count = 1
+    length = None
+    random_length = False
+    lower = False
+    upper = False
+    no_repeat = False
+    input = None
+    jobs = 1
+    secure = False
+    unique = False
+    seed = None
+    start = 0
+    weights = None
+    length_dist = None
+    exclude = None
+
+    def __init__(self, mode, **kwargs):
+        self.mode = mode
+        for key, value in kwargs.items():
+            if not hasattr(GenerateOptions, key):
+                raise TypeError(f"未知的生成参数: {key}")
+            setattr(self, key, value)
+
+class RandGen:
+    """
+    RandGen 的库接口, 配置显式传入:
+        gen = RandGen(min_length=1, max_length=64)
+        gen.generate("[an(10),'@test.com']", count=5)
+        for batch in gen.iter_batches('n', count=10**8, length=12):
+            ...
+    config 可以是 ConfigParser 对象; 只给出 config_path 时在首次引用 $配置 时才读取该文件,
+    两者都不给出时使用模块的当前配置。构造和生成过程都不会写入任何文件。
+    """
+
+    def __init__(self, config_path=None, min_length=None, max_length=None, config=None):
+        self._config = config
+        self._config_path = config_path
+        self._min_length = min_length
+        self._max_length = max_length
+
+    @property
+    def config(self):
+        if self._config is None:
+            if self._config_path is None:
+                self._config = get_config()
+            elif os.path.exists(self._config_path):
+                with profile_stage('config'):
+                    self._config = _read_config(self._config_path)
+            else:
+                self._config = configparser.ConfigParser(interpolation=None)  # 禁用插值
+        return self._config
+
+    @property
+    def min_length(self):
+        if self._min_length is None:
+            return get_config_value('Settings', 'min_length', 1, self.config)
+        return self._min_length
+
+    @property
+    def max_length(self):
+        if self._max_length is None:
+            return get_config_value('Settings', 'max_length', 32767, self.config)
+        return self._max_length
+
+    @property
+    def index_dir(self):
+        """排除索引等派生文件所在的目录: 配置文件所在的目录"""
+        return os.path.dirname(os.path.abspath(self._config_path or config_file))
+
+    def compile(self, options, rng=random):
+        """把 GenerateOptions (或同名字段的对象) 编译为 ExpressionPlan, 失败时返回 None"""
+        config = self.config
+        with profile_stage('compile'):
+            return compile_mode(options, self.min_length, self.max_length, rng, config)
+
+    def run(self, options):
+        """
+        按 options 生成, 返回字符串批次的迭代器。
+        参数冲突或无法满足 (如 --unique 的数量超过键空间) 时抛出 ValueError。
+        """
+        prepared = self.prepare(options)
+        if prepared is None:
+            return iter(())
+        return prepared.batches()
+
+    def prepare(self, options):
+        """校验并编译 options, 返回 PreparedRun; 编译失败时返回 None, 参数不合法时抛出 ValueError"""
+        if options.jobs < 1:
+            raise ValueError("错误: -j 必须大于 0")
+        if options.seed is not None and options.secure:
+            raise ValueError("错误: --seed 与 --secure 不能同时使用")
+        if options.start < 0:
+            raise ValueError("错误: --start 不能为负数")
+        if options.start and options.seed is None:
+            raise ValueError("错误: --start 需要与 --seed 一起使用")
+
+        rng = get_secure_random() if options.secure else random
+        compile_rng = rng if options.seed is None else random.Random(derive_seed(options.seed, b'compile'))
+        source = plan = self.compile(options, compile_rng)
+        if plan is None:
+            return None
+        if _has_uuid7(getattr(plan, 'parts', ())):
+            # UUIDv7 由进程内的时钟和计数器生成: 多个进程各自计数, 种子也无法复现时间戳
+            if options.jobs > 1:
+                raise ValueError("错误: u7 只在同一进程内单调递增, 不能与 -j 一起使用")
+            if options.seed is not None:
+                raise ValueError("错误: u7 含时间戳, 结果不可复现, 不能与 --seed (或 --checkpoint) 一起使用")
+
+        case = 'lower' if options.lower else 'upper' if options.upper else None
+        count, seen = options.count, None
+        if options.unique:
+            key_rng = rng if options.seed is None else \
+                random.Random(derive_seed(options.seed, b'unique', plan.fingerprint()))
+            plan, seen = compile_unique(plan, options.count, case, key_rng)
+            if seen is not None:
+                count = None  # 无限生成, 由 iter_unique 在够数后停止
+            elif options.start + options.count > plan.enumerator.size:
+                # 序号超出键空间后会与前面的序号重复, 分片之间就不再互不重复
+                raise ValueError(f"错误: --start {options.start} 加上数量 {options.count} "
+                                 f"超过了可生成的不同字符串总数 {plan.enumerator.size}")
+        if options.seed is not None and not isinstance(plan, UniquePlan):
+            # UniquePlan 本身就是按序号生成的, 只需用种子派生密钥
+            plan = SeededPlan(plan, options.seed)
+
+        exclusions = [index if isinstance(index, ExclusionIndex) else open_exclusion_index(index, self.index_dir)
+                      for index in options.exclude or ()]
+        if exclusions:
+            # 命中排除索引的字符串被丢弃, 持续生成直到够数; 可枚举的键空间则最多枚举到末尾
+            count = plan.enumerator.size - options.start if isinstance(plan, UniquePlan) else None
+        return PreparedRun(options, source, plan, rng, count, case, seen is not None, exclusions)
+
+    def iter_batches(self, mode, **options):
+        """流式生成, options 同 GenerateOptions 的字段"""
+        return self.run(GenerateOptions(mode, **options))
+
+    def generate(self, mode, count=1, **options):
+        """生成 count 个字符串并以列表返回"""
+        return [item for batch in self.iter_batches(mode, count=count, **options) for item in batch]
+
+class PreparedRun:
+    """
+    RandGen.prepare 的结果: source 为编译出的 ExpressionPlan, plan 为按 --unique / --seed 包装后实际执行的计划。
+    每次调用 batches() 都重新开始生成; generated 为本次调用已经生成 (过滤之前) 的字符串数。
+    """
+
+    def __init__(self, options, source, plan, rng, count, case, filter_duplicates, exclusions=()):
+        self.options = options
+        self.source = source
+        self.plan = plan
+        self.rng = rng
+        self.count = count  # None 表示无限生成, 由去重或排除过滤在够数后停止
+        self.case = case
+        self.filter_duplicates = filter_duplicates
+        self.exclusions = exclusions
+        self.generated = 0
+
+    def batches(self, skip=0, emitted=0):
+        """
+        逐批产出结果。skip 和 emitted 用于从检查点继续: 跳过前 skip 个生成的字符串
+        (计划必须按序号生成, 即指定了种子), 并且只再产出 count - emitted 个。
+        """
+        options = self.options
+        profiler = _profiler
+        start = options.start + skip
+        count = self.count - skip if self.count is not None else None
+        if options.jobs > 1:
+            batches = iter_parallel(self.plan, count, options.jobs, secure=options.secure, start=start)
+        else:
+            batches = self.plan.iter_batches(count, rng=_profiled_rng(self.rng), start=start)
+        self.generated = 0
+        batches = self._tracked(batches)
+        if profiler is not None:
+            batches = profiler.timed_batches('generate', batches, allocations=True)
+        # --- 后处理：应用 -s 和 -S 选项 ---
+        if self.case:
+            batches = _iter_case(batches, self.case)
+        if self.exclusions:
+            batches = iter_excluding(batches, self.exclusions)
+        if self.filter_duplicates:
+            batches = iter_unique(batches, options.count - emitted, FingerprintSet())
+        elif self.exclusions:
+            batches = iter_filtered(batches, options.count - emitted)
+        if profiler is not None:
+            batches = _iter_counted(batches, profiler)
+        return batches
+
+    def _tracked(self, batches):
+        # 后处理每取一批只向上游取一批, 因此下游产出第 i 批时 generated 恰好是前 i 批生成的数量
+        for batch in batches:
+            self.generated += len(batch)
+            yield batch
+
+def _iter_case(batches, case):
+    for batch in batches:
+        with profile_stage('case'):
+            batch = [_apply_case(item, case) for item in batch]
+        yield batch
+
+def _iter_counted(batches, profiler):
+    """剖析时统计输出的字符串数和字符数"""
+    for batch in batches:
+        profiler.count('strings', len(batch))
+        profiler.count('characters', sum(map(len, batch)))
+        yield batch
+
+def write_output(batches, output=None, hash_algorithms=None, echo=True, stats=None, record_format='lines',
+                 size=None):
+    """
+    把批次在同一遍中输出到控制台 (echo)、文件 (output)、计算哈希并累计熵统计 (stats 为 EntropyStats),
+    返回 [(算法, 摘要)]。内存占用只与批大小有关。
+    size 为预先知道的输出字节数 (见 output_size), 给出时先为文件分配好空间。
+    """
+    hasher = MultiHasher(hash_algorithms) if hash_algorithms else None
+    file = open(output, 'wb', buffering=OUTPUT_BUFFER_SIZE) if output else None
+    writer = RecordWriter(file, hasher, record_format=record_format) \
+        if file is not None or hasher is not None else None
+
+    preallocated = False
+    try:
+        if file is not None and size:
+            preallocated = _preallocate(file, size)
+        for batch in batches:
+            if echo:
+                print_batch(batch)
+            if stats is not None:
+                with profile_stage('entropy'):
+                    stats.update(batch)
+            if writer is not None:
+                writer.write(batch)
+    finally:
+        if file is not None:
+            if preallocated:
+                try:
+                    file.truncate(file.tell())  # 中途出错时去掉预分配的多余部分
+                except OSError:
+                    pass  # 尽力而为, 不能掩盖生成过程中的异常
+            file.close()
+    return hasher.hexdigests() if hasher is not None else []
+
+# --- 检查点 ---
+# write_checkpointed 与 write_output 相同, 但每隔 interval 秒把输出文件 flush + fsync,
+# 然后把进度原子地写入旁边的检查点文件 (<输出文件>.ckpt, JSON):
+# 种子、已输出的字符串数、已生成的字符串数 (过滤之前)、输出文件的字节数和此时各哈希算法对已写入部分的摘要。
+# 生成计划按 (种子, 序号) 随机访问, 因此种子和已生成数就是完整的随机数状态, 继续时直接从该序号开始生成。
+# hashlib 的中间状态无法保存, 继续时把输出文件截断到检查点的字节数并重新计算这部分的哈希 (顺序读取, 远快于生成),
+# 与检查点中的摘要核对后继续, 最终的文件和摘要与一次跑完完全相同。
+
+CHECKPOINT_VERSION = 1
+CHECKPOINT_INTERVAL = 60.0  # 默认的检查点间隔 (秒)
+_CHECKPOINT_FIELDS = ('mode', 'count', 'length', 'random_length', 'lower', 'upper', 'no_repeat', 'input',
+                      'unique', 'seed', 'start', 'weights', 'length_dist', 'exclude')
+
+def checkpoint_path(output):
+    return output + '.ckpt'
+
+def load_checkpoint(output):
+    """读取 output 的检查点, 不存在时返回 None"""
+    import json
+    path = checkpoint_path(output)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as file:
+        try:
+            state = json.load(file)
+        except ValueError:
+            raise ValueError(f"错误: 检查点文件 {path} 已损坏") from None
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f"错误: 不支持的检查点版本: {path}")
+    return state
+
+def _save_checkpoint(output, state):
+    """原子地写入检查点: 先写临时文件并 fsync, 再替换, 最后 fsync 所在目录"""
+    import json
+    path = checkpoint_path(output)
+    temp = path + '.tmp'
+    with open(temp, 'w', encoding='utf-8') as file:
+        json.dump(state, file, ensure_ascii=False)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp, path)
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:  # Windows 不能打开目录, 由 os.replace 保证原子性
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _checkpoint_key(options, hash_algorithms, record_format):
+    """决定输出内容的参数, 继续时必须与检查点一致"""
+    key = {field: getattr(options, field, None) for field in _CHECKPOINT_FIELDS}
+    key['hash'] = list(hash_algorithms or [])
+    key['format'] = record_format
+    return key
+
+def write_checkpointed(prepared, output, hash_algorithms=None, echo=True, stats=None,
+                       interval=CHECKPOINT_INTERVAL, resume=False, record_format='lines'):
+    """
+    带检查点地把 prepared (RandGen.prepare 的结果, 必须指定了种子) 的输出写入 output, 返回 [(算法, 摘要)]。
+    resume 为 True 且存在检查点时从检查点继续; 已完成的任务直接返回记录的摘要。
+    """
+    import time
+    options = prepared.options
+    if options.seed is None:
+        raise ValueError("错误: 检查点需要 --seed")
+    if prepared.filter_duplicates:
+        raise ValueError("错误: 需要按指纹去重的 --unique (长度不固定等) 不支持检查点")
+    key = _checkpoint_key(options, hash_algorithms, record_format)
+    state = load_checkpoint(output) if resume else None
+    if state is not None and state['key'] != key:
+        raise ValueError(f"错误: 检查点 {checkpoint_path(output)} 与当前参数不一致, 请使用相同的参数或去掉 --resume")
+    if state is not None and state['complete']:
+        return [tuple(item) for item in state['digests']]
+
+    hasher = MultiHasher(hash_algorithms) if hash_algorithms else None
+    records = generated = 0
+    if state is not None:
+        records, generated, offset = state['records'], state['generated'], state['offset']
+        file = open(output, 'r+b', buffering=OUTPUT_BUFFER_SIZE)
+        file.truncate(offset)  # 丢弃检查点之后写入的数据
+        if hasher is not None:
+            with profile_stage('rehash'):
+                while file.tell() < offset:
+                    hasher.update(file.read(min(OUTPUT_BUFFER_SIZE, offset - file.tell())))
+            if [list(item) for item in hasher.snapshot()] != state['digests']:
+                file.close()
+                raise ValueError(f"错误: {output} 已写入部分的哈希与检查点不一致, 文件可能已被修改")
+        file.seek(offset)
+    else:
+        file = open(output, 'wb', buffering=OUTPUT_BUFFER_SIZE)
+    writer = RecordWriter(file, hasher, record_format=record_format, index=records)
+    writer.first = records == 0
+
+    def save(complete=False):
+        file.flush()
+        os.fsync(file.fileno())
+        digests = hasher.snapshot() if hasher is not None else []
+        _save_checkpoint(output, {
+            'version': CHECKPOINT_VERSION, 'key': key, 'complete': complete,
+            'records': records, 'generated': generated + prepared.generated, 'offset': file.tell(),
+            'digests': [list(item) for item in digests],
+        })
+        return digests
+
+    try:
+        last = time.monotonic()
+        for batch in prepared.batches(generated, records):
+            if echo:
+                print_batch(batch)
+            if stats is not None:
+                with profile_stage('entropy'):
+                    stats.update(batch)
+            writer.write(batch)
+            records += len(batch)
+            if time.monotonic() - last >= interval:
+                with profile_stage('checkpoint'):
+                    save()
+                last = time.monotonic()
+        digests = save(complete=True)
+    finally:
+        file.close()
+        if hasher is not None:
+            hasher.hexdigests()  # 释放线程池
+    return digests
+
+# --- 分片输出 ---
+# write_shards 把输出按记录数或字节数切分成多个分片文件, 分三个阶段流水线执行:
+# 主线程生成、编码记录并切分; 压缩线程池把每块数据独立压缩; 每个分片由一个写线程按顺序写盘并计算摘要
+# (zlib/bz2/lzma 和 hashlib 处理大块数据时都会释放 GIL)。最后写出记录各分片文件名、记录数、大小和摘要的清单 (JSON)。
+
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'bz2': '.bz2', 'lzma': '.xz'}
+GZIP_LEVEL = 6  # gzip 模块默认的 9 级压缩慢得多, 压缩率却只略高
+COMPRESS_CHUNK_SIZE = 1 << 20  # 独立压缩的数据块大小 (字节)
+SHARD_QUEUE_DEPTH = 16  # 每个分片在写线程中排队的最大数据块数
+MANIFEST_HASH = 'sha256'  # 未指定 -hash 时清单中使用的摘要算法
+
+def parse_size(text):
+    """解析字节数, 支持 K/M/G/T 后缀 (1024 进制), 例如 64M"""
+    text = text.strip().upper().rstrip('B')
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    scale = units.get(text[-1:], 1)
+    if scale > 1:
+        text = text[:-1]
+    try:
+        size = int(float(text) * scale)
+    except ValueError:
+        raise ValueError(f"错误: 无效的大小 '{text}'") from None
+    if size < 1:
+        raise ValueError("错误: 大小必须大于 0")
+    return size
+
+def shard_path(output, index, sharded=True, compression=None):
+    """
+    第 index 个分片的文件名。output 中含有 {shard} 时按其格式化 (例如 part-{shard:04d}.txt),
+    否则在第一个扩展名前插入 -00000; 需要压缩且 output 没有对应后缀时追加后缀。
+    """
+    suffix = COMPRESSION_SUFFIXES[compression] if compression else ''
+    if '{shard' in output:
+        path = output.format(shard=index)
+    elif sharded:
+        directory, name = os.path.split(output)
+        stem, dot, ext = name.partition('.')
+        path = os.path.join(directory, f"{stem}-{index:05d}{dot}{ext}")
+    else:
+        path = output
+    if suffix and not path.endswith(suffix):
+        path += suffix
+    return path
+
+def _compress_chunk(data, compression):
+    """
+    把一块数据压缩成一个完整的 gzip 成员 / bz2 流 / xz 流。
+    多个成员 (流) 首尾相接仍是合法的压缩文件, gzip -d、bzip2 -d、xz -d 和 Python 的对应模块都能直接读取,
+    因此同一分片的各块可以并行压缩。压缩结果不含时间戳, 相同输入总是得到相同的文件。
+    """
+    with profile_stage('compress'):
+        return _compress(data, compression)
+
+def _compress(data, compression):
+    if compression == 'gzip':
+        import zlib
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits=31: gzip 格式, mtime 为 0
+        return compressor.compress(data) + compressor.flush()
+    if compression == 'bz2':
+        import bz2
+        return bz2.compress(data)
+    import lzma
+    return lzma.compress(data)
+
+def _write_shard(path, chunks, algorithms):
+    """写线程: 从 chunks 队列按顺序取数据块 (bytes 或压缩任务的 future) 直到 None, 返回 (文件字节数, [(算法, 摘要)])"""
+    hasher = MultiHasher(algorithms, threads=False)  # 各分片已在不同线程中并行
+    size = 0
+    try:
+        with open(path, 'wb', buffering=OUTPUT_BUFFER_SIZE) as file:
+            while True:
+                data = chunks.get()
+                if data is None:
+                    break
+                if not isinstance(data, bytes):
+                    data = data.result()
+                with profile_stage('write'):
+                    file.write(data)
+                hasher.update(data)
+                size += len(data)
+    except BaseException:
+        while chunks.get() is not None:  # 继续取走数据, 以免生产者在满队列上阻塞
+            pass
+        raise
+    return size, hasher.hexdigests()
+
+class _ShardSink:
+    """
+    RecordWriter 的输出目标: 把编码好的数据攒成约 COMPRESS_CHUNK_SIZE 的块,
+    需要压缩时提交到压缩线程池, 再按顺序放入分片写线程的队列。
+    """
+
+    def __init__(self, chunks, compression=None, compressors=None):
+        self.chunks = chunks
+        self.compression = compression
+        self.compressors = compressors
+        self.pending = []
+        self.pending_size = 0
+        self.size = 0  # 未压缩的字节数
+
+    def write(self, data):
+        self.pending.append(data)
+        self.pending_size += len(data)
+        if self.pending_size >= COMPRESS_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        data = b"".join(self.pending)
+        self.size += len(data)
+        self.pending, self.pending_size = [], 0
+        if self.compression:
+            self.chunks.put(self.compressors.submit(_compress_chunk, data, self.compression))
+        else:
+            self.chunks.put(data)
+
+    def close(self):
+        self.flush()
+        self.chunks.put(None)
+
+def _records_within(batch, limit, writer):
+    """batch 开头最多有多少条记录 (按 writer 的格式编码, 含分隔符) 的总字节数不超过 limit, 返回 (记录数, 字节数)"""
+    import bisect
+    records = writer.records(batch)
+    if "".join(records).isascii():
+        sizes = [len(record) for record in records]
+    else:
+        sizes = [len(record.encode(writer.encoding)) for record in records]
+    first = writer.first
+    totals = list(itertools.accumulate(sizes))
+    take = bisect.bisect_right(totals, limit)
+    if take == 0 and first:
+        take = 1  # 单条记录超过分片大小时独占一个分片
+    return take, totals[take - 1] if take else 0
+
+def write_shards(batches, output, shard_records=None, shard_bytes=None, compression=None,
+                 hash_algorithms=None, writers=None, manifest=None, echo=False, stats=None, encoding=None,
+                 record_format='lines'):
+    """
+    把批次写成若干分片文件, 每个分片最多 shard_records 条记录或 shard_bytes 字节 (未压缩),
+    都为 None 时只写一个文件。compression 为 gzip / bz2 / lzma 或 None, record_format 见 RECORD_FORMATS。
+    写完后把清单写到 manifest (默认 output 去掉 {shard} 部分后加 .manifest.json) 并返回清单。
+    """
+    import concurrent.futures
+    import json
+    import queue
+    if shard_records is not None and shard_records < 1:
+        raise ValueError("错误: 每个分片的记录数必须大于 0")
+    if compression is not None and compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"错误: 不支持的压缩格式 '{compression}'")
+    if encoding is None:
+        import locale
+        encoding = locale.getpreferredencoding(False)
+    algorithms = list(hash_algorithms or [MANIFEST_HASH])
+    sharded = shard_records is not None or shard_bytes is not None
+    writers = writers or min(4, os.cpu_count() or 1)
+
+    shards = []  # [[路径, 记录数, 未压缩字节数, future]]
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=writers)
+    compressors = concurrent.futures.ThreadPoolExecutor(max_workers=writers) if compression else None
+    writer = sink = None
+    records = written = emitted = 0
+
+    def close_shard():
+        nonlocal writer, sink
+        sink.close()
+        shards[-1][1:3] = records, sink.size
+        writer = sink = None
+
+    try:
+        for batch in batches:
+            if echo:
+                print_batch(batch)
+            if stats is not None:
+                with profile_stage('entropy'):
+                    stats.update(batch)
+            while batch:
+                if writer is None:
+                    for shard in shards:
+                        if shard[3].done():
+                            shard[3].result()  # 尽早报告写线程中的错误 (例如磁盘已满)
+                    chunks = queue.Queue(SHARD_QUEUE_DEPTH)
+                    path = shard_path(output, len(shards), sharded, compression)
+                    shards.append([path, 0, 0, executor.submit(_write_shard, path, chunks, algorithms)])
+                    sink = _ShardSink(chunks, compression, compressors)
+                    writer = RecordWriter(sink, encoding=encoding, record_format=record_format, index=emitted)
+                    records = written = 0
+                if shard_records is not None:
+                    take = min(len(batch), shard_records - records)
+                    full = records + take == shard_records
+                elif shard_bytes is not None:
+                    take, size = _records_within(batch, shard_bytes - written, writer)
+                    written += size
+                    full = take < len(batch) or written >= shard_bytes
+                else:
+                    take, full = len(batch), False
+                if take:
+                    writer.write(batch[:take] if take < len(batch) else batch)
+                    records += take
+                    emitted += take
+                    batch = batch[take:]
+                if full:
+                    close_shard()
+        if writer is not None:
+            close_shard()
+    finally:
+        if sink is not None:
+            sink.chunks.put(None)
+        executor.shutdown(wait=True)  # 写线程可能还在等待压缩结果, 因此先于压缩线程池关闭
+        if compressors is not None:
+            compressors.shutdown(wait=True)
+
+    entries = []
+    for path, count, size, future in shards:
+        file_size, digests = future.result()
+        entry = {'file': os.path.basename(path), 'records': count, 'size': size, 'bytes': file_size}
+        entry.update(digests)
+        entries.append(entry)
+    report = {
+        'records': sum(entry['records'] for entry in entries),
+        'compression': compression,
+        'hash_algorithms': algorithms,
+        'shards': entries,
+    }
+    if manifest is None:
+        import re
+        manifest = re.sub(r'[-_.]?\{shard[^}]*\}', '', output) + '.manifest.json'
+    temp = manifest + '.tmp'
+    with open(temp, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    os.replace(temp, manifest)
+    report['manifest'] = manifest
+    return report
+
+# --- 基准测试 ---
+# run_benchmarks 在独立的子进程中逐项运行标准测试矩阵 (每项单独测量峰值内存),
+# 报告 strings/sec、bytes/sec 和峰值 RSS, 结果为 JSON, 可与之前的结果对比以发现性能回退。
+# 子进程异常退出的项记为失败 (结果中有 error 字段), 其余各项照常运行。
+
+BENCH_COUNTS = {'quick': 10000, 'standard': 100000, 'full': 1000000}
+BENCH_CHARSET_CJK = "".join(chr(0x4e00 + i) for i in range(500))
+BENCH_POLL_SECONDS = 1.0  # 等待子进程结果时检查其是否仍在运行的间隔
+
+def _bench_cases():
+    """返回标准测试矩阵: [(名称, 模式, 生成参数, 输出文件, 哈希)]"""
+    cases = [('u', 'u', {})]
+    for length in (8, 32, 128):
+        cases.append((f'n-{length}', 'n', {'length': length}))
+        cases.append((f'a-{length}', 'a', {'length': length}))
+        cases.append((f'an-{length}', 'an', {'length': length}))
+        cases.append((f'cc-hex-{length}', 'cc', {'length': length, 'input': '0123456789abcdef'}))
+        cases.append((f'cc-cjk-{length}', 'cc', {'length': length, 'input': BENCH_CHARSET_CJK}))
+    cases += [
+        ('n-nr-10', 'n', {'length': 10, 'no_repeat': True}),
+        ('an-nr-32', 'an', {'length': 32, 'no_repeat': True}),
+        ('cc-cjk-nr-64', 'cc', {'length': 64, 'no_repeat': True, 'input': BENCH_CHARSET_CJK}),
+        ('an-r', 'an', {'random_length': True}),
+        ('expr-email', "[an(10;nr),'@test.com']", {}),
+        ('expr-prefix', "['1',n(10;nr),'K']", {}),
+        ('expr-mixed', "[u(S),'-',cc(4;xyz;S),a(3;s),an(8)]", {}),
+        ('expr-random-length', "[a(4;S),'-',an(r)]", {}),
+        ('ref-re', '$bench_re', {}),
+        ('ref-cc', '$bench_cc', {'length': 16}),
+    ]
+    matrix = [(name, mode, options, False, None) for name, mode, options in cases]
+    for name, mode, options in cases:
+        if name in ('u', 'an-32', 'expr-email'):
+            matrix.append((f'{name}+hash', mode, options, False, 'n'))
+            matrix.append((f'{name}+output', mode, options, True, None))
+            matrix.append((f'{name}+output+hash', mode, options, True, 'n'))
+    return matrix
+
+def _bench_config():
+    """基准测试使用的内存配置, 不读写 RandGen.ini"""
+    config = configparser.ConfigParser(interpolation=None)
+    config['Settings'] = {'min_length': '1', 'max_length': '64'}
+    config['bench_re'] = {'type': 're', 'value': "[a(4;S),'-',n(8)]"}
+    config['bench_cc'] = {'type': 'cc', 'value': '0123456789ABCDEF'}
+    return config
+
+def _peak_rss_kb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def _run_bench_case(case, count, workdir, queue):
+    """子进程入口: 运行一项测试, 把结果放入 queue"""
+    import time
+    name, mode, options, to_file, hashes = case
+    gen = RandGen(config=_bench_config())
+    totals = [0, 0, 0.0]  # 字符串数, 字节数, 统计本身的耗时 (从总耗时中扣除)
+
+    def counted(batches):
+        for batch in batches:
+            counting = time.perf_counter()
+            totals[0] += len(batch)
+            totals[1] += len("\n".join(batch).encode('utf-8')) + 1
+            totals[2] += time.perf_counter() - counting
+            yield batch
+
+    output = os.path.join(workdir, f'{name}.txt') if to_file else None
+    started = time.perf_counter()
+    write_output(counted(gen.iter_batches(mode, count=count, **options)), output,
+                 parse_hashes(hashes) if hashes else None, echo=False)
+    elapsed = time.perf_counter() - started - totals[2]
+    if output:
+        os.remove(output)
+    queue.put({
+        'name': name,
+        'mode': mode,
+        'options': options,
+        'output': to_file,
+        'hash': hashes,
+        'count': totals[0],
+        'bytes': totals[1],
+        'seconds': round(elapsed, 6),
+        'strings_per_sec': round(totals[0] / elapsed, 1) if elapsed else None,
+        'bytes_per_sec': round(totals[1] / elapsed, 1) if elapsed else None,
+        'peak_rss_kb': _peak_rss_kb(),
+    })
+
+def _bench_result(process, queue):
+    """等待子进程的结果; 子进程未放入结果就退出 (崩溃、被杀死) 时返回 None, 不会一直等待"""
+    import queue as queue_module
+    while True:
+        try:
+            return queue.get(timeout=BENCH_POLL_SECONDS)
+        except queue_module.Empty:
+            if not process.is_alive():
+                break
+    try:  # 结果可能恰好在子进程退出前放入
+        return queue.get(timeout=BENCH_POLL_SECONDS)
+    except queue_module.Empty:
+        return None
+
+def run_benchmarks(scale='standard', only=None):
+    """
+    运行基准测试并返回 JSON 可序列化的报告。
+    scale 决定每项的生成数量 (quick / standard / full); only 为名称子串时只运行匹配的项。
+    子进程异常退出的项以 {name, mode, options, output, hash, error} 记录。
+    """
+    import multiprocessing
+    import platform
+    import tempfile
+    import time
+
+    count = BENCH_COUNTS[scale]
+    ctx = multiprocessing.get_context('spawn')  # 每项使用全新进程, 峰值内存互不影响
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for case in _bench_cases():
+            if only and only not in case[0]:
+                continue
+            queue = ctx.Queue()
+            process = ctx.Process(target=_run_bench_case, args=(case, count, workdir, queue))
+            process.start()
+            result = _bench_result(process, queue)
+            process.join()
+            if result is None:
+                name, mode, options, to_file, hashes = case
+                result = {'name': name, 'mode': mode, 'options': options, 'output': to_file, 'hash': hashes,
+                          'error': f"子进程异常退出 (exitcode {process.exitcode})"}
+                results.append(result)
+                print(f"{name:<28} 失败: {result['error']}", file=sys.stderr)
+                continue
+            results.append(result)
+            print(f"{result['name']:<28} {result['strings_per_sec']:>14,.0f} str/s "
+                  f"{result['bytes_per_sec'] / 1e6:>10.2f} MB/s  rss {result['peak_rss_kb']} KB", file=sys.stderr)
+    return {
+        'scale': scale,
+        'count': count,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': bool(_get_numpy()),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+def compare_benchmarks(baseline, report, threshold=0.1):
+    """对比两份报告, 返回 strings/sec 下降超过 threshold 的项: [(名称, 旧值, 新值)]"""
+    old = {item['name']: item.get('strings_per_sec') for item in baseline['results']}
+    regressions = []
+    for item in report['results']:
+        before = old.get(item['name'])
+        if before and 'error' not in item and item['strings_per_sec'] < before * (1 - threshold):
+            regressions.append((item['name'], before, item['strings_per_sec']))
+    return regressions
+
+# --- 令牌池服务 ---
+# 常驻进程为每个 $配置 维护一个预先生成的令牌池, 请求直接从池中取出, 省去每次启动解释器、读取配置和写临时文件的开销。
+# 后台线程在池深度低于低水位时补充到容量; 每次只生成一小批, 避免长时间占用 GIL 拉高取令牌的尾延迟。
+# 池中令牌一律使用 SecureRandom 生成。
+
+POOL_DEFAULT_SIZE = 100000
+POOL_REFILL_BATCH = 1024
+POOL_MAX_TAKE = 100000  # 单次请求最多取出的令牌数
+SERVE_DEFAULT_ADDRESS = '127.0.0.1:8765'
+
+class TokenPool:
+    """
+    单个配置的令牌池: take(n) 取出令牌, 后台线程负责补充。
+    补充线程和各请求线程 (池中不足时) 并发调用 plan.generate, 共享的 rng 必须是线程安全的 (如 SecureRandom)。
+    """
+
+    def __init__(self, name, plan, size=POOL_DEFAULT_SIZE, low_water=None, rng=None):
+        import threading
+        self.name = name
+        self.plan = plan
+        self.size = size
+        self.low_water = size // 4 if low_water is None else low_water
+        self.rng = rng or get_secure_random()
+        self._tokens = collections.deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+        self._stopping = False
+        # 指标
+        self.taken = 0
+        self.misses = 0  # 池中不足而同步生成的令牌数
+        self.refills = 0
+        self.refilled = 0
+        self.refill_seconds = 0.0
+
+    def start(self):
+        """启动后台补充线程; 已经启动时不做任何事"""
+        import threading
+        if self.running:
+            return self
+        self._thread = threading.Thread(target=self._refill_loop, name=f"pool-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _refill_loop(self):
+        import time
+        while True:
+            with self._lock:
+                while not self._stopping and len(self._tokens) >= self.low_water:
+                    self._wakeup.wait()
+                if self._stopping:
+                    return
+                missing = self.size - len(self._tokens)
+            started = time.perf_counter()
+            produced = 0
+            while produced < missing and not self._stopping:
+                batch = self.plan.generate(min(POOL_REFILL_BATCH, missing - produced), self.rng)
+                with self._lock:
+                    self._tokens.extend(batch)
+                produced += len(batch)
+            with self._lock:
+                self.refills += 1
+                self.refilled += produced
+                self.refill_seconds += time.perf_counter() - started
+
+    def fill(self):
+        """在当前线程中把池补充到容量, 用于启动前预先填满"""
+        while True:
+            with self._lock:
+                missing = self.size - len(self._tokens)
+            if missing <= 0:
+                return
+            batch = self.plan.generate(min(POOL_REFILL_BATCH, missing), self.rng)
+            with self._lock:
+                self._tokens.extend(batch)
+
+    def try_take(self, n):
+        """池中至少有 n 个令牌时取出并返回, 否则返回 None (不生成)"""
+        with self._lock:
+            tokens = self._tokens
+            if len(tokens) < n:
+                return None
+            result = [tokens.popleft() for _ in range(n)]
+            self.taken += n
+            if len(tokens) < self.low_water:
+                self._wakeup.notify()
+        return result
+
+    def take(self, n):
+        """取出 n 个令牌; 池中不足时同步生成差额"""
+        with self._lock:
+            tokens = self._tokens
+            available = min(n, len(tokens))
+            result = [tokens.popleft() for _ in range(available)]
+            self.taken += n
+            self.misses += n - available
+            if len(tokens) < self.low_water:
+                self._wakeup.notify()
+        if available < n:
+            result.extend(self.plan.generate(n - available, self.rng))
+        return result
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'depth': len(self._tokens),
+                'size': self.size,
+                'low_water': self.low_water,
+                'taken': self.taken,
+                'misses': self.misses,
+                'refills': self.refills,
+                'refilled': self.refilled,
+                'refill_rate': self.refilled / self.refill_seconds if self.refill_seconds else 0.0,
+            }
+
+def create_pools(gen, names=None, size=POOL_DEFAULT_SIZE, low_water=None):
+    """为 names (默认为配置中除 Settings 外的所有配置) 编译生成计划并创建令牌池, 编译失败时抛出 ValueError"""
+    if names is None:
+        names = [section for section in gen.config.sections() if section != 'Settings']
+    pools = {}
+    for name in names:
+        plan = gen.compile(GenerateOptions('$' + name), get_secure_random())
+        if plan is None:
+            raise ValueError(f"错误: 无法为配置 '{name}' 创建令牌池")
+        pools[name] = TokenPool(name, plan, size, low_water)
+    return pools
+
+def _pool_handler(pools):
+    import http.server
+    import json
+    import urllib.parse
+
+    class PoolRequestHandler(http.server.BaseHTTPRequestHandler):
+        """GET /take/<配置>?n=N 返回以换行分隔的令牌; GET /metrics 返回各池的 JSON 指标"""
+
+        protocol_version = 'HTTP/1.1'  # 保持连接, 调用方可复用
+        wbufsize = -1  # 响应头和正文合并为一次发送, 避免 Nagle 与延迟确认叠加造成 40ms 的等待
+
+        def _reply(self, status, body, content_type='text/plain; charset=utf-8'):
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            if url.path == '/metrics':
+                metrics = {name: pool.metrics() for name, pool in pools.items()}
+                self._reply(200, json.dumps(metrics, ensure_ascii=False), 'application/json')
+                return
+            prefix, _, name = url.path.partition('/take/')
+            if prefix or not name:
+                self._reply(404, "未知路径\n")
+                return
+            pool = pools.get(urllib.parse.unquote(name))
+            if pool is None:
+                self._reply(404, f"配置 '{name}' 不存在\n")
+                return
+            query = urllib.parse.parse_qs(url.query)
+            try:
+                n = int(query.get('n', ['1'])[0])
+            except ValueError:
+                n = -1
+            if not 0 < n <= POOL_MAX_TAKE:
+                self._reply(400, f"n 必须在 1 到 {POOL_MAX_TAKE} 之间\n")
+                return
+            self._reply(200, "\n".join(pool.take(n)) + "\n")
 
-# 检查配置文件是否存在，如果不存在，则创建
-if not os.path.exists(config_file):
-    config['Settings'] = {'min_length': '1', 'max_length': '32767'}
-    with open(config_file, 'w') as configfile:
-        config.write(configfile)
+        def address_string(self):
+            # Unix 套接字没有客户端地址
+            return self.client_address[0] if self.client_address else 'unix'
 
-config.read(config_file)
+        def log_message(self, format, *args):
+            pass  # 不为每个请求写日志
 
-def get_config_value(section, key, default_value):
-    """获取配置值，根据 key 决定是否转换为整数"""
+    return PoolRequestHandler
+
+def make_pool_server(pools, address=SERVE_DEFAULT_ADDRESS):
+    """创建 HTTP 服务: address 为 'host:port' 或 'unix:/path/to.sock'"""
+    import http.server
+    import socketserver
+    handler = _pool_handler(pools)
+    if address.startswith('unix:'):
+        path = address[5:]
+        if os.path.exists(path):
+            os.unlink(path)  # 清理上次遗留的套接字文件
+
+        class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        return UnixHTTPServer(path, handler)
+    host, _, port = address.rpartition(':')
+    return http.server.ThreadingHTTPServer((host or '127.0.0.1', int(port)), handler)
+
+def serve_pools(gen, address=SERVE_DEFAULT_ADDRESS, names=None, size=POOL_DEFAULT_SIZE, low_water=None):
+    """启动令牌池服务并一直运行到 Ctrl+C"""
+    pools = create_pools(gen, names, size, low_water)
+    if not pools:
+        raise ValueError("错误: 没有可用的配置, 请先用 -m w -add 添加")
+    server = make_pool_server(pools, address)
+    for pool in pools.values():
+        pool.start()
+    print(f"令牌池服务已启动: {address} (配置: {', '.join(pools)})", file=sys.stderr)
     try:
-        value = config.get(section, key)
-        if key in ('min_length', 'max_length'):
-            return int(value)  # 将字符串转换为整数
-        elif key == 'value':
-            return value.replace('%', '%%')  # 处理%
-        else:
-            return value  # 其他情况直接返回字符串
-    except (configparser.NoSectionError, configparser.NoOptionError, ValueError):
-        return default_value
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for pool in pools.values():
+            pool.stop()
+        if address.startswith('unix:') and os.path.exists(address[5:]):
+            os.unlink(address[5:])
 
+# --- 异步接口 ---
+# 供 asyncio 服务使用: 生成、写出和哈希都在 executor (默认为事件循环的线程池) 中运行, 不阻塞事件循环。
+# aiter_batches 在后台线程中逐批生成, 通过有界队列交给协程: 队列满时生产者等待, 内存占用只与 queue_size 有关;
+# 迭代提前结束或所在任务被取消时, 生产者最多再生成完当前一批就停止。
+# 请求处理中的小批量取令牌使用 AsyncTokenPool: 令牌池预先填满, 池中足够时直接取出, 不经过 executor。
 
-def set_config_value(section, key, value):
-    """设置配置值，如果 section 不存在则创建"""
-    if not config.has_section(section):
-        config.add_section(section)
-    config.set(section, key, value)
-    with open(config_file, 'w') as configfile:
-        config.write(configfile)
+ASYNC_QUEUE_DEPTH = 4  # 异步迭代时最多预先生成的批数
 
+async def aiter_batches(function, *args, queue_size=ASYNC_QUEUE_DEPTH, executor=None, **kwargs):
+    """
+    在 executor 中调用 function(*args, **kwargs) 并迭代其返回的批次, 以异步迭代器逐批产出。
+    executor 必须是线程池 (默认使用事件循环的默认线程池)。function 抛出的异常在迭代时重新抛出。
+    """
+    import asyncio
+    import threading
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    slots = threading.Semaphore(queue_size)
+    stopping = threading.Event()
 
-def apply_operation(value, operation, operand):
+    def deliver(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:  # 事件循环已关闭
+            stopping.set()
+
+    def produce():
+        batches = None
+        try:
+            batches = iter(function(*args, **kwargs))
+            while True:
+                slots.acquire()  # 先占到队列中的空位再生成下一批
+                if stopping.is_set():
+                    return
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                deliver((batch, None))
+            deliver((None, None))
+        except Exception as e:
+            deliver((None, e))
+        finally:
+            close = getattr(batches, 'close', None)
+            if close is not None:
+                close()
+
+    loop.run_in_executor(executor, produce)
     try:
-        operand = int(operand)
-        if operation == '+':
-            return value + operand
-        elif operation == '-':
-            return value - operand
-        elif operation == '*':
-            return value * operand
-        elif operation == '/':
-            if operand == 0:
-                raise ValueError("Cannot divide by zero.")
-            return value / operand
-        else:
-            raise ValueError("Unsupported operation.")
-    except ValueError:
-        print(f"Error applying operation {operation} with operand {operand}.")
-        return value
+        while True:
+            batch, error = await queue.get()
+            if batch is None:
+                if error is not None:
+                    raise error
+                return
+            slots.release()
+            yield batch
+    finally:
+        stopping.set()
+        slots.release()  # 唤醒等待空位的生产者, 使其看到 stopping 后退出
 
-# --- 生成函数 ---
+class AsyncTokenPool:
+    """TokenPool 的异步包装: await take(n) 优先从预先填满的池中取出, 池中不足时在 executor 中生成差额"""
 
-def generate_uuid(count):
-    return [str(uuid.uuid4()) for _ in range(count)]
+    def __init__(self, pool, executor=None):
+        self.pool = pool
+        self.executor = executor
 
-def generate_numeric(min_length, max_length, count, no_repeat=False):
-    result = []
-    for _ in range(count):
-        if no_repeat:
-            max_possible_length = 10
-            length = random.randint(min_length, min(max_length, max_possible_length))
-            result.append("".join(random.sample(string.digits, length)))
-        else:
-            length = random.randint(min_length, max_length)
-            result.append("".join(random.choices(string.digits, k=length)))
-    return result
+    async def start(self):
+        """在 executor 中把池填满, 再启动后台补充线程; 已经启动时 (如 async with await agen.pool(...)) 直接返回"""
+        import asyncio
+        if self.pool.running:
+            return self
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.pool.fill)
+        self.pool.start()
+        return self
 
-def generate_alpha(min_length, max_length, count, case_sensitive='', no_repeat=False):
-    if case_sensitive == 'lower':
-        charset = string.ascii_lowercase
-    elif case_sensitive == 'upper':
-        charset = string.ascii_uppercase
-    else:
-        charset = string.ascii_letters
-
-    result = []
-    for _ in range(count):
-        if no_repeat:
-            max_possible_length = len(set(charset))
-            length = random.randint(min_length, min(max_length, max_possible_length))
-            result.append("".join(random.sample(charset, length)))
-        else:
-            length = random.randint(min_length, max_length)
-            result.append("".join(random.choices(charset, k=length)))
-    return result
+    async def take(self, n):
+        tokens = self.pool.try_take(n)
+        if tokens is None:
+            import asyncio
+            tokens = await asyncio.get_running_loop().run_in_executor(self.executor, self.pool.take, n)
+        return tokens
 
-def generate_alphanumeric(min_length, max_length, count, case_sensitive='', no_repeat=False):
-    if case_sensitive == 'lower':
-        charset = string.ascii_lowercase + string.digits
-    elif case_sensitive == 'upper':
-        charset = string.ascii_uppercase + string.digits
-    else:
-        charset = string.ascii_letters + string.digits
-
-    result = []
-    for _ in range(count):
-        if no_repeat:
-            max_possible_length = len(set(charset))
-            length = random.randint(min_length, min(max_length, max_possible_length))
-            result.append("".join(random.sample(charset, length)))
-        else:
-            length = random.randint(min_length, max_length)
-            result.append("".join(random.choices(charset, k=length)))
-    return result
+    def metrics(self):
+        return self.pool.metrics()
 
-def generate_from_charset(charset, min_length, max_length, count, no_repeat=False):
-    """从给定字符集生成随机字符串"""
-    if no_repeat:
-        max_possible_length = len(set(charset))
-        if min_length > max_possible_length:
-            raise ValueError(f"当不重复时，长度不能超过字符集的唯一字符数 ({max_possible_length})")
-        length = random.randint(min_length, min(max_possible_length, max_length))
-    else:
-        length = random.randint(min_length, max_length)
+    async def aclose(self):
+        import asyncio
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.pool.stop)
 
-    if not charset:
-        return [''] * count
+    async def __aenter__(self):
+        return await self.start()
 
-    result = []
-    for _ in range(count):
-        if no_repeat:
-            result.append("".join(random.sample(charset, length)))
-        else:
-            result.append("".join(random.choices(charset, k=length)))
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
 
-    return result
+class AsyncRandGen:
+    """
+    RandGen 的 asyncio 接口:
+        agen = AsyncRandGen(RandGen(min_length=1, max_length=64))
+        async for batch in agen.iter_batches('[an(32)]', count=10**7):
+            ...
+        tokens = await agen.generate('[an(16)]', count=10)
+        async with await agen.pool('[an(32)]', size=10000) as pool:
+            token, = await pool.take(1)
+    """
 
-def generate_hash(file_path, hash_algorithm):
-    hash_obj = hashlib.new(hash_algorithm)
-    with open(file_path, 'rb') as f:
-        while chunk := f.read(8192):
-            hash_obj.update(chunk)
-    return hash_obj.hexdigest()
+    def __init__(self, gen=None, executor=None, queue_size=ASYNC_QUEUE_DEPTH):
+        self.gen = gen if gen is not None else RandGen()
+        self.executor = executor
+        self.queue_size = queue_size
 
-def parse_hashes(hash_string):
-    """解析哈希算法字符串，支持 'n' 和 'a'"""
-    if hash_string == 'n':
-        return ['md5', 'sha1', 'sha256', 'sha512']
-    elif hash_string == 'a':
-        return ['md5', 'sha1', 'sha256', 'sha512', 'sha3_224', 'sha3_256', 'sha3_384', 'sha3_512']
-    else:
-        algorithms = hash_string.split(',')
-        valid_algorithms = []
-        for algo in algorithms:
-            algo = algo.lower().strip()  # 统一转为小写并去除空格
-            if algo in hashlib.algorithms_available:
-                valid_algorithms.append(algo)
-            else:
-                print(f"警告: 不支持的哈希算法 '{algo}'，已忽略")
-        return valid_algorithms
+    async def _run(self, function, *args, **kwargs):
+        import asyncio
+        import functools
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, functools.partial(function, *args, **kwargs))
 
-# --- 表达式解析 ---
+    def iter_batches(self, mode, **options):
+        """RandGen.iter_batches 的异步版本 (编译也在 executor 中进行), 返回异步迭代器"""
+        return aiter_batches(self.gen.iter_batches, mode, queue_size=self.queue_size, executor=self.executor,
+                             **options)
 
-def parse_expression(expression):
+    async def generate(self, mode, count=1, **options):
+        """生成 count 个字符串并以列表返回"""
+        return await self._run(self.gen.generate, mode, count, **options)
+
+    async def write(self, mode, output=None, hash_algorithms=None, record_format='lines', **options):
+        """生成并写入 output (可为 None) 同时计算哈希, 返回 [(算法, 摘要)]"""
+        def run():
+            return write_output(self.gen.iter_batches(mode, **options), output, hash_algorithms, echo=False,
+                                record_format=record_format)
+        return await self._run(run)
+
+    async def hash_file(self, path, algorithm):
+        """generate_hash 的异步版本"""
+        return await self._run(generate_hash, path, algorithm)
+
+    async def pool(self, mode, size=POOL_DEFAULT_SIZE, low_water=None, **options):
+        """
+        为 mode 编译生成计划并创建预先填满的 AsyncTokenPool (令牌使用进程内共享的 SecureRandom 生成,
+        它是线程安全的, 补充线程和 executor 线程可以同时使用)。
+        options 只能是影响编译的参数 (length、input、no_repeat、weights 等)。
+        """
+        for key in ('count', 'lower', 'upper', 'jobs', 'secure', 'unique', 'seed', 'start', 'exclude'):
+            if key in options:
+                raise ValueError(f"错误: 令牌池不支持参数 {key}")
+        plan = await self._run(self.gen.compile, GenerateOptions(mode, **options), get_secure_random())
+        if plan is None:
+            raise ValueError(f"错误: 无法为 '{mode}' 创建令牌池")
+        return await AsyncTokenPool(TokenPool(mode, plan, size, low_water), self.executor).start()
+
+# --- 令牌库 ---
+# 令牌库文件 = 64 字节文件头 + 定长记录 (UTF-8 编码, 不足部分以 NUL 填充)。
+# 文件头记录记录宽度、已写入的记录数 (count) 和下一个未领取记录的序号 (cursor)。
+# 追加和领取都在文件锁内只修改文件头: 追加把新记录写在末尾 (已有数据不会移动或复制),
+# 写入并 fsync 后才增加 count; 领取在锁内把 cursor 前移并 fsync, 然后在锁外从内存映射中读出记录,
+# 因此多个进程并发领取时同一令牌不会被领取两次, 操作系统崩溃或断电后也不会再次领取已经交出的令牌。
+
+RESERVOIR_MAGIC = b'RGRSV001'
+RESERVOIR_HEADER = 64
+RESERVOIR_MAX_WIDTH = 1 << 16  # 记录宽度上限 (字节)
+_RESERVOIR_FIELDS = '<8sIIQQ'  # magic, 记录宽度, 保留, count, cursor
+_RESERVOIR_COUNT_OFFSET = 16
+_RESERVOIR_CURSOR_OFFSET = 24
+
+def _lock_file(fd, exclusive=True):
+    try:
+        import fcntl
+    except ImportError:  # Windows
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        return
+    fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+def _unlock_file(fd):
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        return
+    fcntl.flock(fd, fcntl.LOCK_UN)
+
+class TokenReservoir:
     """
-    解析表达式。
-    cc 模式:  params 是一个字典: {'length': '...', 'chars': '...', 'no_repeat': True/False, 'case': 'lower'/'upper'/None}
-    其他模式: params 是一个列表
+    多进程共享的持久化令牌库:
+        with TokenReservoir('tokens.rsv', width=32) as reservoir:
+            reservoir.append(batches)
+            tokens = reservoir.claim(100)
+    width 只在创建新文件时使用, 打开已有文件时以文件头为准。令牌中不能含有 NUL 字符。
     """
-    parts = []
-    i = 0
-    while i < len(expression):
-        char = expression[i]
-        if char.isalpha():
-            j = i + 1
-            while j < len(expression) and expression[j].isalnum():
-                j += 1
-            mode = expression[i:j]
-            i = j
-            if i < len(expression) and expression[i] == '(':
-                j = i + 1
-                while j < len(expression) and expression[j] != ')':
-                    j += 1
-                if j < len(expression):
-                    param_str = expression[i + 1:j]
-                    params = param_str.split(';')
 
-                    # --- cc 模式特殊处理 ---
-                    if mode == 'cc':
-                        cc_params = {'length': '', 'chars': '', 'no_repeat': False, 'case': None}
-                        if len(params) >= 2:  # 至少要有长度和字符集
-                            cc_params['length'] = params[0]
-                            cc_params['chars'] = params[1]
-                            for p in params[2:]:  # 处理可选参数
-                                if p == 'nr':
-                                    cc_params['no_repeat'] = True
-                                elif p == 's':
-                                    cc_params['case'] = 'lower'
-                                elif p == 'S':
-                                    cc_params['case'] = 'upper'
-                        else:
-                            print("错误: cc 模式至少需要两个参数 (长度和字符集)")
-                            return [] #错误就返回空
-                        parts.append((mode, cc_params)) # cc模式返回字典
-                    else:
-                        # 其他模式保持原样, 返回列表
-                        parts.append((mode, params))
+    def __init__(self, path, width=None):
+        import struct
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        self._map = None
+        try:
+            _lock_file(self._fd)
+            try:
+                header = self._read_header()
+                if not header:
+                    if not width or not 0 < width <= RESERVOIR_MAX_WIDTH:
+                        raise ValueError(f"错误: 令牌库记录宽度必须在 1 到 {RESERVOIR_MAX_WIDTH} 字节之间")
+                    header = struct.pack(_RESERVOIR_FIELDS, RESERVOIR_MAGIC, width, 0, 0, 0).ljust(RESERVOIR_HEADER, b'\0')
+                    self._write(header, 0)
+                    os.fsync(self._fd)
+                if len(header) < RESERVOIR_HEADER or header[:8] != RESERVOIR_MAGIC:
+                    raise ValueError(f"错误: {path} 不是令牌库文件")
+                self.width = struct.unpack_from('<I', header, 8)[0]
+            finally:
+                _unlock_file(self._fd)
+        except BaseException:
+            os.close(self._fd)
+            raise
 
-                    i = j + 1
-                else:
-                    print("错误: 表达式语法错误，缺少右括号")
-                    return []
-            else:
-                # 对于没有括号的 n, a, an, u，params 设置为空列表
-                parts.append((mode, []))
-        elif char in ("'", '"'):
-            j = i + 1
-            while j < len(expression) and expression[j] != char:
-                j += 1
-            if j < len(expression):
-                parts.append(('str', [expression[i + 1:j]]))
-                i = j + 1
-            else:
-                print("错误，表达式语法错误，缺少结束引号")
-                return []
-        elif char.isspace() or char == ',' or char == '[' or char == ']':
-            i += 1
+    def _read_header(self):
+        if hasattr(os, 'pread'):
+            return os.pread(self._fd, RESERVOIR_HEADER, 0)
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        return os.read(self._fd, RESERVOIR_HEADER)
+
+    def _write(self, data, offset):
+        if hasattr(os, 'pwrite'):
+            os.pwrite(self._fd, data, offset)
         else:
-            parts.append(('str', [char]))
-            i += 1
-    return parts
+            os.lseek(self._fd, offset, os.SEEK_SET)
+            os.write(self._fd, data)
 
+    def _read_u64(self, offset):
+        """读取文件头中的 64 位字段"""
+        return int.from_bytes(self._read_header()[offset:offset + 8], 'little')
 
-def generate_from_expression(expression, min_length, max_length, args):
-    """解析表达式并生成字符串"""
-    try:
-        parsed_parts = parse_expression(expression)
-    except (SyntaxError, ValueError) as e:
-        print(f"表达式解析错误: {e}")
-        return []
+    def _write_u64(self, value, offset):
+        self._write(value.to_bytes(8, 'little'), offset)
 
-    if not parsed_parts:
-        return []
+    def stats(self):
+        """返回 (已写入数, 已领取数)"""
+        _lock_file(self._fd, exclusive=False)
+        try:
+            return self._read_u64(_RESERVOIR_COUNT_OFFSET), self._read_u64(_RESERVOIR_CURSOR_OFFSET)
+        finally:
+            _unlock_file(self._fd)
 
-    result = []
-    for _ in range(args.count):
-        generated_string = ""
-        for mode, params in parsed_parts:
-            if mode == 'str':
-                generated_string += params[0]
-            else:
-                if mode == 'cc':
-                    # --- cc 模式: params 是字典 ---
-                    length_param = params['length']
-                    custom_charset = params['chars']
-                    no_repeat = params['no_repeat']
-                    case = params['case']
-
-                    if args.input:
-                        custom_charset = args.input
-
-                    if length_param.isdigit():
-                        length = int(length_param)
-                    elif length_param == 'r':
-                        max_allowed_length = max_length
-                        if no_repeat:
-                            max_allowed_length = len(set(custom_charset))
-                        length = args.length or random.randint(min_length, min(max_length, max_allowed_length))
-                    else:
-                        length = args.length or 8
-
-                    if no_repeat and length > len(set(custom_charset)):
-                        print(f"错误: 长度大于唯一字符数")
-                        return []
-
-                    cc_string = generate_from_charset(custom_charset, length, length, 1, no_repeat)[0]
-
-                    if case == 'lower':
-                        cc_string = cc_string.lower()
-                    elif case == 'upper':
-                        cc_string = cc_string.upper()
-
-                    generated_string += cc_string
-                # --- 其他模式保持原有的处理逻辑 ---
-                elif mode == 'n':
-                    length_param = params[0] if params else ''
-                    no_repeat = 'nr' in params
-                    case = next((p for p in params if p in ('s', 'S')), None)
-                    case_sensitive = 'lower' if case == 's' else 'upper' if case == 'S' else ''
-                    length = 0
-
-                    if length_param.isdigit():
-                        length = int(length_param)
-                    elif length_param == 'r':
-                        max_allowed_length = max_length
-                        if no_repeat:
-                            max_allowed_length = 10
-                        length = args.length or random.randint(min_length, min(max_length, max_allowed_length))
-                    else:
-                        length = args.length or 8
-                    generated_string += generate_numeric(length, length, 1, no_repeat)[0]
-
-                elif mode == 'a':
-                    length_param = params[0] if params else ''
-                    no_repeat = 'nr' in params
-                    case = next((p for p in params if p in ('s', 'S')), None)
-                    case_sensitive = 'lower' if case == 's' else 'upper' if case == 'S' else ''
-                    length = 0
-                    if length_param.isdigit():
-                        length = int(length_param)
-                    elif length_param == 'r':
-                        max_allowed_length = max_length
-                        if no_repeat:
-                            max_allowed_length = 26 if case_sensitive == 'lower' or case_sensitive == 'upper' else 52
-
-                        length = args.length or random.randint(min_length, min(max_length, max_allowed_length))
-                    else:
-                        length = args.length or 8
-                    generated_string += generate_alpha(length, length, 1, case_sensitive, no_repeat)[0]
-
-                elif mode == 'an':
-                    length_param = params[0] if params else ''
-                    no_repeat = 'nr' in params
-                    case = next((p for p in params if p in ('s', 'S')), None)
-                    case_sensitive = 'lower' if case == 's' else 'upper' if case == 'S' else ''
-                    length = 0
-
-                    if length_param.isdigit():
-                        length = int(length_param)
-                    elif length_param == 'r':
-                        max_allowed_length = max_length
-                        if no_repeat:
-                            max_allowed_length = 36 if case_sensitive == 'lower' or case_sensitive == 'upper' else 62
-                        length = args.length or random.randint(min_length, min(max_length, max_allowed_length))
-                    else:
-                        length = args.length or 8
-                    generated_string += generate_alphanumeric(length, length, 1, case_sensitive, no_repeat)[0]
-
-                elif mode == 'u':
-                    case = next((p for p in params if p in ('s', 'S')), None)  # 获取 s 或 S
-                    uuid_string = generate_uuid(1)[0]
-                    if case == 's':
-                        uuid_string = uuid_string.lower()
-                    elif case == 'S':
-                        uuid_string = uuid_string.upper()
-                    generated_string += uuid_string
-
-        result.append(generated_string)
-    return result
+    def append(self, batches):
+        """把批次中的令牌作为新段追加到末尾, 返回追加的数量; 令牌超过记录宽度时抛出 ValueError"""
+        width = self.width
+        appended = 0
+        for batch in batches:
+            if not batch:
+                continue
+            records = []
+            for token in batch:
+                data = token.encode('utf-8')
+                if len(data) > width:
+                    raise ValueError(f"错误: 令牌长度 {len(data)} 字节超过了令牌库的记录宽度 {width}")
+                records.append(data)
+            data = b"".join(record.ljust(width, b'\0') for record in records)
+            _lock_file(self._fd)
+            try:
+                count = self._read_u64(_RESERVOIR_COUNT_OFFSET)
+                self._write(data, RESERVOIR_HEADER + count * width)
+                os.fsync(self._fd)
+                self._write_u64(count + len(records), _RESERVOIR_COUNT_OFFSET)
+            finally:
+                _unlock_file(self._fd)
+            appended += len(records)
+        return appended
 
-# --- 计算熵值函数 ---
-def calculate_entropy(s):
-    """计算字符串的熵值 (以比特为单位)"""
-    if not s:
+    def claim(self, n):
+        """领取最多 n 个未领取的令牌 (令牌不足时返回的数量少于 n)"""
+        _lock_file(self._fd)
+        try:
+            count = self._read_u64(_RESERVOIR_COUNT_OFFSET)
+            start = self._read_u64(_RESERVOIR_CURSOR_OFFSET)
+            taken = max(0, min(n, count - start))
+            if taken:
+                self._write_u64(start + taken, _RESERVOIR_CURSOR_OFFSET)
+                os.fsync(self._fd)  # 游标落盘之后才交出令牌
+        finally:
+            _unlock_file(self._fd)
+        if not taken:
+            return []
+        return self._records(start, taken)
+
+    def _records(self, start, n):
+        import mmap
+        width = self.width
+        end = RESERVOIR_HEADER + (start + n) * width
+        if self._map is None or len(self._map) < end:
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ)  # 映射到当前文件末尾
+        data = self._map[RESERVOIR_HEADER + start * width:end]
+        return [data[i:i + width].rstrip(b'\0').decode('utf-8') for i in range(0, len(data), width)]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def fill_reservoir(gen, options, path):
+    """按 options 生成并追加到令牌库; 新建令牌库时记录宽度取表达式的最大字节数"""
+    prepared = gen.prepare(options)
+    if prepared is None:
         return 0
-    length = len(s)
-    seen = dict(((x, 0) for x in string.printable))  # 初始化所有可打印字符的计数
-    for char in s:
-        seen[char] += 1
+    with TokenReservoir(path, max(1, prepared.source.max_bytes())) as reservoir:
+        appended = reservoir.append(prepared.batches())
+        count, claimed = reservoir.stats()
+    print(f"已向令牌库 {path} 追加 {appended} 个令牌 (共 {count} 个, 未领取 {count - claimed} 个)")
+    return appended
+
+def claim_tokens(path, n):
+    """从令牌库领取 n 个令牌, 不足时在标准错误上提示"""
+    if n < 1:
+        raise ValueError("错误: --claim 必须大于 0")
+    if not os.path.exists(path):
+        raise ValueError(f"错误: 令牌库 {path} 不存在")
+    with TokenReservoir(path) as reservoir:
+        tokens = reservoir.claim(n)
+    if len(tokens) < n:
+        print(f"警告: 令牌库中只剩 {len(tokens)} 个令牌", file=sys.stderr)
+    return tokens
+
+# --- 批量任务 ---
+# --job-file FILE 在一个进程中运行任务清单中的所有任务: 配置只读取一次,
+# 解析过的表达式和字符集采样器 (_expression_cache / cached_sampler) 在任务之间复用。
+# 任务由共享的工作进程池并发执行 (大任务优先), 每个工作进程各自写出任务的输出文件。
+#
+# 任务清单为 JSON: {"defaults": {...}, "jobs": [{...}, ...]} 或直接是任务列表。每个任务的字段:
+#   mode (必填, 模式、表达式、/正则/ 或 $配置), name, output (必填), hash (与 -hash 相同),
+#   shard_records / shard_bytes / compress / manifest (与同名命令行参数相同),
+#   以及 GenerateOptions 的字段 (count, length, lower, upper, no_repeat, input, seed, unique, exclude 等)。
+# defaults 中的字段作为每个任务的默认值。
+
+_JOB_OUTPUT_FIELDS = ('name', 'output', 'format', 'hash', 'shard_records', 'shard_bytes', 'compress', 'manifest')
+_JOB_INT_FIELDS = ('count', 'length', 'start', 'jobs', 'shard_records')
+_JOB_BOOL_FIELDS = ('random_length', 'lower', 'upper', 'no_repeat', 'secure', 'unique')
+_JOB_BOOL_STRINGS = {'true': True, 'yes': True, '1': True, 'false': False, 'no': False, '0': False}
 
-    entropy = 0
-    for count in seen.values():
-        if count > 0:
-            probability = float(count) / length
-            entropy -= probability * math.log(probability, 2)  # 使用 math.log 以 2 为底
+def _coerce_job_fields(job):
+    """把任务中的整数和布尔字段统一为 int / bool (允许写成字符串, 如 "6"、"true"), 类型不对时抛出 ValueError"""
+    for key in _JOB_INT_FIELDS:
+        value = job.get(key)
+        if value is None or (isinstance(value, int) and not isinstance(value, bool)):
+            continue
+        if isinstance(value, str) and value.strip().lstrip('+-').isdecimal():
+            job[key] = int(value)
+        else:
+            raise ValueError(f"错误: 任务 {job['name']} 的 {key} 必须是整数, 而不是 {value!r}")
+    for key in _JOB_BOOL_FIELDS:
+        value = job.get(key)
+        if value is None or isinstance(value, bool):
+            continue
+        if isinstance(value, str) and value.strip().lower() in _JOB_BOOL_STRINGS:
+            job[key] = _JOB_BOOL_STRINGS[value.strip().lower()]
+        elif isinstance(value, int) and value in (0, 1):
+            job[key] = bool(value)
+        else:
+            raise ValueError(f"错误: 任务 {job['name']} 的 {key} 必须是布尔值, 而不是 {value!r}")
+    value = job.get('shard_bytes')
+    if isinstance(value, str):
+        job['shard_bytes'] = parse_size(value)
+    elif value is not None and (isinstance(value, bool) or not isinstance(value, int)):
+        raise ValueError(f"错误: 任务 {job['name']} 的 shard_bytes 必须是整数或带 K/M/G 后缀的字符串, 而不是 {value!r}")
+
+def load_job_file(path):
+    """读取并校验任务清单, 返回任务 (dict) 列表"""
+    import json
+    with open(path, encoding='utf-8') as file:
+        try:
+            data = json.load(file)
+        except ValueError as e:
+            raise ValueError(f"错误: 任务清单 {path} 不是有效的 JSON: {e}") from None
+    if isinstance(data, list):
+        data = {'jobs': data}
+    if not isinstance(data, dict) or not isinstance(data.get('jobs'), list):
+        raise ValueError(f"错误: 任务清单 {path} 中没有 jobs 列表")
+    defaults = data.get('defaults', {})
+    if not isinstance(defaults, dict):
+        raise ValueError(f"错误: 任务清单 {path} 中的 defaults 必须是对象")
+    jobs = []
+    for index, entry in enumerate(data['jobs']):
+        if not isinstance(entry, dict):
+            raise ValueError(f"错误: 任务清单 {path} 中的第 {index} 个任务必须是对象")
+        job = dict(defaults, **entry)
+        job.setdefault('name', f"job{index}")
+        job['name'] = str(job['name'])
+        for key in job:
+            if key not in _JOB_OUTPUT_FIELDS and key != 'mode' and not hasattr(GenerateOptions, key):
+                raise ValueError(f"错误: 任务 {job['name']} 中有未知字段 '{key}'")
+        _coerce_job_fields(job)
+        if not job.get('mode'):
+            raise ValueError(f"错误: 任务 {job['name']} 缺少 mode")
+        if not job.get('output'):
+            raise ValueError(f"错误: 任务 {job['name']} 缺少 output")
+        if job.get('format', 'lines') not in RECORD_FORMATS:
+            raise ValueError(f"错误: 任务 {job['name']} 的 format 必须是 {', '.join(RECORD_FORMATS)} 之一")
+        if job.get('jobs', 1) != 1:
+            raise ValueError(f"错误: 任务 {job['name']} 不能指定 jobs, 批量任务共用 --workers 指定的进程池")
+        jobs.append(job)
+    names = [job['name'] for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("错误: 任务清单中有重名的任务")
+    return jobs
+
+def run_job(gen, job):
+    """
+    运行一个任务, 返回结果: {name, output, count, seconds, digests} 或 {name, error}。
+    任务中的任何异常都只记为该任务失败, 不影响同一批中的其他任务。
+    """
+    import time
+    started = time.perf_counter()
+    record_format = job.get('format', 'lines')
+    result = {'name': job['name'], 'output': job['output']}
+    try:
+        options = GenerateOptions(job['mode'], **{key: value for key, value in job.items()
+                                                  if key not in _JOB_OUTPUT_FIELDS and key != 'mode'})
+        hashes = job.get('hash')
+        if hashes:
+            hashes = parse_hashes(hashes if isinstance(hashes, str) else ",".join(hashes))
+        prepared = gen.prepare(options)
+        if prepared is None:
+            return dict(result, error="编译失败")
+        sharded = any(job.get(key) for key in ('shard_records', 'shard_bytes', 'compress', 'manifest'))
+        if sharded:
+            report = write_shards(prepared.batches(), job['output'], job.get('shard_records'), job.get('shard_bytes'),
+                                  job.get('compress'), hashes, manifest=job.get('manifest'),
+                                  record_format=record_format)
+            result.update(count=report['records'], manifest=report['manifest'], digests=[])
+        else:
+            size = output_size(record_width(prepared.source, prepared.case), options.count, record_format)
+            digests = write_output(prepared.batches(), job['output'], hashes, echo=False, record_format=record_format,
+                                   size=size)
+            result.update(count=options.count, digests=digests)
+    except Exception as e:
+        return dict(result, error=str(e) or type(e).__name__)
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+_job_worker_gen = None
+
+def _init_job_worker(config_path, sections, min_length, max_length):
+    """工作进程初始化: 由主进程已读取的配置建立 RandGen, 不再读取配置文件"""
+    global _job_worker_gen
+    config = configparser.ConfigParser(interpolation=None)
+    config.read_dict(sections)
+    _job_worker_gen = RandGen(config_path, min_length, max_length, config)
 
-    return entropy
+def _run_job_in_worker(job):
+    return run_job(_job_worker_gen, job)
+
+def _job_size(job):
+    """粗略估计任务的工作量, 用于大任务优先调度"""
+    length = job.get('length') or 16
+    return (job.get('count') or 1) * length
+
+def run_jobs(gen, jobs, workers=None):
+    """
+    并发运行任务, 按完成顺序产出结果。workers 为 1 时在当前进程中依次运行;
+    否则使用 workers 个进程的进程池, 按估计的工作量从大到小提交。
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) == 1:
+        for job in jobs:
+            yield run_job(gen, job)
+        return
+    import concurrent.futures
+    config = gen.config
+    sections = {section: dict(config.items(section, raw=True)) for section in config.sections()}
+    config_path = os.path.abspath(gen._config_path or config_file)
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(workers, len(jobs)), initializer=_init_job_worker,
+            initargs=(config_path, sections, gen.min_length, gen.max_length)) as executor:
+        futures = [executor.submit(_run_job_in_worker, job) for job in sorted(jobs, key=_job_size, reverse=True)]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
 
 # --- 主函数 ---
 
+def _check_config_weights(config_type, config_value, weights):
+    """检查 -add/-up 时随 -w 给出的权重, 不合法时打印错误并返回 False"""
+    if config_type != 'cc':
+        print("错误: -w 只能用于 cc 类型的配置")
+        return False
+    try:
+        WeightedSampler(config_value, parse_weights(weights))
+    except ValueError as e:
+        print(f"错误: {e}")
+        return False
+    return True
+
 def main():
+    import argparse
     parser = argparse.ArgumentParser(description="随机字符串生成", usage="""
-usage: RandGen.py [-h] [-l LENGTH | -r] [-c COUNT] [-s] [-S] [-nr] [-i INPUT] [-o OUTPUT] [-hash ALGORITHMS] [-nv] [-set SET] [-add [ADD ...]] [-rm REMOVE] [-up [UP ...]] [-list] -m MODE
+usage: RandGen.py [-h] [-l LENGTH | -r | --length-dist SPEC] [-w WEIGHTS] [-c COUNT] [-s] [-S] [-nr] [-i INPUT] [-o OUTPUT] [--format {csv,jsonl,lines,nul,raw}] [--shard-records N | --shard-bytes SIZE] [--compress {bz2,gzip,lzma}] [--writers N] [--manifest FILE] [-hash ALGORITHMS] [-nv] [-e] [-j JOBS] [--secure] [--unique] [--exclude FILE] [--seed SEED] [--start START] [--checkpoint [SECONDS]] [--resume] [--profile] [--stats FILE] [--bench [SCALE]] [--pool-size N] [--pool-low N] [--reservoir FILE] [--claim N] [--job-file FILE] [--workers N] [-set SET] [-add [ADD ...]] [-rm REMOVE] [-up [UP ...]] [-list] (-m MODE | --bench | --serve [ADDRESS] | --job-file FILE)
 
 随机字符串生成
 
     使用示例:
     RandGen -m u --count 5
+    RandGen -m u7 --count 1000000 -nv -o ids.txt
     RandGen -m n -l 6 --count 10 -nr
     RandGen -m a -l 8 -s
     RandGen -m an -l 12 -c 3 -S -nr
     RandGen -m "[an(10;nr),@test.com]"
     RandGen -m "['1',n(10;nr),'K']"
     RandGen -m "[n(5;nr;r)]"
+    RandGen -m "[an(16),'-',n(6)]" -c 100000000 -j 8 -nv -o tokens.txt
+    RandGen -m cc -i ACGT -w 3,2,2,3 --length-dist normal:20,4 -c 1000
+    RandGen -m "[cc(r;abc;w=5,1,1)]" --length-dist zipf:1.2,1,12
+    RandGen -m an -l 32 --secure
+    RandGen -m "[n(6)]" -c 1000000 --unique -nv -o codes.txt
+    RandGen -m "[a(4;S),n(8)]" --seed fixture-v1 --start 5000000 -c 1000
+    RandGen -m "[an(16)]" -c 100000000 -j 8 -nv -o "tokens.txt" --shard-records 10000000 --compress gzip
+    RandGen -m "[an(12)]" -c 1000000 --exclude issued.txt --exclude revoked.txt -nv -o new.txt
+    RandGen --bench quick -o bench.json
+    RandGen --serve 127.0.0.1:8765 --pool-size 200000
+    RandGen --serve unix:/run/randgen.sock -m $aa
+    RandGen -m "[an(32)]" -c 10000000 --reservoir tokens.rsv --secure
+    RandGen --reservoir tokens.rsv --claim 100 -o batch.txt
+    RandGen --job-file fixtures.json --workers 4
+    RandGen -m "/(INV|PO)-[0-9A-F]{8}(-\\d{2})?/" -c 10
     RandGen -m w -add re aa '[W,n(10)]'
     RandGen -m w -add cc bb abcde
+    RandGen -m w -add cc vowel aeiou -w 8,12,7,8,3
+    RandGen -m w -add re orderid "/ORD-\\d{10}/"
     RandGen -m w -rm aa
     RandGen -m w -up re aa '[W,n(12)]'
     RandGen -m w -list
     RandGen -m $aa
 
 参数:
-  -m MODE, --mode MODE  模式: u, n, a, an, cc, w, 或表达式, 或 $引用
+  -m MODE, --mode MODE  模式: u, u7, n, a, an, cc, w, 或表达式, 或 /正则表达式/, 或 $引用
   -l LENGTH, --length LENGTH
                         字符串长度 (与 -r 互斥)
   -r, --random-length   使用配置的最小和最大长度之间的随机长度 (与 -l 互斥)
+  --length-dist SPEC    每个字符串的长度按分布抽取 (与 -l/-r 互斥, 也用于表达式中的 r 长度):
+                        fixed:N, uniform:A,B, normal:MEAN,STD[,A,B], zipf:S[,A,B], hist:FILE
+                        (hist 文件每行为 "长度 次数"); A,B 默认为配置的最小和最大长度
+  -w WEIGHTS, --weights WEIGHTS
+                        cc 模式的字符权重, 逗号分隔并与 -i 的字符逐一对应, 例如 -w 5,1,2;
+                        与 -add/-up 一起使用时保存到配置中。表达式中写作 cc(长度;字符集;w=5,1,2)
   -c COUNT, --count COUNT
                         生成数量 (默认: 1)
   -s, --lower           仅小写 (仅适用于 a, an 模式)
@@ -410,13 +4499,57 @@ usage: RandGen.py [-h] [-l LENGTH | -r] [-c COUNT] [-s] [-S] [-nr] [-i INPUT] [-
                         自定义字符集 (用于 cc 模式, 也可用于表达式中的 cc 函数)
   -o OUTPUT, --output OUTPUT
                         导出到文件
+  --format {csv,jsonl,lines,nul,raw}
+                        输出文件的记录格式: lines 每行一个 (默认); nul 每个以 \0 结尾; jsonl 每行一个 JSON 字符串;
+                        csv 每行为 "序号,字符串"; raw 为没有分隔符的定长记录 (要求所有字符串长度相同)。
+                        长度固定时预先为输出文件分配好空间
+  --shard-records N     输出按每 N 个字符串切分为多个文件 (tokens.txt -> tokens-00000.txt, tokens-00001.txt ...,
+                        -o 中含有 {shard} 时按其格式化, 例如 -o "part-{shard:04d}.txt")
+  --shard-bytes SIZE    输出按大小 (未压缩, 可用 K/M/G 后缀) 切分为多个文件, 与 --shard-records 互斥
+  --compress {bz2,gzip,lzma}
+                        边生成边压缩输出文件 (自动添加 .gz/.bz2/.xz 后缀)
+  --writers N           并行压缩、写入分片的线程数 (默认: CPU 核数, 最多 4)
+  --manifest FILE       分片清单 (JSON, 记录每个分片的文件名、字符串数、大小和 -hash 指定的摘要,
+                        默认 sha256), 默认为 <输出文件>.manifest.json。使用分片或压缩时总会写出清单
   -hash ALGORITHMS, --hash_algorithms ALGORITHMS
                         计算哈希值。支持的算法: md5, sha1, sha256, sha512,
                         sha3_224, sha3_256, sha3_384, sha3_512。
                         可以使用逗号分隔多个算法, 例如: -hash md5,sha256。
                         特殊值: 'n' (常用算法), 'a' (所有可用算法)。
   -nv                   不输出到控制台
+  -e, --entropy         输出结束后显示理论强度 (由表达式直接计算的每个字符串的熵, 不采样)
+                        和统计 (字符直方图的熵、卡方均匀性检验、单个字符串熵的最小值和平均值)
+  -j JOBS, --jobs JOBS  并行生成的进程数 (默认: 1), 输出顺序与单进程一致
+  --secure              使用操作系统的密码学安全随机数 (os.urandom), 适用于密码、密钥等
+  --unique              保证同一次运行中输出的字符串互不重复; 数量超过可能的组合数时直接报错
+  --exclude FILE        不输出 FILE (每行一个已发放的令牌) 中已有的字符串, 命中的字符串会被重新生成; 可多次指定。
+                        FILE 的索引保存在配置文件旁的 RandGen.exclude 目录中, 文件变化后自动重建
+  --seed SEED           随机种子。第 k 个字符串只取决于 (种子, 表达式, k), 可随时重新生成
+  --start START         从第 START 个字符串 (从 0 开始) 开始生成, 无需先生成前面的部分 (需要 --seed)
+  --checkpoint [SECONDS]
+                        每隔 SECONDS 秒 (默认: 60) 把输出文件刷到磁盘并把进度写入 <输出文件>.ckpt, 需要 -o;
+                        未指定 --seed 时自动生成一个随机种子并记录在检查点中
+  --resume              从 <输出文件>.ckpt 继续被中断的生成, 结果 (文件内容和哈希) 与一次跑完完全相同
+  --profile             把各阶段 (配置读取、表达式解析、各片段生成、大小写转换、熵、编码、写入、各哈希算法等) 的耗时
+                        和计数器 (字符串数、字符数、随机字节数、-nr 拒绝次数、每个字符串的内存块数等) 输出到 stderr
+  --stats FILE          把上述剖析结果以 JSON 导出到 FILE
   -set                  设置配置
+  --bench [{quick,standard,full}]
+                        运行基准测试矩阵 (各模式、表达式、$引用、输出和哈希),
+                        报告 strings/sec、bytes/sec 和峰值内存, 以 JSON 输出 (或用 -o 导出)
+  --bench-filter NAME   只运行名称包含 NAME 的测试项
+  --bench-baseline FILE 与之前导出的结果对比, strings/sec 下降超过 10%% 时报告并以状态码 1 退出
+  --serve [ADDRESS]     以令牌池服务运行 (默认 127.0.0.1:8765, 或 unix:/path/to.sock),
+                        为每个自定义配置 (或 -m 指定的 $配置) 预先生成令牌:
+                        GET /take/配置名?n=10 取出令牌, GET /metrics 查看池深度和补充速率
+  --pool-size N         每个令牌池的容量 (默认: 100000)
+  --pool-low N          低水位, 池深度低于该值时后台补充 (默认: 容量的 1/4)
+  --reservoir FILE      令牌库文件 (定长记录, 可被多个进程共享)。与 -m 一起使用时把生成的令牌追加到令牌库,
+                        与 --claim 一起使用时从令牌库领取令牌
+  --claim N             从令牌库领取 N 个令牌 (每个令牌只会被领取一次), 输出方式与普通生成相同
+  --job-file FILE       在一个进程中运行任务清单 (JSON) 中的所有任务, 配置只读取一次, 表达式和字符集在任务间复用;
+                        每个任务指定 mode、output 以及 count、length、hash 等字段, 见 README
+  --workers N           并发运行任务的进程数 (默认: CPU 核数)
 
 注意:
   - 表达式模式下，字符串字面量用单引号或双引号括起来, 例如:  ['123', n(5)]
@@ -424,19 +4557,51 @@ usage: RandGen.py [-h] [-l LENGTH | -r] [-c COUNT] [-s] [-S] [-nr] [-i INPUT] [-
   - 使用 $引用 模式引用自定义配置, 例如: RandGen -m $myconfig
   - 当使用-add和-up添加表达式的时候，表达式务必使用双引号。
     """)
-    parser.add_argument('-m', '--mode', type=str, required=True, help="模式或表达式")
+    parser.add_argument('-m', '--mode', type=str, help="模式或表达式")
     length_group = parser.add_mutually_exclusive_group()
     length_group.add_argument('-l', '--length', type=int, help="字符串长度")
     length_group.add_argument('-r', '--random-length', action='store_true', help="随机长度")
+    length_group.add_argument('--length-dist', metavar='SPEC', help="长度分布")
+    parser.add_argument('-w', '--weights', type=str, help="字符权重")
     parser.add_argument('-c', '--count', type=int, default=1, help="生成数量")
     parser.add_argument('-s', '--lower', action='store_true', help="仅小写")
     parser.add_argument('-S', '--upper', action='store_true', help="仅大写")
     parser.add_argument('-nr', '--no-repeat', action='store_true', help="不重复字符")
     parser.add_argument('-i', '--input', type=str, help="自定义字符集")
     parser.add_argument('-o', '--output', type=str, help="导出到文件")
+    parser.add_argument('--format', choices=sorted(RECORD_FORMATS), default='lines', help="记录格式")
+    shard_group = parser.add_mutually_exclusive_group()
+    shard_group.add_argument('--shard-records', type=int, metavar='N', help="每个分片的记录数")
+    shard_group.add_argument('--shard-bytes', type=parse_size, metavar='SIZE', help="每个分片的字节数")
+    parser.add_argument('--compress', choices=sorted(COMPRESSION_SUFFIXES), help="压缩输出文件")
+    parser.add_argument('--writers', type=int, metavar='N', help="并行写分片的线程数")
+    parser.add_argument('--manifest', metavar='FILE', help="分片清单文件")
     parser.add_argument('-hash', help="哈希算法", dest='hash_algorithms', metavar='ALGORITHMS', type=parse_hashes)
     parser.add_argument('-nv', action='store_true', help="不输出到控制台")
-    parser.add_argument('-e', '--entropy', action='store_true', help="计算并显示熵值")  # 添加 -e 参数
+    parser.add_argument('-e', '--entropy', action='store_true', help="显示理论强度和熵统计")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="并行进程数")
+    parser.add_argument('--secure', action='store_true', help="使用操作系统的密码学安全随机数")
+    parser.add_argument('--unique', action='store_true', help="保证输出不重复")
+    parser.add_argument('--exclude', action='append', metavar='FILE', help="排除已发放的令牌")
+    parser.add_argument('--seed', type=str, help="随机种子, 相同种子和表达式的输出可复现")
+    parser.add_argument('--start', type=int, default=0, help="从第 START 个字符串开始生成 (需要 --seed)")
+    parser.add_argument('--checkpoint', nargs='?', const=CHECKPOINT_INTERVAL, type=float, metavar='SECONDS',
+                        help="定期保存检查点")
+    parser.add_argument('--resume', action='store_true', help="从检查点继续")
+    parser.add_argument('--profile', action='store_true', help="把各阶段耗时和计数器输出到 stderr")
+    parser.add_argument('--stats', metavar='FILE', help="把各阶段耗时和计数器以 JSON 导出到文件")
+    parser.add_argument('--bench', nargs='?', const='standard', choices=sorted(BENCH_COUNTS),
+                        help="运行基准测试")
+    parser.add_argument('--bench-filter', help="只运行名称包含该字符串的基准测试项")
+    parser.add_argument('--bench-baseline', help="与之前保存的基准测试结果 (JSON) 对比")
+    parser.add_argument('--serve', nargs='?', const=SERVE_DEFAULT_ADDRESS, metavar='ADDRESS',
+                        help="以令牌池服务运行")
+    parser.add_argument('--pool-size', type=int, default=POOL_DEFAULT_SIZE, help="令牌池容量")
+    parser.add_argument('--pool-low', type=int, help="令牌池低水位")
+    parser.add_argument('--reservoir', metavar='FILE', help="令牌库文件")
+    parser.add_argument('--claim', type=int, metavar='N', help="从令牌库领取令牌")
+    parser.add_argument('--job-file', metavar='FILE', help="批量任务清单 (JSON)")
+    parser.add_argument('--workers', type=int, metavar='N', help="批量任务的工作进程数")
     parser.add_argument('-set', help="设置配置")
 
     # -m w 的子命令 (直接添加到主解析器)
@@ -446,7 +4611,46 @@ usage: RandGen.py [-h] [-l LENGTH | -r] [-c COUNT] [-s] [-S] [-nr] [-i INPUT] [-
     parser.add_argument('-list', action='store_true', help='列出所有配置')
 
     args = parser.parse_args()
+    if not (args.profile or args.stats):
+        return _run_command(args, parser)
+    profiler = enable_profiling()
+    try:
+        return _run_command(args, parser)
+    finally:
+        disable_profiling()
+        if args.stats:
+            import json
+            with open(args.stats, 'w', encoding='utf-8') as file:
+                json.dump(profiler.report(), file, ensure_ascii=False, indent=2)
+        if args.profile:
+            print(profiler.format(), file=sys.stderr)
 
+def _run_command(args, parser):
+    """执行解析后的命令行参数"""
+    if args.bench:
+        import json
+        report = run_benchmarks(args.bench, args.bench_filter)
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as file:
+                file.write(text)
+            print(f"基准测试结果已导出到: {args.output}")
+        else:
+            print(text)
+        if args.bench_baseline:
+            with open(args.bench_baseline, encoding='utf-8') as file:
+                regressions = compare_benchmarks(json.load(file), report)
+            for name, before, after in regressions:
+                print(f"性能回退: {name}: {before:,.0f} -> {after:,.0f} str/s", file=sys.stderr)
+            if regressions:
+                sys.exit(1)
+        if any('error' in item for item in report['results']):
+            sys.exit(1)
+        return
+    if not args.mode and not args.set and not args.serve and args.claim is None and not args.job_file:
+        parser.error("the following arguments are required: -m/--mode")
+
+    config = load_config(create=True, write_cache=True)
     min_length = get_config_value('Settings',"min_length", 1)
     max_length = get_config_value('Settings','max_length', 32767)
 
@@ -455,16 +4659,14 @@ usage: RandGen.py [-h] [-l LENGTH | -r] [-c COUNT] [-s] [-S] [-nr] [-i INPUT] [-
             key, operation = args.set.split('=', 1)
             key = key.strip()
             operation = operation.strip()
-            if key == "min_length":
-                min_length = int(get_config_value('Settings',"min_length", 1))
-                new_value = apply_operation(min_length, *operation.split())
-                set_config_value('Settings',"min_length", new_value)
-                print(f"min_length 设置为 {new_value}")
-            elif key == "max_length":
-                max_length = int(get_config_value('Settings','max_length', 32767))
-                new_value = apply_operation(max_length, *operation.split())
-                set_config_value('Settings','max_length', new_value)
-                print(f"max_length 设置为 {new_value}")
+            if key in ("min_length", "max_length"):
+                with edit_config() as config:  # 在锁内读取当前值再修改, 并发的 -set 不会丢失更新
+                    current = get_config_value('Settings', key, int(DEFAULT_SETTINGS[key]), config)
+                    new_value = apply_operation(current, *operation.split())
+                    if not config.has_section('Settings'):
+                        config.add_section('Settings')
+                    config.set('Settings', key, str(new_value))
+                print(f"{key} 设置为 {new_value}")
             else:
                 print("无效的配置键，请使用 min_length 或 max_length。")
         except Exception as e:
@@ -477,20 +4679,24 @@ usage: RandGen.py [-h] [-l LENGTH | -r] [-c COUNT] [-s] [-S] [-nr] [-i INPUT] [-
             if config_type not in ('re', 'cc'):
                 print("错误: 配置类型必须是 're' (表达式) 或 'cc' (自定义字符集)")
                 return
-            if config.has_section(config_name):
+            if args.weights and not _check_config_weights(config_type, config_value, args.weights):
+                return
+            with edit_config() as config:  # 在锁内检查, 并发添加同名配置时只有一个成功
+                exists = config.has_section(config_name)
+                if not exists:
+                    config[config_name] = {'type': config_type, 'value': config_value}
+                    if args.weights:
+                        config.set(config_name, 'weights', args.weights)
+            if exists:
                 print("错误，配置已存在")
                 return
-
-            set_config_value(config_name, 'type', config_type)
-            set_config_value(config_name, 'value', config_value)
             print(f"已添加配置: {config_name}")
 
         elif args.remove:  # 使用 args.remove
             config_name = args.remove
-            if config.has_section(config_name):
-                config.remove_section(config_name)
-                with open(config_file, 'w') as configfile:
-                    config.write(configfile)
+            with edit_config() as config:
+                removed = config.remove_section(config_name)
+            if removed:
                 print(f"已删除配置: {config_name}")
             else:
                 print(f"配置 '{config_name}' 不存在")
@@ -502,9 +4708,17 @@ usage: RandGen.py [-h] [-l LENGTH | -r] [-c COUNT] [-s] [-S] [-nr] [-i INPUT] [-
                 print("错误: 配置类型必须是 're' (表达式) 或 'cc' (自定义字符集)")
                 return
 
-            if config.has_section(config_name):
-                set_config_value(config_name, 'type', config_type)
-                set_config_value(config_name, 'value', config_value)
+            if args.weights and not _check_config_weights(config_type, config_value, args.weights):
+                return
+            with edit_config() as config:
+                exists = config.has_section(config_name)
+                if exists:
+                    config.remove_option(config_name, 'weights')  # 旧权重与新字符集不一定对应
+                    config.set(config_name, 'type', config_type)
+                    config.set(config_name, 'value', config_value)
+                    if args.weights:
+                        config.set(config_name, 'weights', args.weights)
+            if exists:
                 print(f"已更新配置: {config_name}")
             else:
                 print(f"配置 '{config_name}' 不存在")
@@ -516,130 +4730,122 @@ usage: RandGen.py [-h] [-l LENGTH | -r] [-c COUNT] [-s] [-S] [-nr] [-i INPUT] [-
                     if section != 'Settings':
                         config_type = config.get(section, 'type')
                         config_value = config.get(section, 'value')
-                        print(f"  {section}: 类型={config_type}, 值={config_value}")
+                        weights = config.get(section, 'weights', fallback=None)
+                        weights_text = f", 权重={weights}" if weights else ""
+                        print(f"  {section}: 类型={config_type}, 值={config_value}{weights_text}")
             else:
                 print("没有自定义配置")
         else:
             print("错误：在 -m w 模式下，必须指定 -add, -del, -up 或 -list 中的一个")
         return
-    # --- 处理 $ 引用 ---
-    if args.mode.startswith('$'):
-        config_name = args.mode[1:]  # 去掉 $
-        if config.has_section(config_name):
-            config_type = get_config_value(config_name, 'type', '')
-            config_value = get_config_value(config_name, 'value', '')
-            if config_type == 're':
-                try:
-                    result = generate_from_expression(config_value, min_length, max_length, args)
-                except ValueError as e:
-                    print(e)
-                    return
-                except Exception as e:
-                    print(f"出了点问题: {e}")
-                    return
-            elif config_type == 'cc':
-                if isinstance(config_value, int):  # 检查是否为整数（可能是默认值）
-                    print(f"配置错误：值不能为空")
-                    return
-                else:
-                    if args.length is not None:
-                        result = generate_from_charset(str(config_value),  args.length, args.length, args.count,
-                                                        args.no_repeat)  # config_value转字符串
-                    else:
-                        result = generate_from_charset(str(config_value), min_length, max_length, args.count, args.no_repeat)  # config_value转字符串
-            else:
-                print(f"错误: 配置 '{config_name}' 的类型无效")
+
+    gen = RandGen(min_length=min_length, max_length=max_length, config=config)
+    if args.job_file:
+        try:
+            jobs = load_job_file(args.job_file)
+        except (ValueError, OSError) as e:
+            print(e)
+            sys.exit(1)
+        failed = 0
+        for result in run_jobs(gen, jobs, args.workers):
+            if 'error' in result:
+                failed += 1
+                print(f"[{result['name']}] 失败: {result['error']}")
+                continue
+            print(f"[{result['name']}] {result['count']:,} 个字符串 -> {result.get('manifest', result['output'])} "
+                  f"({result['seconds']:.2f} 秒)")
+            for hash_algorithm, hash_value in result['digests']:
+                print(f"    {hash_algorithm.upper()}: {hash_value}")
+        if failed:
+            print(f"{failed} 个任务失败")
+            sys.exit(1)
+        return
+    if args.serve:
+        if args.mode and not args.mode.startswith('$'):
+            print("错误: --serve 只能与 $配置 一起使用")
+            return
+        if args.pool_size < 1 or (args.pool_low is not None and not 0 <= args.pool_low <= args.pool_size):
+            print("错误: --pool-size 必须大于 0, --pool-low 必须在 0 到 --pool-size 之间")
+            return
+        names = [args.mode[1:]] if args.mode else None
+        try:
+            serve_pools(gen, args.serve, names, args.pool_size, args.pool_low)
+        except ValueError as e:
+            print(e)
+        return
+    if args.claim is not None and not args.reservoir:
+        print("错误: --claim 需要与 --reservoir 一起使用")
+        return
+    sharded = args.shard_records is not None or args.shard_bytes is not None or args.compress or args.manifest
+    if sharded and not args.output:
+        print("错误: --shard-records, --shard-bytes, --compress 和 --manifest 需要与 -o 一起使用")
+        return
+    checkpointed = args.checkpoint is not None or args.resume
+    if checkpointed:
+        if not args.output or sharded or args.reservoir or args.claim is not None:
+            print("错误: --checkpoint 和 --resume 需要与 -o 一起使用, 且不能与分片输出或 --reservoir 同时使用")
+            return
+        if args.secure:
+            print("错误: --checkpoint 需要可复现的生成, 不能与 --secure 同时使用")
+            return
+        if args.checkpoint is not None and args.checkpoint <= 0:
+            print("错误: --checkpoint 的间隔必须大于 0")
+            return
+        if args.seed is None:
+            try:
+                state = load_checkpoint(args.output) if args.resume else None
+            except ValueError as e:
+                print(e)
                 return
-        else:
-            print(f"错误: 配置 '{config_name}' 不存在")
+            # 种子是随机数状态的全部, 未指定时沿用检查点中的种子或新生成一个
+            args.seed = state['key']['seed'] if state is not None else os.urandom(16).hex()
+    stats = EntropyStats() if args.entropy else None
+    strength = prepared = None
+    try:
+        if args.claim is not None:
+            batches = [claim_tokens(args.reservoir, args.claim)]
+        elif args.reservoir:
+            fill_reservoir(gen, args, args.reservoir)
             return
+        else:
+            prepared = gen.prepare(args)
+            batches = prepared.batches() if prepared is not None else iter(())
+            width = record_width(prepared.source, prepared.case) if prepared is not None else None
+            if args.format == 'raw' and prepared is not None and width is None:
+                raise ValueError("错误: raw 格式要求所有字符串长度相同 (使用 -l 或只含定长片段的表达式)")
+            if args.entropy and prepared is not None:
+                strength = plan_entropy(prepared.source, prepared.case)
+        if sharded:
+            report = write_shards(batches, args.output, args.shard_records, args.shard_bytes, args.compress,
+                                  args.hash_algorithms, args.writers, args.manifest, not args.nv, stats,
+                                  record_format=args.format)
+            print(f"已写入 {len(report['shards'])} 个文件, 共 {report['records']} 个字符串, 清单: {report['manifest']}")
+            digests = []
+        elif checkpointed:
+            digests = []
+            if prepared is not None:
+                digests = write_checkpointed(prepared, args.output, args.hash_algorithms, not args.nv, stats,
+                                             args.checkpoint or CHECKPOINT_INTERVAL, args.resume, args.format)
+        else:
+            size = output_size(width, args.count, args.format) if args.output and prepared is not None else None
+            digests = write_output(batches, args.output, args.hash_algorithms, not args.nv, stats, args.format,
+                                   size)
+    except ValueError as e:
+        print(e)
+        return
 
-    elif args.mode.startswith('[') and args.mode.endswith(']'):
-        result = generate_from_expression(args.mode, min_length, max_length, args)
-    elif args.mode == 'u':
-        result = generate_uuid(args.count)
-    else:  # 单一模式
-        current_min_length = min_length
-        current_max_length = max_length
-
-        if args.length is not None:  # 指定了 -l
-            current_min_length = args.length
-            current_max_length = args.length
-        elif args.random_length:  # 指定了 -r
-            # -r 时不需要特别设置，使用配置文件中的 min_length 和 max_length
-            pass
-        else: #没有指定-r或-l
-            current_min_length = 8
-            current_max_length = 8
-
-        # 不重复字符检查 (只在指定了 -l 时检查)
-        if args.no_repeat and args.length:
-            max_possible_length = 0
-            if args.mode == 'n':
-                max_possible_length = 10
-            elif args.mode == 'a':
-                max_possible_length = 26 if args.lower or args.upper else 52
-            elif args.mode == 'an':
-                max_possible_length = 36 if args.lower or args.upper else 62
-            elif args.mode == 'cc':
-                max_possible_length = len(set(args.input)) if args.input else 0
-
-            if args.length > max_possible_length:
-                raise ValueError(
-                    f"对于模式 '{args.mode}'，使用 '-nr' 时的最大长度为 {max_possible_length}。"
-                )
-
-        # 生成
-        if args.mode == 'n':
-            result = generate_numeric(current_min_length, current_max_length, args.count, args.no_repeat)
-        elif args.mode == 'a':
-            result = generate_alpha(current_min_length, current_max_length, args.count,
-                                     '', args.no_repeat)  # 始终传入空字符串
-        elif args.mode == 'an':
-            result = generate_alphanumeric(current_min_length, current_max_length, args.count,
-                                           '', args.no_repeat) # 始终传入空字符串
-        elif args.mode == 'cc':
-            if not args.input:
-                raise ValueError("cc 模式需要使用 -i 参数指定字符集")
-            result = generate_from_charset(args.input, current_min_length, current_max_length, args.count,
-                                             args.no_repeat)
-    # --- 后处理：应用 -s 和 -S 选项 ---
-    if args.lower:
-        result = [s.lower() for s in result]
-    elif args.upper:
-        result = [s.upper() for s in result]
-
-    # --- 输出和熵值计算 ---
-    if not args.nv:  # 输出到控制台
-        for item in result:
-            if args.entropy:  # 如果使用了 -e 选项
-                entropy = calculate_entropy(item)
-                print(f"{item}   (entropy:{entropy:.2f})")
-            else:
-                print(item)
-
-    if args.output:
-        output_file_path = args.output
-        with open(output_file_path, 'w') as file:
-            # 使用列表推导和 str.join 来避免在最后一行添加换行符
-            file.write("".join(f"{item}\n" for item in result[:-1]))
-            if result:  # 避免写入空文件
-                file.write(result[-1]) #最后一行不加换行符
-        print(f"字符串已导出到: {output_file_path}")
-    else:
-        temp_dir = tempfile.gettempdir()
-        output_file_path = os.path.join(temp_dir, "generated_strings.txt")
-        with open(output_file_path, 'w') as file:
-            file.write("".join(f"{item}\n" for item in result[:-1]))
-            if result:
-                file.write(result[-1])
-
+    if args.output and not sharded:
+        print(f"字符串已导出到: {args.output}")
 
-    if args.hash_algorithms:
+    if digests:
         print("\n" + "-" * 50)
-        for hash_algorithm in args.hash_algorithms:
-            hash_value = generate_hash(output_file_path, hash_algorithm)
+        for hash_algorithm, hash_value in digests:
             print(f"{hash_algorithm.upper()}: {hash_value}")
 
+    report = format_entropy_report(strength, stats, seeded=args.seed is not None) if args.entropy else ""
+    if report:
+        print("\n" + "-" * 50)
+        print(report)
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,512 @@
+import configparser
+import os
+import random
+import string
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import randgen
+
+
+def _run_threads(target, count):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class _YieldingSecureRandom(randgen.SecureRandom):
+    """每次读取缓冲池位置时让出 GIL, 使线程在读和写 _pos 之间切换, 稳定复现无锁时的竞争"""
+
+    @property
+    def _pos(self):
+        time.sleep(0)
+        return self.__dict__['_pos']
+
+    @_pos.setter
+    def _pos(self, value):
+        self.__dict__['_pos'] = value
+
+
+def test_secure_random_threads_no_duplicates_or_short_reads():
+    rng = _YieldingSecureRandom(pool_size=256)
+    width = 16
+    results = [[] for _ in range(4)]
+
+    def draw(i):
+        for _ in range(2000):
+            results[i].append(rng.randbytes(width))
+
+    _run_threads(draw, len(results))
+    values = [value for out in results for value in out]
+    assert all(len(value) == width for value in values)
+    assert len(set(values)) == len(values)
+
+
+
+def _gen():
+    return randgen.RandGen(min_length=1, max_length=64, config=configparser.ConfigParser(interpolation=None))
+
+
+def _compile(mode, rng=None):
+    return _gen().compile(randgen.GenerateOptions(mode), rng or randgen.get_secure_random())
+
+
+def test_token_pool_concurrent_take_and_refill_unique():
+    rng = _YieldingSecureRandom(pool_size=256)
+    pool = randgen.TokenPool('t', _compile('[an(24)]'), size=200, low_water=150, rng=rng).start()
+    taken = [[] for _ in range(4)]
+
+    def take(i):
+        for _ in range(100):
+            taken[i].extend(pool.take(7))
+
+    try:
+        _run_threads(take, len(taken))
+    finally:
+        pool.stop()
+    tokens = [token for out in taken for token in out]
+    assert len(tokens) == 4 * 100 * 7
+    assert all(len(token) == 24 for token in tokens)
+    assert len(set(tokens)) == len(tokens)
+
+
+def test_async_token_pool_concurrent_takes_unique():
+    import asyncio
+
+    async def run():
+        agen = randgen.AsyncRandGen(_gen())
+        async with await agen.pool('[an(24)]', size=100, low_water=80) as pool:
+            # 大部分请求超过池深度, 在 executor 线程中与补充线程并发生成
+            batches = await asyncio.gather(*(pool.take(n) for n in [3, 150, 5, 200, 1, 120] * 10))
+        return [token for batch in batches for token in batch]
+
+    tokens = asyncio.run(run())
+    assert len(tokens) == sum([3, 150, 5, 200, 1, 120]) * 10
+    assert all(len(token) == 24 for token in tokens)
+    assert len(set(tokens)) == len(tokens)
+
+
+def test_unique_start_beyond_keyspace_rejected():
+    gen = _gen()
+    with pytest.raises(ValueError):
+        gen.generate('[n(4)]', count=100, unique=True, seed='a', start=9990)
+    with pytest.raises(ValueError):
+        gen.generate('[n(4)]', count=1, seed='a', start=-1)
+    shards = [gen.generate('[n(4)]', count=100, unique=True, seed='a', start=start) for start in (9800, 9900)]
+    tokens = shards[0] + shards[1]
+    assert len(set(tokens)) == len(tokens) == 200
+
+
+class _RecordingRandom(random.Random):
+    """记录每次 randbytes 请求的字节数"""
+
+    def __init__(self, seed):
+        super().__init__(seed)
+        self.requests = []
+
+    def randbytes(self, n):
+        self.requests.append(n)
+        return super().randbytes(n)
+
+
+def test_index_sampler_draws_in_bounded_chunks():
+    rng = _RecordingRandom(1)
+    indices = randgen.CharsetSampler(string.digits).draw(5 * randgen.RANDOM_CHUNK_SIZE, rng)
+    assert len(indices) == 5 * randgen.RANDOM_CHUNK_SIZE
+    assert max(rng.requests) <= randgen.RANDOM_CHUNK_SIZE
+
+
+def test_uniform_length_wider_than_two_bytes():
+    lengths = randgen.UniformLength(1, 70000).sample(2000, random.Random(1))
+    assert len(lengths) == 2000
+    assert all(1 <= length <= 70000 for length in lengths)
+    assert max(lengths) > 65536
+
+
+def test_alias_table_with_more_than_65536_weights():
+    weights = [0] * 70000
+    weights[66000] = weights[69999] = 1
+    indices = randgen.AliasTable(weights).sample_indices(1000, random.Random(1))
+    assert len(indices) == 1000
+    assert set(int(i) for i in indices) == {66000, 69999}
+    text = randgen.WeightedSampler("".join(chr(0x4e00 + i) for i in range(70000)), weights).draw(50, random.Random(2))
+    assert len(text) == 50 and set(text) <= {chr(0x4e00 + 66000), chr(0x4e00 + 69999)}
+
+
+def test_library_config_read_does_not_write_cache(tmp_path):
+    path = tmp_path / 'RandGen.ini'
+    path.write_text("[Settings]\nmin_length = 2\nmax_length = 8\n\n[pin]\ntype = re\nvalue = [n(4)]\n")
+    gen = randgen.RandGen(config_path=str(path))
+    assert len(gen.generate("$pin", count=3)) == 3
+    assert sorted(os.listdir(tmp_path)) == ['RandGen.ini']
+    config = randgen._read_config(str(path), write_cache=True)
+    assert (tmp_path / 'RandGen.ini.cache').exists()
+    cached = randgen._read_config(str(path))
+    assert randgen._config_sections(cached) == randgen._config_sections(config)
+    assert cached['pin']['value'] == '[n(4)]'
+
+
+def test_async_pool_context_manager_starts_one_refill_thread():
+    import asyncio
+
+    async def run():
+        agen = randgen.AsyncRandGen(_gen())
+        pool = await agen.pool('[n(8)]', size=50)
+        thread = pool.pool._thread
+        async with pool:
+            assert pool.pool._thread is thread
+            await pool.take(60)
+        return thread
+
+    thread = asyncio.run(run())
+    assert not thread.is_alive()
+
+
+def test_job_file_coerces_and_checks_field_types(tmp_path):
+    import json
+    path = tmp_path / 'jobs.json'
+    path.write_text(json.dumps({'defaults': {'count': '5'}, 'jobs': [
+        {'name': 'a', 'mode': 'n', 'length': '6', 'unique': 'true', 'output': str(tmp_path / 'a.txt')},
+        {'name': 'b', 'mode': 'n', 'length': 4, 'shard_bytes': '1K', 'output': str(tmp_path / 'b.txt')},
+    ]}))
+    jobs = randgen.load_job_file(str(path))
+    assert (jobs[0]['count'], jobs[0]['length'], jobs[0]['unique']) == (5, 6, True)
+    assert jobs[1]['shard_bytes'] == 1024
+    results = {result['name']: result for result in randgen.run_jobs(_gen(), jobs, workers=1)}
+    assert 'error' not in results['a'] and results['a']['count'] == 5
+    assert (tmp_path / 'a.txt').read_text().split() and len((tmp_path / 'a.txt').read_text().split()) == 5
+
+    path.write_text(json.dumps([{'name': 'bad', 'mode': 'n', 'count': 'many', 'output': 'x.txt'}]))
+    with pytest.raises(ValueError, match="bad"):
+        randgen.load_job_file(str(path))
+
+
+def test_run_job_reports_unexpected_errors_per_job(tmp_path):
+    job = {'name': 'broken', 'mode': 'n', 'length': 6, 'count': 3, 'hash': 7, 'output': str(tmp_path / 'x.txt')}
+    result = randgen.run_job(_gen(), job)
+    assert result['name'] == 'broken' and 'error' in result
+
+
+def test_bench_result_does_not_wait_for_crashed_child():
+    import multiprocessing
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=os._exit, args=(3,))
+    process.start()
+    started = time.perf_counter()
+    assert randgen._bench_result(process, queue) is None
+    process.join()
+    assert process.exitcode == 3
+    assert time.perf_counter() - started < 10 * randgen.BENCH_POLL_SECONDS
+
+
+@pytest.mark.parametrize('mode', ["[n(6)]", "[an(12),'-',a(3)]", "['X',cc(3;ab),u]", "[n(4;nr),'-',n(2)]", "['id']"])
+def test_unique_plan_batches_match_per_item_decode(mode):
+    plan = _compile(mode)
+    unique, seen = randgen.compile_unique(plan, 1, rng=random.Random(3))
+    assert seen is None
+    decode, permute = unique.enumerator.decode, unique.permutation.permute
+    count = min(unique.enumerator.size, 3000)
+    expected = [decode(permute(i)) for i in range(count)]
+    # 分多批生成, 较大的键空间中途越过建表阈值
+    bounds = [0, count // 100, count // 2, count]
+    batches = [unique.generate(end - start, start=start) for start, end in zip(bounds, bounds[1:])]
+    assert [item for batch in batches for item in batch] == expected
+
+
+def test_unique_plan_pickles_for_parallel_jobs():
+    import pickle
+    unique, _ = randgen.compile_unique(_compile("[an(6)]"), 1, rng=random.Random(4))
+    unique.generate(10)  # 建立哈希对象之后仍然可以传给子进程
+    clone = pickle.loads(pickle.dumps(unique))
+    assert clone.generate(50, start=7) == unique.generate(50, start=7)
+    tokens = _gen().generate("[an(6)]", count=3000, unique=True, jobs=2)
+    assert len(tokens) == 3000 and len(set(tokens)) == 3000
+
+
+@pytest.mark.parametrize('record_format, batches, expected', [
+    ('lines', [['ab', 'c"d'], ['e,f']], 'ab{0}c"d{0}e,f'.format(os.linesep).encode()),
+    ('nul', [['ab', 'c"d'], ['e,f']], b'ab\0c"d\0e,f\0'),
+    ('jsonl', [['ab', 'c"d'], ['e,f']], b'"ab"\n"c\\"d"\n"e,f"\n'),
+    ('csv', [['ab', 'c"d'], ['e,f', 'g\nh']], b'0,ab\n1,"c""d"\n2,"e,f"\n3,"g\nh"\n'),
+    ('raw', [['ab', 'cd'], ['ef']], b'abcdef'),
+])
+def test_record_formats_exact_bytes(tmp_path, record_format, batches, expected):
+    path = tmp_path / 'out'
+    digests = randgen.write_output(iter(batches), str(path), ['sha256'], echo=False, record_format=record_format)
+    assert path.read_bytes() == expected
+    import hashlib
+    assert digests == [('sha256', hashlib.sha256(expected).hexdigest())]
+
+
+def test_preallocated_output_size_and_special_files(tmp_path):
+    plan = _compile('[an(8)]')
+    width = randgen.record_width(plan)
+    assert width == 8
+    size = randgen.output_size(width, 100, 'nul')
+    path = tmp_path / 'out'
+    randgen.write_output(iter([plan.generate(60), plan.generate(40)]), str(path), echo=False, record_format='nul',
+                         size=size)
+    assert path.stat().st_size == size == 900
+    # /dev/null 等不是普通文件, 不能预分配或截断
+    randgen.write_output(iter([plan.generate(10)]), os.devnull, echo=False, size=randgen.output_size(width, 10))
+
+
+def test_write_output_keeps_original_exception_and_trims_preallocation(tmp_path):
+    def failing():
+        yield ['abcd'] * 10
+        raise RuntimeError('boom')
+
+    path = tmp_path / 'out'
+    with pytest.raises(RuntimeError, match='boom'):
+        randgen.write_output(failing(), str(path), echo=False, record_format='raw', size=4 * 1000)
+    assert path.read_bytes() == b'abcd' * 10
+
+
+def test_uuid7_rejects_jobs_and_seed():
+    with pytest.raises(ValueError, match='-j'):
+        _gen().generate('u7', count=5, jobs=2)
+    with pytest.raises(ValueError, match='--seed'):
+        _gen().generate("['id-',u7]", count=5, seed='s')
+
+
+def test_uuid7_generator_shared_across_threads_stays_unique_and_ordered():
+    generator = randgen.UUID7Generator()
+    batches = []
+
+    def worker(_):
+        for _ in range(100):
+            batches.append(generator.generate(50))
+
+    _run_threads(worker, 4)
+    tokens = [token for batch in batches for token in batch]
+    assert len(set(tokens)) == len(tokens) == 4 * 100 * 50
+    assert all(batch == sorted(batch) for batch in batches)
+
+
+def test_reservoir_claims_survive_reopen(tmp_path, monkeypatch):
+    path = str(tmp_path / 'tokens.rsv')
+    tokens = ['tok%03d' % i for i in range(100)]
+    with randgen.TokenReservoir(path, width=8) as reservoir:
+        assert reservoir.append([tokens[:60], tokens[60:]]) == 100
+    synced = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(randgen.os, 'fsync', lambda fd: (synced.append(fd), real_fsync(fd)))
+    with randgen.TokenReservoir(path) as reservoir:
+        first = reservoir.claim(30)
+        assert synced  # 游标在交出令牌之前已经落盘
+    with randgen.TokenReservoir(path) as reservoir:
+        second = reservoir.claim(100)
+        assert reservoir.stats() == (100, 100)
+        assert reservoir.claim(1) == []
+    assert first + second == tokens
+
+
+@pytest.mark.parametrize('pattern', [
+    r'(INV|PO)-[0-9A-F]{8}(-\d{2})?', r'^[a-z]{2,5}\.\w+\s\S$', r'(ab|c){2,4}x?', r'[^0-9]{3}\D\W', r'[一-龥]{2}一\x41',
+])
+def test_regex_mode_output_fullmatches(pattern):
+    import re
+    tokens = _gen().generate('/' + pattern + '/', count=500)
+    assert len(tokens) == 500
+    compiled = re.compile(pattern)
+    assert all(compiled.fullmatch(token) for token in tokens)
+
+
+def test_regex_config_values_are_cached_parsed(tmp_path, monkeypatch):
+    import re
+    path = tmp_path / 'RandGen.ini'
+    path.write_text("[Settings]\nmin_length = 1\nmax_length = 8\n\n[order]\ntype = re\nvalue = /ORD-\\d{6}/\n")
+    randgen._read_config(str(path), write_cache=True)
+    randgen._regex_cache.clear()
+
+    def no_parse(self):
+        raise AssertionError("正则应当来自配置缓存")
+
+    monkeypatch.setattr(randgen._RegexParser, 'parse', no_parse)
+    gen = randgen.RandGen(config_path=str(path))
+    assert all(re.fullmatch(r'ORD-\d{6}', token) for token in gen.generate('$order', count=20))
+
+
+class _CountingRandom(random.Random):
+    """记录 getrandbits 的调用次数 (randint 和 randbytes 都经由它取随机数)"""
+
+    calls = 0
+
+    def getrandbits(self, k):
+        self.calls += 1
+        return super().getrandbits(k)
+
+
+def test_random_lengths_are_drawn_in_bulk_from_the_given_rng():
+    rng = _CountingRandom(1)
+    state = random.getstate()
+    items = randgen.PlanPart('chars', string.ascii_letters, 3, 40).column(5000, rng)
+    assert sorted({len(item) for item in items}) == list(range(3, 41))
+    assert rng.calls < 20
+    batches = list(randgen.iter_from_charset('abc', 1, 30, 100, rng=random.Random(2), batch_size=40))
+    again = list(randgen.iter_from_charset('abc', 1, 30, 100, rng=random.Random(2), batch_size=40))
+    assert batches == again and [len(batch) for batch in batches] == [40, 40, 20]
+    assert random.getstate() == state
+
+
+def _exclusion_gen(tmp_path):
+    config = configparser.ConfigParser(interpolation=None)
+    return randgen.RandGen(str(tmp_path / 'RandGen.ini'), min_length=1, max_length=64, config=config)
+
+
+@pytest.mark.parametrize('unique', [False, True])
+def test_excluded_values_never_appear(tmp_path, unique):
+    issued = tmp_path / 'issued.txt'
+    excluded = {f"{i:02d}" for i in range(100) if i % 5}
+    issued.write_text("\n".join(sorted(excluded)) + "\n")
+    gen = _exclusion_gen(tmp_path)
+    count = 20 if unique else 500
+    tokens = gen.generate('[n(2)]', count=count, unique=unique, exclude=[str(issued)])
+    assert len(tokens) == count and not excluded & set(tokens)
+    if unique:
+        assert sorted(tokens) == [f"{i:02d}" for i in range(0, 100, 5)]
+    assert os.listdir(tmp_path / randgen.EXCLUDE_INDEX_DIR)
+
+
+def test_exclusion_index_rebuilt_after_source_changes(tmp_path):
+    issued = tmp_path / 'issued.txt'
+    issued.write_text("aa\nbb\n")
+    index = randgen.open_exclusion_index(str(issued), str(tmp_path))
+    assert 'aa' in index and 'cc' not in index and len(index) == 2
+    index.close()
+    issued.write_text("cc\n")
+    index = randgen.open_exclusion_index(str(issued), str(tmp_path))
+    assert 'cc' in index and 'aa' not in index and len(index) == 1
+    index.close()
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_shard_digests_match_manifest(tmp_path, compression):
+    import gzip
+    import hashlib
+    import json
+    items = [f"{i:04d}" for i in range(250)]
+    report = randgen.write_shards([items[:120], items[120:]], str(tmp_path / 'out.txt'), shard_records=100,
+                                  compression=compression, hash_algorithms=['sha256', 'md5'], encoding='utf-8')
+    with open(report['manifest'], encoding='utf-8') as file:
+        manifest = json.load(file)
+    assert manifest['records'] == 250 and [entry['records'] for entry in manifest['shards']] == [100, 100, 50]
+    records = []
+    for entry in manifest['shards']:
+        data = (tmp_path / entry['file']).read_bytes()
+        assert entry['bytes'] == len(data)
+        assert entry['sha256'] == hashlib.sha256(data).hexdigest()
+        assert entry['md5'] == hashlib.md5(data).hexdigest()
+        if compression:
+            data = gzip.decompress(data)
+        assert entry['size'] == len(data)
+        records.extend(data.decode('utf-8').split("\n"))
+    assert records == items
+
+
+def test_plan_entropy_is_per_part_sum():
+    import math
+    total, parts = randgen.plan_entropy(_compile('[n(6)]-[a(2)]'))
+    assert [bits for _, bits in parts] == pytest.approx([6 * math.log2(10), 0.0, 2 * math.log2(52)])
+    assert total == pytest.approx(sum(bits for _, bits in parts))
+    assert randgen.plan_entropy(_compile('u'))[0] == 122
+
+
+def test_entropy_stats_report():
+    stats = randgen.EntropyStats()
+    stats.update(['aabb', 'abcd'])
+    stats.update([])
+    report = stats.report()
+    assert (report['strings'], report['characters'], report['alphabet']) == (2, 8, 4)
+    assert report['uniform_entropy'] == 2.0
+    assert (report['min_string_entropy'], report['mean_string_entropy']) == (1.0, 1.5)
+    assert report['chi_square'] == 2.0 and report['degrees_of_freedom'] == 3
+    assert 0.5 < report['p_value'] < 0.65
+    text = randgen.format_entropy_report(randgen.plan_entropy(_compile('[n(6)]-[a(2)]')), stats, seeded=True)
+    assert "每个字符串 31.33 比特" in text and "--seed" in text and "2 个字符串, 8 个字符, 4 种字符" in text
+
+
+def test_cli_entropy_report(tmp_path):
+    import subprocess
+    script = os.path.join(os.path.dirname(__file__), os.pardir, 'randgen.py')
+    result = subprocess.run([sys.executable, script, '-m', '[n(6)]', '-c', '200', '-e', '-nv', '-o', 'out.txt'],
+                            cwd=tmp_path, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert "理论强度: 每个字符串 19.93 比特" in result.stdout
+    assert "统计: 200 个字符串, 1,200 个字符" in result.stdout
+    assert len((tmp_path / 'out.txt').read_text().split("\n")) == 200
+
+
+@pytest.mark.parametrize('unique, record_format', [(False, 'lines'), (True, 'jsonl')])
+def test_resumed_checkpoint_is_byte_identical(tmp_path, monkeypatch, unique, record_format):
+    def prepare():
+        options = randgen.GenerateOptions('[an(8)]', count=30000, seed='s', unique=unique)
+        return _gen().prepare(options)
+
+    full = str(tmp_path / 'full.txt')
+    expected = randgen.write_checkpointed(prepare(), full, ['sha256'], echo=False, record_format=record_format)
+    calls = []
+
+    def interrupt(batch):
+        calls.append(len(batch))
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(randgen, 'print_batch', interrupt)
+    output = str(tmp_path / 'out.txt')
+    with pytest.raises(KeyboardInterrupt):
+        randgen.write_checkpointed(prepare(), output, ['sha256'], interval=0, record_format=record_format)
+    state = randgen.load_checkpoint(output)
+    assert not state['complete'] and state['records'] == sum(calls[:2])
+    with open(output, 'ab') as file:
+        file.write(b'partial record written after the last checkpoint')
+    monkeypatch.undo()
+
+    digests = randgen.write_checkpointed(prepare(), output, ['sha256'], echo=False, resume=True,
+                                         record_format=record_format)
+    with open(full, 'rb') as file:
+        data = file.read()
+    with open(output, 'rb') as file:
+        assert file.read() == data
+    assert digests == expected and randgen.load_checkpoint(output)['complete']
+    assert randgen.write_checkpointed(prepare(), output, ['sha256'], echo=False, resume=True,
+                                      record_format=record_format) == expected
+
+
+def test_config_cache_rebuilt_after_ini_edit(tmp_path):
+    import hashlib
+    path = tmp_path / 'RandGen.ini'
+    path.write_text("[Settings]\nmin_length = 2\nmax_length = 8\n\n[pin]\ntype = re\nvalue = [n(4)]\n")
+    randgen._read_config(str(path), write_cache=True)
+    before = randgen._load_config_cache(str(path))
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))  # 只 touch, 内容不变
+    randgen._read_config(str(path), write_cache=True)
+    touched = randgen._load_config_cache(str(path))
+    assert touched['hash'] == before['hash'] and touched['mtime_ns'] == stat.st_mtime_ns + 10 ** 9
+
+    path.write_text(path.read_text().replace('[n(4)]', '[a(4)]'))  # 大小不变
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10 ** 9))
+    gen = randgen.RandGen(config_path=str(path))
+    assert all(token.isalpha() for token in gen.generate('$pin', count=20))
+    assert randgen._load_config_cache(str(path))['hash'] == before['hash']  # 库的读取不写缓存
+    config = randgen._read_config(str(path), write_cache=True)
+    assert config['pin']['value'] == '[a(4)]'
+    rebuilt = randgen._load_config_cache(str(path))
+    assert rebuilt['hash'] == hashlib.blake2b(path.read_bytes(), digest_size=16).hexdigest() != before['hash']
+
+    with randgen.edit_config(str(path)) as config:
+        config['pin']['value'] = '[an(6)]'
+    cache = randgen._load_config_cache(str(path))
+    assert cache['hash'] == hashlib.blake2b(path.read_bytes(), digest_size=16).hexdigest()
+    assert (cache['mtime_ns'], cache['size']) == (os.stat(path).st_mtime_ns, os.stat(path).st_size)
+    assert randgen._read_config(str(path))['pin']['value'] == '[an(6)]'